@@ -1,13 +1,20 @@
 from flask import Flask, g
 from flask_cors import CORS
 
-from lib.db import Db
+from lib.db import Db, DEFAULT_SHARD_PATH, shard_paths
+from lib import users
+from lib.cache import ResponseCache
+from lib.events import EventBroker
+from lib.vocabulary import VocabularyIndex
+from lib.profiling import Profiler
+from lib.maintenance import MaintenanceScheduler
 
 import routes.words
 import routes.groups
 import routes.study_sessions
 import routes.dashboard
 import routes.study_activities
+import routes.export
 
 def get_allowed_origins(app):
     try:
@@ -33,13 +40,70 @@ def create_app(test_config=None):
     
     if test_config is None:
         app.config.from_mapping(
-            DATABASE='words.db'
+            DATABASE='words.db',
+            DATABASE_POOL_SIZE=8,
+            DATABASE_SHARDS=0,  # spread users over this many shard files, 0 keeps everyone in DATABASE
+            DATABASE_SHARD_PATH=DEFAULT_SHARD_PATH,
+            CACHE_BACKEND='memory',  # or 'sqlite' to share the cache between workers
+            CACHE_PATH='cache.db',
+            CACHE_TTL=300,
+            VOCABULARY_INDEX=False,  # serve the word listings from memory (needs CACHE_BACKEND='sqlite'), see lib/vocabulary.py
+            VOCABULARY_INDEX_USERS=64,  # users whose review counts are kept loaded
+            METRICS_ENABLED=True,  # request/SQL timings and GET /metrics
+            SLOW_QUERY_MS=100,  # statements at least this slow are logged
+            MAINTENANCE_INTERVAL=0,  # seconds between background maintenance runs, 0 is off
+            MAINTENANCE_ARCHIVE_DAYS=365  # reviews older than this are archived
         )
     else:
         app.config.update(test_config)
     
+    # Profiling hooks, installed on the pooled connections below
+    app.profiler = None
+    if app.config.get('METRICS_ENABLED', True):
+        app.profiler = Profiler(slow_query_ms=app.config.get('SLOW_QUERY_MS', 100))
+        app.profiler.init_app(app)
+
     # Initialize database first since we need it for CORS configuration
-    app.db = Db(database=app.config['DATABASE'])
+    app.db = Db(
+        database=app.config['DATABASE'],
+        pool_size=app.config.get('DATABASE_POOL_SIZE', 8),
+        profiler=app.profiler,
+        shards=app.config.get('DATABASE_SHARDS', 0),
+        shard_path=app.config.get('DATABASE_SHARD_PATH', DEFAULT_SHARD_PATH)
+    )
+
+    # g.user_id from the X-User-Id header, which picks the user's shard
+    users.init_app(app)
+    
+    # Response cache for read endpoints, invalidated by the write routes
+    app.cache = ResponseCache.from_config(app.config)
+
+    # In-memory words for the listings, loaded now and kept in step with the
+    # cache tags. Those have to be shared with the other workers and the
+    # invoke tasks, or writes made there are never seen.
+    app.vocabulary = None
+    if app.config.get('VOCABULARY_INDEX'):
+        if app.config.get('CACHE_BACKEND', 'memory') != 'sqlite':
+            raise ValueError("VOCABULARY_INDEX needs CACHE_BACKEND = 'sqlite'")
+        app.vocabulary = VocabularyIndex(
+            app.config['DATABASE'],
+            app.db,
+            app.cache,
+            max_users=app.config.get('VOCABULARY_INDEX_USERS', 64)
+        )
+
+    # Live session events, published by the review routes (see lib/events.py)
+    app.events = EventBroker()
+
+    # Archive, ANALYZE and vacuum in the background (see lib/maintenance.py)
+    if app.config.get('MAINTENANCE_INTERVAL'):
+        app.maintenance = MaintenanceScheduler(
+            app.config['DATABASE'],
+            interval=app.config['MAINTENANCE_INTERVAL'],
+            archive_days=app.config.get('MAINTENANCE_ARCHIVE_DAYS', 365),
+            shards=shard_paths(app.db.shard_path, app.db.shards)
+        )
+        app.maintenance.start()
     
     # Get allowed origins from study_activities table
     allowed_origins = get_allowed_origins(app)
@@ -53,11 +117,11 @@ def create_app(test_config=None):
         r"/*": {
             "origins": allowed_origins,
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"]
+            "allow_headers": ["Content-Type", "Authorization", users.USER_HEADER, routes.study_sessions.IDEMPOTENCY_HEADER]
         }
     })
 
-    # Close database connection
+    # Return pooled database connections
     @app.teardown_appcontext
     def close_db(exception):
         app.db.close()
@@ -68,6 +132,7 @@ def create_app(test_config=None):
     routes.study_sessions.load(app)
     routes.dashboard.load(app)
     routes.study_activities.load(app)
+    routes.export.load(app)
     
     return app
 
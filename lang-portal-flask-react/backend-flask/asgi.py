@@ -0,0 +1,92 @@
+import asyncio
+import contextlib
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+
+from lib.async_db import AsyncDb
+from lib.cache import invalidate_shared
+from lib.db import DEFAULT_SHARD_PATH
+from lib.events import EventBroker
+from lib.users import USER_HEADER
+from routes_async.common import UserMiddleware
+from routes.study_sessions import IDEMPOTENCY_HEADER
+
+import routes_async.words
+import routes_async.groups
+import routes_async.study_sessions
+import routes_async.dashboard
+import routes_async.study_activities
+
+# ASGI variant of app.py serving the same endpoints (minus the exports) from
+# async handlers, for many concurrent dashboard / polling clients per process:
+#
+#   uvicorn asgi:app --port 5000
+#
+# The SQL is shared with the Flask routes through lib/queries.py.
+
+def create_app(test_config=None):
+  config = {
+    'DATABASE': 'words.db',
+    'DATABASE_POOL_SIZE': 8,
+    'DATABASE_POOL_TIMEOUT': 10,
+    'DATABASE_SHARDS': 0,  # see app.py
+    'DATABASE_SHARD_PATH': DEFAULT_SHARD_PATH,
+    'CACHE_PATH': 'cache.db'  # shared Flask response cache to invalidate on writes
+  }
+  if test_config is not None:
+    config.update(test_config)
+
+  db = AsyncDb(
+    database=config['DATABASE'],
+    pool_size=config['DATABASE_POOL_SIZE'],
+    pool_timeout=config['DATABASE_POOL_TIMEOUT'],
+    shards=config['DATABASE_SHARDS'],
+    shard_path=config['DATABASE_SHARD_PATH']
+  )
+
+  # Close the pooled connections on shutdown
+  @contextlib.asynccontextmanager
+  async def lifespan(app):
+    yield
+    await db.dispose()
+
+  app = Starlette(
+    lifespan=lifespan,
+    middleware=[
+      # Same as the Flask app, which ends up allowing every origin
+      Middleware(
+        CORSMiddleware,
+        allow_origins=['*'],
+        allow_methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
+        allow_headers=['Content-Type', 'Authorization', USER_HEADER, IDEMPOTENCY_HEADER]
+      ),
+      # request.state.user_id from the X-User-Id header, see lib/users.py
+      Middleware(UserMiddleware)
+    ]
+  )
+  app.state.config = config
+  app.state.db = db
+  app.state.events = EventBroker()  # live session events, see lib/events.py
+
+  # Writes here must also invalidate the Flask response cache when both apps
+  # run side by side with CACHE_BACKEND='sqlite'
+  async def invalidate_cache(*tags):
+    await asyncio.to_thread(invalidate_shared, config['CACHE_PATH'], *tags)
+  app.state.invalidate_cache = invalidate_cache
+
+  # load routes -----------
+  routes_async.words.load(app)
+  routes_async.groups.load(app)
+  routes_async.study_sessions.load(app)
+  routes_async.dashboard.load(app)
+  routes_async.study_activities.load(app)
+
+  return app
+
+app = create_app()
+
+if __name__ == '__main__':
+  import uvicorn
+  uvicorn.run(app, port=5000)
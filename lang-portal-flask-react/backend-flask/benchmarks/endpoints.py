@@ -0,0 +1,421 @@
+# Latency and throughput of every read endpoint (and review logging) on a
+# synthetic database, through the Flask test client and a real WSGI server
+# at several concurrency levels. Reports p50/p95/p99 per endpoint and writes
+# the results as JSON, to compare against an earlier run.
+#
+# Run from the backend-flask directory:
+#   python benchmarks/endpoints.py --words 100000 --reviews 1000000 --sessions 10000 \
+#     --database /tmp/bench.db --output results.json --compare baseline.json
+#
+# Building the database takes a while at that scale, --database keeps it
+# around so later runs reuse it (the same arguments and --seed always
+# produce the same data). --server-url benchmarks an already running server
+# (e.g. gunicorn) instead of the built in one.
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from lib import queries
+from lib.db import Db
+from lib.importer import import_words
+from lib.users import DEFAULT_USER_ID
+from migrate import run_migrations
+from routes.study_sessions import record_reviews
+
+# (name, method, url template), ids are filled in from the database
+ENDPOINTS = [
+  ('words', 'GET', '/words'),
+  ('words sorted by correct_count', 'GET', '/words?sort_by=correct_count&order=desc'),
+  ('words cursor', 'GET', '/words?cursor='),
+  ('word', 'GET', '/words/{word_id}'),
+  ('search', 'GET', '/api/words/search?q=tango12'),
+  ('search prefix', 'GET', '/api/words/search?q=ta'),
+  ('search fuzzy', 'GET', '/api/words/search?q=tangx12'),
+  ('groups', 'GET', '/groups'),
+  ('group', 'GET', '/groups/{group_id}'),
+  ('group words', 'GET', '/groups/{group_id}/words'),
+  ('group words raw', 'GET', '/api/groups/{group_id}/words/raw'),
+  ('group due', 'GET', '/api/groups/{group_id}/due'),
+  ('group sessions', 'GET', '/groups/{group_id}/study_sessions'),
+  ('study sessions', 'GET', '/api/study-sessions'),
+  ('study sessions cursor', 'GET', '/api/study-sessions?cursor='),
+  ('study session', 'GET', '/api/study-sessions/{session_id}'),
+  ('study activities', 'GET', '/api/study-activities'),
+  ('activity sessions', 'GET', '/api/study-activities/{activity_id}/sessions'),
+  ('activity launch', 'GET', '/api/study-activities/{activity_id}/launch'),
+  ('recent session', 'GET', '/dashboard/recent-session'),
+  ('dashboard stats', 'GET', '/dashboard/stats'),
+  ('log review', 'POST', '/study_sessions/{session_id}/review'),
+]
+
+# Sessions are spread over this many days before now
+HISTORY_DAYS = 365
+
+def build_database(path, word_count, group_count, session_count, review_count, seed):
+  started = time.perf_counter()
+  db = Db(database=path)
+  db.init(Flask(__name__))
+  db.dispose()
+  run_migrations(path)
+
+  connection = sqlite3.connect(path)
+  connection.row_factory = sqlite3.Row
+  random_ = random.Random(seed)
+
+  # Words are split evenly over the groups, one import per group
+  per_group = -(-word_count // group_count)
+  for group in range(group_count):
+    words_path = path + '.jsonl'
+    with open(words_path, 'w', encoding='utf-8') as f:
+      for i in range(group * per_group, min((group + 1) * per_group, word_count)):
+        f.write(json.dumps({
+          'kanji': f'単語{i}',
+          'romaji': f'tango{i}',
+          'english': f'word {i}',
+          'parts': [{'kanji': '単', 'romaji': ['ta', 'n']}, {'kanji': '語', 'romaji': ['go']}]
+        }) + '\n')
+    import_words(connection, words_path, group_names=[f'Benchmark {group + 1}'])
+    os.remove(words_path)
+
+  cursor = connection.cursor()
+  group_words = {}
+  for row in cursor.execute('SELECT group_id, word_id FROM word_groups'):
+    group_words.setdefault(row['group_id'], []).append(row['word_id'])
+  group_ids = sorted(group_words)
+  activity_ids = [row[0] for row in cursor.execute('SELECT id FROM study_activities')]
+
+  # Sessions over the last year, each with its share of the reviews logged
+  # through the same code path as POST /study_sessions/:id/reviews, all of
+  # them the default user's (the one requests without X-User-Id act as)
+  now = datetime.now()
+  for index in range(session_count):
+    group_id = random_.choice(group_ids)
+    created_at = now - timedelta(seconds=random_.randrange(HISTORY_DAYS * 86400))
+    cursor.execute(queries.INSERT_SESSION, (DEFAULT_USER_ID, group_id, random_.choice(activity_ids), created_at))
+    session_id = cursor.lastrowid
+    reviews = []
+    for review in range(review_count // session_count + (index < review_count % session_count)):
+      reviews.append((
+        random_.choice(group_words[group_id]),
+        random_.random() < 0.7,
+        created_at + timedelta(seconds=5 * review),
+        None
+      ))
+    record_reviews(cursor, DEFAULT_USER_ID, session_id, reviews)
+    if index % 100 == 99:
+      connection.commit()
+  connection.commit()
+  cursor.execute('ANALYZE')
+  connection.close()
+  return time.perf_counter() - started
+
+def database_scale(path):
+  connection = sqlite3.connect(path)
+  try:
+    return {
+      table: connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+      for table in ('words', 'groups', 'study_sessions', 'word_review_items')
+    }
+  finally:
+    connection.close()
+
+# Ids to plug into the url templates: the group with the most sessions
+# (build_database puts sessions in random groups, so the largest group may
+# have none), its newest session and a word of the group
+def sample_ids(path):
+  connection = sqlite3.connect(path)
+  try:
+    row = connection.execute('''
+      SELECT s.group_id, COUNT(*) AS sessions
+      FROM study_sessions s
+      JOIN groups g ON g.id = s.group_id
+      WHERE g.words_count > 0
+      GROUP BY s.group_id
+      ORDER BY sessions DESC, MAX(g.words_count) DESC
+      LIMIT 1
+    ''').fetchone()
+    if row is None:
+      raise SystemExit('the benchmark database needs a study session in a group with words')
+    group_id = row[0]
+    word_id = connection.execute('SELECT word_id FROM word_groups WHERE group_id = ? LIMIT 1', (group_id,)).fetchone()[0]
+    session_id, activity_id = connection.execute('''
+      SELECT id, study_activity_id FROM study_sessions
+      WHERE group_id = ? ORDER BY created_at DESC LIMIT 1
+    ''', (group_id,)).fetchone()
+  finally:
+    connection.close()
+  return {'word_id': word_id, 'group_id': group_id, 'session_id': session_id, 'activity_id': activity_id}
+
+def request_body(method, ids):
+  if method == 'POST':
+    return {'word_id': ids['word_id'], 'correct': True}
+  return None
+
+# Clients return (status, seconds) for one request. A client is only used
+# by one thread at a time.
+class TestClient:
+  def __init__(self, app):
+    self.client = app.test_client()
+
+  def request(self, method, url, body):
+    started = time.perf_counter()
+    response = self.client.open(url, method=method, json=body)
+    response.get_data()
+    response.close()
+    return response.status_code, time.perf_counter() - started
+
+class HttpClient:
+  def __init__(self, base_url):
+    parsed = urllib.parse.urlsplit(base_url)
+    self.host = parsed.hostname
+    self.port = parsed.port or 80
+    self.connection = None
+
+  def request(self, method, url, body):
+    started = time.perf_counter()
+    headers = {}
+    payload = None
+    if body is not None:
+      payload = json.dumps(body)
+      headers['Content-Type'] = 'application/json'
+    # Keep-alive connection, reopened when the server closed it
+    for attempt in range(2):
+      if self.connection is None:
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+      try:
+        self.connection.request(method, url, body=payload, headers=headers)
+        response = self.connection.getresponse()
+        response.read()
+        if response.will_close:
+          self.connection.close()
+          self.connection = None
+        return response.status, time.perf_counter() - started
+      except (http.client.HTTPException, ConnectionError):
+        self.connection.close()
+        self.connection = None
+        if attempt:
+          raise
+
+def percentile(sorted_values, fraction):
+  # Nearest rank
+  index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+  return sorted_values[index]
+
+def run_endpoint(clients, method, url, body, request_count):
+  concurrency = len(clients)
+  counts = [request_count // concurrency + (i < request_count % concurrency) for i in range(concurrency)]
+  results = [[] for _ in clients]
+  errors = [0] * concurrency
+
+  def worker(index):
+    client = clients[index]
+    for _ in range(counts[index]):
+      try:
+        status, seconds = client.request(method, url, body)
+      except (OSError, http.client.HTTPException):
+        errors[index] += 1
+        continue
+      if status >= 400:
+        errors[index] += 1
+      results[index].append(seconds)
+
+  # Warm up the statement caches and connection pools
+  for client in clients:
+    client.request(method, url, body)
+
+  started = time.perf_counter()
+  with ThreadPoolExecutor(max_workers=concurrency) as executor:
+    list(executor.map(worker, range(concurrency)))
+  elapsed = time.perf_counter() - started
+
+  latencies = sorted(seconds for worker_results in results for seconds in worker_results)
+  if not latencies:
+    return {'requests': 0, 'errors': sum(errors)}
+  return {
+    'requests': len(latencies),
+    'errors': sum(errors),
+    'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+    'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+    'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+    'requests_per_second': round(len(latencies) / elapsed, 1)
+  }
+
+def run_suite(mode, make_client, ids, concurrency_levels, request_count, endpoint_filter):
+  results = []
+  for concurrency in concurrency_levels:
+    clients = [make_client() for _ in range(concurrency)]
+    for name, method, template in ENDPOINTS:
+      if endpoint_filter and not any(part in name for part in endpoint_filter):
+        continue
+      url = template.format(**ids)
+      stats = run_endpoint(clients, method, url, request_body(method, ids), request_count)
+      results.append({'mode': mode, 'concurrency': concurrency, 'endpoint': name, 'method': method, 'url': url, **stats})
+      print(f"  {mode:6} c={concurrency:<3} {name:32} "
+            f"p50 {stats.get('p50_ms', 0):8.2f}  p95 {stats.get('p95_ms', 0):8.2f}  p99 {stats.get('p99_ms', 0):8.2f} ms"
+            f"  {stats.get('requests_per_second', 0):8.1f} req/s" + (f"  {stats['errors']} errors" if stats['errors'] else ''))
+  return results
+
+def free_port():
+  with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    return s.getsockname()[1]
+
+# The built in server runs in its own process so the load generator doesn't
+# compete with it for the GIL
+def start_server(database, cache):
+  port = free_port()
+  process = subprocess.Popen([
+    sys.executable, os.path.abspath(__file__), '--serve', str(port), '--database', database
+  ] + (['--cache'] if cache else []))
+  deadline = time.monotonic() + 30
+  while time.monotonic() < deadline:
+    if process.poll() is not None:
+      raise SystemExit('benchmark server exited')
+    try:
+      socket.create_connection(('127.0.0.1', port), timeout=1).close()
+      return process, f'http://127.0.0.1:{port}'
+    except OSError:
+      time.sleep(0.1)
+  process.kill()
+  raise SystemExit('benchmark server did not start')
+
+def serve(port, database, cache):
+  from werkzeug.serving import make_server, WSGIRequestHandler
+  from app import create_app
+
+  # Keep-alive, the clients reuse their connection
+  class RequestHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_request(self, *args, **kwargs):
+      pass
+
+  app = create_app({'DATABASE': database, 'CACHE_ENABLED': cache})
+  make_server('127.0.0.1', port, app, threaded=True, request_handler=RequestHandler).serve_forever()
+
+def git_revision():
+  try:
+    return subprocess.run(
+      ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+    ).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+# Prints the endpoints whose p95 got worse by more than threshold (a
+# fraction) compared to an earlier results file, returns how many did
+def compare(results, baseline_path, threshold):
+  with open(baseline_path, encoding='utf-8') as f:
+    baseline = json.load(f)
+  previous = {(r['mode'], r['concurrency'], r['endpoint']): r for r in baseline['results']}
+  regressions = 0
+  print(f"\nCompared to {baseline_path} ({baseline['meta'].get('git_revision')}, p95):")
+  for result in results:
+    before = previous.get((result['mode'], result['concurrency'], result['endpoint']))
+    if not before or not before.get('p95_ms') or not result.get('p95_ms'):
+      continue
+    change = result['p95_ms'] / before['p95_ms'] - 1
+    flag = ''
+    if change > threshold:
+      regressions += 1
+      flag = '  REGRESSION'
+    print(f"  {result['mode']:6} c={result['concurrency']:<3} {result['endpoint']:32} "
+          f"{before['p95_ms']:8.2f} -> {result['p95_ms']:8.2f} ms ({change:+.0%}){flag}")
+  return regressions
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--words', type=int, default=100000)
+  parser.add_argument('--groups', type=int, default=20)
+  parser.add_argument('--sessions', type=int, default=10000)
+  parser.add_argument('--reviews', type=int, default=1000000)
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--database', help='database file to build, or to reuse if it exists')
+  parser.add_argument('--requests', type=int, default=200, help='requests per endpoint and concurrency level')
+  parser.add_argument('--concurrency', default='1,8,32', help='comma separated concurrency levels')
+  parser.add_argument('--mode', action='append', choices=['client', 'server'], help='default: both')
+  parser.add_argument('--server-url', help='benchmark this server instead of starting one')
+  parser.add_argument('--endpoint', action='append', help='only endpoints whose name contains this')
+  parser.add_argument('--cache', action='store_true', help='leave the response cache on')
+  parser.add_argument('--output', help='write the results to this JSON file')
+  parser.add_argument('--compare', help='results JSON of an earlier run')
+  parser.add_argument('--threshold', type=float, default=0.2, help='p95 increase counted as a regression')
+  parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.serve:
+    serve(args.serve, args.database, args.cache)
+    return
+
+  with tempfile.TemporaryDirectory() as directory:
+    path = args.database or os.path.join(directory, 'bench.db')
+    if os.path.exists(path):
+      print(f"Reusing {path}")
+    else:
+      print(f"Building {path}: {args.words} words, {args.sessions} sessions, {args.reviews} reviews")
+      seconds = build_database(path, args.words, args.groups, args.sessions, args.reviews, args.seed)
+      print(f"  done in {seconds:.1f}s")
+    scale = database_scale(path)
+    ids = sample_ids(path)
+    concurrency_levels = [int(level) for level in args.concurrency.split(',')]
+    modes = args.mode or ['client', 'server']
+
+    results = []
+    if 'client' in modes:
+      from app import create_app
+      app = create_app({'DATABASE': path, 'CACHE_ENABLED': args.cache})
+      results += run_suite('client', lambda: TestClient(app), ids, concurrency_levels, args.requests, args.endpoint)
+      app.db.dispose()
+    if 'server' in modes:
+      process = None
+      url = args.server_url
+      if not url:
+        process, url = start_server(path, args.cache)
+      try:
+        results += run_suite('server', lambda: HttpClient(url), ids, concurrency_levels, args.requests, args.endpoint)
+      finally:
+        if process:
+          process.terminate()
+          process.wait()
+
+  report = {
+    'meta': {
+      'started_at': datetime.now().isoformat(timespec='seconds'),
+      'git_revision': git_revision(),
+      'python': platform.python_version(),
+      'sqlite': sqlite3.sqlite_version,
+      'platform': platform.platform(),
+      'cpu_count': os.cpu_count(),
+      'scale': scale,
+      'seed': args.seed,
+      'requests': args.requests,
+      'cache': args.cache,
+      'server_url': args.server_url
+    },
+    'results': results
+  }
+  if args.output:
+    with open(args.output, 'w', encoding='utf-8') as f:
+      json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+  if args.compare and compare(results, args.compare, args.threshold):
+    raise SystemExit(1)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,104 @@
+# Requests/sec of GET /api/groups/:id/words/raw for a 5,000 word group,
+# serving pre-rendered words.payload rows (current) versus decoding parts
+# and re-encoding every word with jsonify (how the endpoint used to work).
+#
+# Run from the backend-flask directory:
+#   python benchmarks/raw_group_words.py [--words 5000] [--requests 200]
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+
+from lib.db import Db
+from lib.importer import import_words
+from migrate import run_migrations
+
+def build_database(path, word_count):
+  db = Db(database=path)
+  db.init(Flask(__name__))
+  db.dispose()
+  run_migrations(path)
+
+  words_path = path + '.jsonl'
+  with open(words_path, 'w', encoding='utf-8') as f:
+    for i in range(word_count):
+      f.write(json.dumps({
+        'kanji': f'単語{i}',
+        'romaji': f'tango{i}',
+        'english': f'word {i}',
+        'parts': [{'kanji': '単', 'romaji': ['ta', 'n']}, {'kanji': '語', 'romaji': ['go']}]
+      }) + '\n')
+  import sqlite3
+  connection = sqlite3.connect(path)
+  stats = import_words(connection, words_path, group_names=['Benchmark'])
+  connection.close()
+  return stats['groups']['Benchmark']
+
+# The endpoint as it was before words.payload, for comparison
+def add_reference_route(app):
+  @app.route('/bench/raw-before/<int:id>')
+  def raw_before(id):
+    cursor = app.db.read_cursor()
+    cursor.execute('SELECT name FROM groups WHERE id = ?', (id,))
+    group = cursor.fetchone()
+    cursor.execute('''
+      SELECT g.id as group_id, g.name as group_name, w.*
+      FROM groups g
+      JOIN word_groups wg ON g.id = wg.group_id
+      JOIN words w ON w.id = wg.word_id
+      WHERE g.id = ?;
+    ''', (id,))
+    data = cursor.fetchall()
+    result = {"group_id": id, "group_name": group["name"], "words": []}
+    for row in data:
+      result["words"].append({
+        "id": row["id"],
+        "kanji": row["kanji"],
+        "romaji": row["romaji"],
+        "english": row["english"],
+        "parts": json.loads(row["parts"])
+      })
+    return jsonify(result)
+
+def requests_per_second(client, url, count):
+  client.get(url)  # warm up
+  started = time.perf_counter()
+  for _ in range(count):
+    response = client.get(url)
+    assert response.status_code == 200
+    response.get_data()
+  return count / (time.perf_counter() - started)
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--words', type=int, default=5000)
+  parser.add_argument('--requests', type=int, default=200)
+  args = parser.parse_args()
+
+  from app import create_app
+
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'bench.db')
+    group_id = build_database(path, args.words)
+
+    # Caching is off so every request runs the query
+    app = create_app({'DATABASE': path, 'CACHE_ENABLED': False})
+    add_reference_route(app)
+    client = app.test_client()
+
+    before = requests_per_second(client, f'/bench/raw-before/{group_id}', args.requests)
+    after = requests_per_second(client, f'/api/groups/{group_id}/words/raw', args.requests)
+    app.db.dispose()
+
+  print(f"{args.words} word group, {args.requests} requests each")
+  print(f"  before (json.loads + jsonify): {before:8.1f} req/s")
+  print(f"  after  (pre-rendered payload): {after:8.1f} req/s  ({after / before:.1f}x)")
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,112 @@
+import asyncio
+import contextlib
+import sqlite3
+
+import aiosqlite
+
+from lib.db import PRAGMAS, CATALOG_SCHEMA, DEFAULT_SHARD_PATH, create_shard, shard_index
+
+# Async counterpart of lib/db.py for the ASGI app (asgi.py). Each aiosqlite
+# connection runs its queries on its own thread, so a request waiting on the
+# database only holds a pool slot, not a worker thread. The pools are bounded:
+# requests beyond the pool size wait for a free connection (up to
+# pool_timeout seconds) instead of opening more.
+
+class AsyncConnectionPool:
+  def __init__(self, database, size=4, readonly=False, catalog=None):
+    self.database = database
+    self.size = size
+    self.readonly = readonly
+    self.catalog = catalog  # main database to attach, for shards
+    self._idle = []
+    self._slots = asyncio.Semaphore(size)
+
+  async def _connect(self):
+    connection = await aiosqlite.connect(self.database, timeout=PRAGMAS['busy_timeout'] / 1000)
+    connection.row_factory = sqlite3.Row  # Return rows as dictionaries
+    for name, value in PRAGMAS.items():
+      await connection.execute(f'PRAGMA {name} = {value}')
+    if self.catalog is not None:
+      await connection.execute(f'ATTACH DATABASE ? AS {CATALOG_SCHEMA}', (self.catalog,))
+    if self.readonly:
+      await connection.execute('PRAGMA query_only = ON')
+    return connection
+
+  @contextlib.asynccontextmanager
+  async def connection(self, timeout=None):
+    try:
+      await asyncio.wait_for(self._slots.acquire(), timeout)
+    except asyncio.TimeoutError:
+      raise sqlite3.OperationalError(f"Timed out waiting for a connection to {self.database}")
+
+    try:
+      connection = self._idle.pop() if self._idle else await self._connect()
+    except Exception:
+      self._slots.release()
+      raise
+
+    try:
+      yield connection
+    finally:
+      # Never hand out a connection with a half finished transaction
+      try:
+        if connection.in_transaction:
+          await connection.rollback()
+        self._idle.append(connection)
+      except Exception:
+        await connection.close()
+      self._slots.release()
+
+  async def close_all(self):
+    while self._idle:
+      await self._idle.pop().close()
+
+class AsyncDb:
+  def __init__(self, database='words.db', pool_size=8, pool_timeout=10, shards=0, shard_path=DEFAULT_SHARD_PATH):
+    self.database = database
+    self.pool_size = pool_size
+    self.pool_timeout = pool_timeout
+    self.shards = shards
+    self.shard_path = shard_path
+    self._pools = {}
+
+  # Created on first use so they belong to the server's event loop. A user's
+  # pools are those of their shard when sharding is on, see lib/db.py.
+  def pools(self, user_id=None):
+    shard = shard_index(user_id, self.shards) if self.shards and user_id is not None else None
+    if shard not in self._pools:
+      database, catalog = self.database, None
+      if shard is not None:
+        database, catalog = self.shard_path.format(shard), self.database
+        # Once per shard and process, quick enough not to bother the loop
+        create_shard(database)
+      self._pools[shard] = {
+        # SQLite only allows one writer at a time, see lib/db.py
+        'write': AsyncConnectionPool(database, size=1, catalog=catalog),
+        'read': AsyncConnectionPool(database, size=self.pool_size, readonly=True, catalog=catalog)
+      }
+    return self._pools[shard]
+
+  # async with app.state.db.read(user_id) as connection: ...
+  def read(self, user_id=None):
+    return self.pools(user_id)['read'].connection(timeout=self.pool_timeout)
+
+  # Connection used for writes (and reads that must see those writes)
+  def write(self, user_id=None):
+    return self.pools(user_id)['write'].connection(timeout=self.pool_timeout)
+
+  async def fetchone(self, sql, params=(), user_id=None):
+    async with self.read(user_id) as connection:
+      async with connection.execute(sql, params) as cursor:
+        return await cursor.fetchone()
+
+  async def fetchall(self, sql, params=(), user_id=None):
+    async with self.read(user_id) as connection:
+      async with connection.execute(sql, params) as cursor:
+        return await cursor.fetchall()
+
+  async def dispose(self):
+    for pools in self._pools.values():
+      for pool in pools.values():
+        await pool.close_all()
+    self._pools = {}
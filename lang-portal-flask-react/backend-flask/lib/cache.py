@@ -0,0 +1,212 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, request, Response
+
+from lib.users import USER_HEADER
+
+# Response cache for read endpoints whose data only changes on import or
+# review. Entries are tagged with what they depend on ('words', 'groups',
+# 'reviews', ...) and writers call invalidate(tag). Invalidation bumps a
+# version number per tag that is part of every cache key, so stale entries
+# simply stop being reachable and age out of the backend.
+
+class MemoryBackend:
+  # In-process LRU with per entry expiry, one per worker process
+  def __init__(self, max_entries=1024):
+    self.max_entries = max_entries
+    self._entries = OrderedDict()
+    self._versions = {}
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      value, expires_at = entry
+      if expires_at < time.time():
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, ttl):
+    with self._lock:
+      self._entries[key] = (value, time.time() + ttl)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def versions(self, tags):
+    with self._lock:
+      return [self._versions.get(tag, 0) for tag in tags]
+
+  def bump(self, tags):
+    with self._lock:
+      for tag in tags:
+        self._versions[tag] = self._versions.get(tag, 0) + 1
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+class SqliteBackend:
+  # Cache stored in a local SQLite file, shared by every worker process on
+  # the host and by the invoke tasks (so an import invalidates the server)
+  def __init__(self, path='cache.db', max_entries=1024):
+    self.path = path
+    self.max_entries = max_entries
+    self._local = threading.local()
+    connection = self._connection()
+    connection.executescript('''
+      CREATE TABLE IF NOT EXISTS cache_entries (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+      );
+      CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed_at ON cache_entries(accessed_at);
+      CREATE TABLE IF NOT EXISTS cache_tags (
+        tag TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+      );
+    ''')
+
+  def _connection(self):
+    connection = getattr(self._local, 'connection', None)
+    if connection is None:
+      connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+      connection.execute('PRAGMA journal_mode = WAL')
+      connection.execute('PRAGMA synchronous = OFF')
+      self._local.connection = connection
+    return connection
+
+  def get(self, key):
+    connection = self._connection()
+    row = connection.execute(
+      'SELECT value, expires_at FROM cache_entries WHERE key = ?', (key,)
+    ).fetchone()
+    if row is None:
+      return None
+    now = time.time()
+    if row[1] < now:
+      connection.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+      return None
+    connection.execute('UPDATE cache_entries SET accessed_at = ? WHERE key = ?', (now, key))
+    return _decode(row[0])
+
+  def set(self, key, value, ttl):
+    connection = self._connection()
+    now = time.time()
+    connection.execute('''
+      INSERT OR REPLACE INTO cache_entries (key, value, expires_at, accessed_at)
+      VALUES (?, ?, ?, ?)
+    ''', (key, _encode(value), now + ttl, now))
+    # Evict the least recently used entries beyond the limit
+    connection.execute('''
+      DELETE FROM cache_entries WHERE key IN (
+        SELECT key FROM cache_entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+      )
+    ''', (self.max_entries,))
+
+  def versions(self, tags):
+    rows = dict(self._connection().execute(
+      f"SELECT tag, version FROM cache_tags WHERE tag IN ({','.join('?' * len(tags))})", tags
+    ).fetchall())
+    return [rows.get(tag, 0) for tag in tags]
+
+  def bump(self, tags):
+    self._connection().executemany('''
+      INSERT INTO cache_tags (tag, version) VALUES (?, 1)
+      ON CONFLICT (tag) DO UPDATE SET version = version + 1
+    ''', [(tag,) for tag in tags])
+
+  def clear(self):
+    self._connection().execute('DELETE FROM cache_entries')
+
+# Cached responses are stored as (mimetype, etag, body)
+def _encode(value):
+  mimetype, etag, body = value
+  return f'{mimetype}\n{etag}\n'.encode('utf-8') + body
+
+def _decode(blob):
+  mimetype, etag, body = bytes(blob).split(b'\n', 2)
+  return mimetype.decode('utf-8'), etag.decode('utf-8'), body
+
+class ResponseCache:
+  def __init__(self, backend, default_ttl=300, enabled=True):
+    self.backend = backend
+    self.default_ttl = default_ttl
+    self.enabled = enabled
+
+  @classmethod
+  def from_config(cls, config):
+    max_entries = config.get('CACHE_MAX_ENTRIES', 1024)
+    if config.get('CACHE_BACKEND', 'memory') == 'sqlite':
+      backend = SqliteBackend(config.get('CACHE_PATH', 'cache.db'), max_entries=max_entries)
+    else:
+      backend = MemoryBackend(max_entries=max_entries)
+    return cls(backend, default_ttl=config.get('CACHE_TTL', 300), enabled=config.get('CACHE_ENABLED', True))
+
+  def _key(self, tags, per_user=False):
+    args = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+    versions = ','.join(str(v) for v in self.backend.versions(tags))
+    user = f'@{g.user_id}' if per_user else ''
+    return f'{request.path}?{args}{user}#{versions}'
+
+  # Decorator for GET views. Only 200 responses are stored, and clients
+  # sending a matching If-None-Match get a bodiless 304. per_user views
+  # (whose data includes the user's reviews, see lib/users.py) are cached
+  # per user.
+  def cached(self, *tags, ttl=None, per_user=False):
+    def decorator(view):
+      @functools.wraps(view)
+      def wrapper(*args, **kwargs):
+        if not self.enabled or request.method != 'GET':
+          return view(*args, **kwargs)
+
+        key = self._key(tags, per_user)
+        entry = self.backend.get(key)
+        if entry is None:
+          response = view(*args, **kwargs)
+          if not isinstance(response, Response) or response.status_code != 200:
+            return response
+          body = response.get_data()
+          entry = (response.mimetype, hashlib.sha1(body).hexdigest(), body)
+          self.backend.set(key, entry, ttl or self.default_ttl)
+          cache_status = 'MISS'
+        else:
+          cache_status = 'HIT'
+
+        mimetype, etag, body = entry
+        if request.if_none_match.contains(etag):
+          response = Response(status=304)
+        else:
+          response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        # Let clients keep a copy but revalidate it with the ETag every time
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Cache'] = cache_status
+        if per_user:
+          response.vary.add(USER_HEADER)
+        return response
+      return wrapper
+    return decorator
+
+  def invalidate(self, *tags):
+    self.backend.bump(tags)
+
+  def clear(self):
+    self.backend.clear()
+
+# Invalidate a shared (sqlite) cache from outside the app, e.g. after an
+# import. Does nothing when the cache file doesn't exist.
+def invalidate_shared(path, *tags):
+  if os.path.exists(path):
+    SqliteBackend(path).bump(tags)
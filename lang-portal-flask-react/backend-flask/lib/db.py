@@ -1,18 +1,274 @@
 import sqlite3
 import json
+import logging
+import os
+import queue
+import threading
 from flask import g
 
+from lib.profiling import ProfiledConnection
+from migrate import SHARD_MIGRATIONS_DIR, apply_migrations
+
+# Pragmas applied to every pooled connection. WAL lets readers proceed while
+# log_review is writing, and synchronous=NORMAL is durable enough under WAL.
+# auto_vacuum only takes effect on a new database (or after a VACUUM, see
+# lib/maintenance.py) and has to come before journal_mode to do so.
+PRAGMAS = {
+  'auto_vacuum': 'INCREMENTAL',
+  'journal_mode': 'WAL',
+  'synchronous': 'NORMAL',
+  'temp_store': 'MEMORY',
+  'mmap_size': 268435456,  # 256MB
+  'cache_size': -16000,    # negative means KiB, so ~16MB per connection
+  'busy_timeout': 5000,
+}
+
+# Users can be spread over several SQLite files ("shards", DATABASE_SHARDS in
+# app.py): user u's study sessions, reviews and dashboard rollups live in
+# shard u % shards (see lib/users.py), with the schema from
+# sql/shard_migrations. A shard connection has the main database attached as
+# `catalog`, so words, groups and study activities resolve there and the
+# route queries run unchanged. Every shard has its own write connection, so
+# one busy user only holds up the users of the same shard.
+CATALOG_SCHEMA = 'catalog'
+DEFAULT_SHARD_PATH = 'shards/shard-{:03d}.db'
+
+log = logging.getLogger('lang_portal.db')
+
+def shard_index(user_id, shards):
+  return user_id % shards
+
+def shard_paths(pattern, shards):
+  return [pattern.format(index) for index in range(shards)]
+
+# Creates the shard file if needed and applies pending shard migrations
+def create_shard(path):
+  directory = os.path.dirname(path)
+  if directory:
+    os.makedirs(directory, exist_ok=True)
+  connection = sqlite3.connect(path, timeout=PRAGMAS['busy_timeout'] / 1000)
+  try:
+    for name in ('auto_vacuum', 'journal_mode'):
+      connection.execute(f'PRAGMA {name} = {PRAGMAS[name]}')
+    # Shards are created on the request path, so this goes to the log rather
+    # than stdout
+    try:
+      apply_migrations(connection, SHARD_MIGRATIONS_DIR, report=log.info)
+    except (sqlite3.IntegrityError, sqlite3.OperationalError):
+      # Another process migrated the shard at the same time (a duplicate
+      # migration row, or a column it already added)
+      apply_migrations(connection, SHARD_MIGRATIONS_DIR, report=log.info)
+  finally:
+    connection.close()
+
+# Statements copying the study history of the users of one shard (user_id %
+# shards = index, the two parameters of each) from the main database into
+# the shard, run on a shard connection. Rows keep their ids so a second run
+# skips what is already there. The rollups are rebuilt afterwards.
+MOVE_TO_SHARD = [
+  f'''INSERT OR IGNORE INTO main.study_sessions
+        (id, user_id, group_id, study_activity_id, created_at, correct_count, wrong_count, last_activity_at, ended_at)
+      SELECT id, user_id, group_id, study_activity_id, created_at, correct_count, wrong_count, last_activity_at, ended_at
+      FROM {CATALOG_SCHEMA}.study_sessions WHERE user_id % ? = ?''',
+  f'''INSERT OR IGNORE INTO main.word_review_items (id, user_id, word_id, study_session_id, correct, created_at, idempotency_key)
+      SELECT id, user_id, word_id, study_session_id, correct, created_at, idempotency_key
+      FROM {CATALOG_SCHEMA}.word_review_items WHERE user_id % ? = ?''',
+  f'''INSERT OR IGNORE INTO main.word_review_archive
+        (study_session_id, word_id, user_id, correct_count, wrong_count, last_reviewed_at, last_review_id)
+      SELECT a.study_session_id, a.word_id, a.user_id, a.correct_count, a.wrong_count, a.last_reviewed_at,
+             a.last_review_id
+      FROM {CATALOG_SCHEMA}.word_review_archive a
+      JOIN {CATALOG_SCHEMA}.study_sessions ss ON ss.id = a.study_session_id
+      WHERE ss.user_id % ? = ?''',
+  f'''INSERT INTO main.word_reviews
+        (user_id, word_id, correct_count, wrong_count, last_reviewed, ease, interval_days, repetitions, due_at)
+      SELECT user_id, word_id, correct_count, wrong_count, last_reviewed, ease, interval_days, repetitions, due_at
+      FROM {CATALOG_SCHEMA}.word_reviews WHERE user_id % ? = ?
+      ON CONFLICT (user_id, word_id) DO NOTHING''',
+  f'''DELETE FROM {CATALOG_SCHEMA}.word_review_items WHERE user_id % ? = ?''',
+  f'''DELETE FROM {CATALOG_SCHEMA}.word_review_archive WHERE study_session_id IN (
+        SELECT id FROM {CATALOG_SCHEMA}.study_sessions WHERE user_id % ? = ?
+      )''',
+  f'''DELETE FROM {CATALOG_SCHEMA}.study_sessions WHERE user_id % ? = ?''',
+  f'''DELETE FROM {CATALOG_SCHEMA}.word_reviews WHERE user_id % ? = ?''',
+]
+
+def _rebuild_dashboard_stats(connection):
+  with open('sql/dashboard/rebuild_stats.sql', 'r') as file:
+    statements = file.read().split(';')
+  for statement in statements:
+    if statement.strip():
+      connection.execute(statement)
+
+# Moves the study history recorded in the main database into the users'
+# shards, for `invoke shard-users` after switching sharding on. Returns the
+# number of sessions moved per shard.
+def move_users_to_shards(database, shard_path, shards):
+  moved = {}
+  for index, path in enumerate(shard_paths(shard_path, shards)):
+    create_shard(path)
+    connection = sqlite3.connect(path, timeout=PRAGMAS['busy_timeout'] / 1000)
+    try:
+      connection.execute(f'ATTACH DATABASE ? AS {CATALOG_SCHEMA}', (database,))
+      moved[path] = connection.execute(
+        f'SELECT COUNT(*) FROM {CATALOG_SCHEMA}.study_sessions WHERE user_id % ? = ?', (shards, index)
+      ).fetchone()[0]
+      for statement in MOVE_TO_SHARD:
+        connection.execute(statement, (shards, index))
+      _rebuild_dashboard_stats(connection)
+      connection.commit()
+    finally:
+      connection.close()
+
+  # Empty the main database's rollups along with its history
+  connection = sqlite3.connect(database, timeout=PRAGMAS['busy_timeout'] / 1000)
+  try:
+    _rebuild_dashboard_stats(connection)
+    connection.commit()
+  finally:
+    connection.close()
+  return moved
+
+class ConnectionPool:
+  def __init__(self, database, size=4, readonly=False, cached_statements=256, profiler=None, catalog=None):
+    self.database = database
+    self.size = size
+    self.readonly = readonly
+    self.cached_statements = cached_statements
+    self.profiler = profiler
+    self.catalog = catalog  # main database to attach, for shards
+    self._idle = queue.LifoQueue(maxsize=size)
+    self._lock = threading.Lock()
+    self._created = 0
+
+  def _connect(self):
+    # check_same_thread is off because a connection may be handed to a
+    # different request thread once it is back in the pool
+    options = {}
+    if self.profiler is not None:
+      # Cursors that time their statements, see lib/profiling.py
+      options['factory'] = ProfiledConnection
+    connection = sqlite3.connect(
+      self.database,
+      timeout=PRAGMAS['busy_timeout'] / 1000,
+      check_same_thread=False,
+      cached_statements=self.cached_statements,
+      **options
+    )
+    if self.profiler is not None:
+      connection.profiler = self.profiler
+    connection.row_factory = sqlite3.Row  # Return rows as dictionaries
+    for name, value in PRAGMAS.items():
+      connection.execute(f'PRAGMA {name} = {value}')
+    if self.catalog is not None:
+      connection.execute(f'ATTACH DATABASE ? AS {CATALOG_SCHEMA}', (self.catalog,))
+    if self.readonly:
+      connection.execute('PRAGMA query_only = ON')
+    return connection
+
+  def acquire(self, timeout=None):
+    try:
+      return self._idle.get_nowait()
+    except queue.Empty:
+      pass
+
+    with self._lock:
+      if self._created < self.size:
+        self._created += 1
+        try:
+          return self._connect()
+        except Exception:
+          self._created -= 1
+          raise
+
+    # Pool is exhausted, wait for another request to give one back
+    try:
+      return self._idle.get(timeout=timeout)
+    except queue.Empty:
+      raise sqlite3.OperationalError(f"Timed out waiting for a connection to {self.database}")
+
+  def release(self, connection):
+    # Never hand out a connection with a half finished transaction
+    if connection.in_transaction:
+      connection.rollback()
+    try:
+      self._idle.put_nowait(connection)
+    except queue.Full:
+      connection.close()
+      with self._lock:
+        self._created -= 1
+
+  def close_all(self):
+    while True:
+      try:
+        connection = self._idle.get_nowait()
+      except queue.Empty:
+        break
+      connection.close()
+      with self._lock:
+        self._created -= 1
+
 class Db:
-  def __init__(self, database='words.db'):
+  def __init__(self, database='words.db', pool_size=8, pool_timeout=10, profiler=None,
+               shards=0, shard_path=DEFAULT_SHARD_PATH):
     self.database = database
-    self.connection = None
+    self.pool_size = pool_size
+    self.pool_timeout = pool_timeout
+    self.profiler = profiler
+    self.shards = shards
+    self.shard_path = shard_path
+    self._pools = None
+    self._pools_pid = None
+    self._pools_lock = threading.Lock()
+
+  # Shard holding a user's data, None for the main database (sharding off,
+  # or no user as in the invoke tasks)
+  def shard_for(self, user_id):
+    if not self.shards or user_id is None:
+      return None
+    return shard_index(user_id, self.shards)
 
+  # Pools are created lazily and per process, so gunicorn workers forked
+  # after create_app never share sqlite handles with their parent. Those of
+  # a shard are created on its first use, creating the shard file if needed.
+  def pools(self, shard=None):
+    pid = os.getpid()
+    if self._pools is None or self._pools_pid != pid or shard not in self._pools:
+      with self._pools_lock:
+        if self._pools is None or self._pools_pid != pid:
+          self._pools = {}
+          self._pools_pid = pid
+        if shard not in self._pools:
+          database, catalog = self.database, None
+          if shard is not None:
+            database, catalog = self.shard_path.format(shard), self.database
+            create_shard(database)
+          self._pools[shard] = {
+            # SQLite only allows one writer at a time, more write
+            # connections would just queue up on the database lock
+            'write': ConnectionPool(database, size=1, profiler=self.profiler, catalog=catalog),
+            'read': ConnectionPool(database, size=self.pool_size, readonly=True, profiler=self.profiler, catalog=catalog)
+          }
+    return self._pools[shard]
+
+  # Pools of the current request's user (g.user_id, see lib/users.py)
+  def _request_pools(self):
+    if 'db_pools' not in g:
+      g.db_pools = self.pools(self.shard_for(g.get('user_id')))
+    return g.db_pools
+
+  # Connection used for writes (and reads that must see those writes)
   def get(self):
     if 'db' not in g:
-      g.db = sqlite3.connect(self.database)
-      g.db.row_factory = sqlite3.Row  # Return rows as dictionaries
+      g.db = self._request_pools()['write'].acquire(timeout=self.pool_timeout)
     return g.db
 
+  # Read only connection, safe to use concurrently with a writer under WAL
+  def get_read(self):
+    if 'db_read' not in g:
+      g.db_read = self._request_pools()['read'].acquire(timeout=self.pool_timeout)
+    return g.db_read
+
   def commit(self):
     self.get().commit()
 
@@ -21,10 +277,28 @@ class Db:
     connection = self.get()
     return connection.cursor()
 
+  def read_cursor(self):
+    return self.get_read().cursor()
+
+  # Return the request's connections to their pools
   def close(self):
+    pools = g.pop('db_pools', None)
+    if pools is None:
+      return
     db = g.pop('db', None)
     if db is not None:
-      db.close()
+      pools['write'].release(db)
+    db_read = g.pop('db_read', None)
+    if db_read is not None:
+      pools['read'].release(db_read)
+
+  # Close every pooled connection, e.g. before deleting the database file
+  def dispose(self):
+    if self._pools is not None:
+      for pools in self._pools.values():
+        for pool in pools.values():
+          pool.close_all()
+      self._pools = None
 
   # Function to load SQL from a file
   def sql(self, filepath):
@@ -109,6 +383,11 @@ class Db:
 
       print(f"Successfully added {len(words)} verbs to the '{group_name}' group.")
 
+  # Recompute the dashboard rollups (see sql/migrations/0011_users.sql) of
+  # every user from the raw tables, within the caller's transaction
+  def rebuild_dashboard_stats(self, cursor):
+    _rebuild_dashboard_stats(cursor)
+
   # Initialize the database with sample data
   def init(self, app):
     with app.app_context():
@@ -0,0 +1,137 @@
+import asyncio
+import itertools
+import json
+import queue
+import threading
+
+# In-process publish/subscribe for the live session streams
+# (GET /api/study-sessions/<id>/events). The review routes publish what they
+# just committed under the topic (user_id, session_id) and every open stream
+# of that session gets a copy in its own bounded queue. Only subscribers of
+# the same process see an event: with several workers a stream follows the
+# reviews logged through its worker, so run one process (or the ASGI app)
+# when every dashboard must see every review.
+
+# Seconds between comment lines on an idle stream, so proxies keep it open
+# and a client that went away is noticed on the next write
+HEARTBEAT_INTERVAL = 15
+
+# Events queued for a subscriber that doesn't keep up. Past this the
+# subscriber is dropped and its stream ends, the browser's EventSource then
+# reconnects and starts over from a fresh snapshot.
+MAX_QUEUED_EVENTS = 256
+
+def session_topic(user_id, session_id):
+  return (user_id, int(session_id))
+
+# One SSE message, see https://html.spec.whatwg.org/multipage/server-sent-events.html
+def format_event(name, data, id=None):
+  lines = [f'id: {id}'] if id is not None else []
+  lines.append(f'event: {name}')
+  lines.append(f'data: {json.dumps(data, default=str)}')
+  return '\n'.join(lines) + '\n\n'
+
+HEARTBEAT = ': keepalive\n\n'
+
+class Subscription:
+  # For a thread serving a stream (the Flask app)
+  def __init__(self, broker, topic, max_events=MAX_QUEUED_EVENTS):
+    self.broker = broker
+    self.topic = topic
+    self.overflowed = False
+    self._queue = queue.Queue(max_events)
+
+  def put(self, event):
+    try:
+      self._queue.put_nowait(event)
+    except queue.Full:
+      self.overflowed = True
+
+  # The next (id, name, data) event, or None after timeout seconds
+  def get(self, timeout=HEARTBEAT_INTERVAL):
+    try:
+      return self._queue.get(timeout=timeout)
+    except queue.Empty:
+      return None
+
+  def close(self):
+    self.broker.unsubscribe(self)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+class AsyncSubscription(Subscription):
+  # For a coroutine serving a stream (the ASGI app). Events may be published
+  # from any thread, they are handed over to the subscriber's event loop.
+  def __init__(self, broker, topic, max_events=MAX_QUEUED_EVENTS):
+    super().__init__(broker, topic, max_events)
+    self._loop = asyncio.get_running_loop()
+    self._queue = asyncio.Queue(max_events)
+
+  def put(self, event):
+    try:
+      self._loop.call_soon_threadsafe(self._put, event)
+    except RuntimeError:  # the loop is closed, the server is going away
+      self.overflowed = True
+
+  def _put(self, event):
+    try:
+      self._queue.put_nowait(event)
+    except asyncio.QueueFull:
+      self.overflowed = True
+
+  async def get(self, timeout=HEARTBEAT_INTERVAL):
+    try:
+      return await asyncio.wait_for(self._queue.get(), timeout)
+    except asyncio.TimeoutError:
+      return None
+
+class EventBroker:
+  def __init__(self, max_events=MAX_QUEUED_EVENTS):
+    self.max_events = max_events
+    self._subscribers = {}
+    self._ids = itertools.count(1)
+    self._lock = threading.Lock()
+
+  def subscribe(self, topic):
+    return self._add(Subscription(self, topic, self.max_events))
+
+  # Call from the event loop that will read the subscription
+  def subscribe_async(self, topic):
+    return self._add(AsyncSubscription(self, topic, self.max_events))
+
+  def _add(self, subscription):
+    with self._lock:
+      self._subscribers.setdefault(subscription.topic, set()).add(subscription)
+    return subscription
+
+  def unsubscribe(self, subscription):
+    with self._lock:
+      subscribers = self._subscribers.get(subscription.topic)
+      if subscribers is not None:
+        subscribers.discard(subscription)
+        if not subscribers:
+          del self._subscribers[subscription.topic]
+
+  # Publish after the commit, so a subscriber never sees what may still be
+  # rolled back. Returns the number of subscribers reached.
+  def publish(self, topic, name, data):
+    with self._lock:
+      subscribers = list(self._subscribers.get(topic, ()))
+      if not subscribers:
+        return 0
+      event = (next(self._ids), name, data)
+    for subscription in subscribers:
+      subscription.put(event)
+      if subscription.overflowed:
+        self.unsubscribe(subscription)
+    return len(subscribers)
+
+  def subscriber_count(self, topic=None):
+    with self._lock:
+      if topic is not None:
+        return len(self._subscribers.get(topic, ()))
+      return sum(len(subscribers) for subscribers in self._subscribers.values())
@@ -0,0 +1,177 @@
+import csv
+import json
+import os
+
+# Bulk vocabulary importer used by `invoke import-words`.
+#
+# Words are streamed from the file (JSON array, JSON lines or CSV with
+# kanji,romaji,english,parts columns) so memory stays flat for large
+# frequency lists, staged in a temp table one batch at a time and inserted
+# with set-based statements. Words already in the database (same kanji and
+# romaji) are not inserted again but are still added to the groups.
+
+FORMATS = ('json', 'jsonl', 'csv')
+
+def detect_format(path):
+  extension = os.path.splitext(path)[1].lower().lstrip('.')
+  if extension == 'ndjson':
+    return 'jsonl'
+  if extension not in FORMATS:
+    raise ValueError(f"Can't tell the format of {path}, expected one of {', '.join(FORMATS)}")
+  return extension
+
+# Yield the elements of a top level JSON array without loading the whole
+# document, decoding one element at a time from a sliding buffer
+def iter_json_array(file, chunk_size=65536):
+  decoder = json.JSONDecoder()
+  buffer = ''
+  position = 0
+  started = False
+  eof = False
+
+  while True:
+    # Skip whitespace and separators between elements
+    while position < len(buffer) and buffer[position] in ' \t\r\n,':
+      position += 1
+
+    if position < len(buffer):
+      if not started:
+        if buffer[position] != '[':
+          raise ValueError('Expected a JSON array of words')
+        started = True
+        position += 1
+        continue
+      if buffer[position] == ']':
+        return
+      try:
+        item, end = decoder.raw_decode(buffer, position)
+      except json.JSONDecodeError:
+        if eof:
+          raise
+        end = None
+      # An element running up to the end of the buffer may be cut short
+      if end is not None and (end < len(buffer) or eof):
+        yield item
+        position = end
+        continue
+    elif eof:
+      if started:
+        raise ValueError('Unexpected end of JSON array')
+      return
+
+    # Need more data, drop what was already consumed
+    chunk = file.read(chunk_size)
+    eof = not chunk
+    buffer = buffer[position:] + chunk
+    position = 0
+
+def iter_jsonl(file):
+  for line in file:
+    line = line.strip()
+    if line:
+      yield json.loads(line)
+
+def iter_csv(file):
+  for row in csv.DictReader(file):
+    parts = row.get('parts') or '[]'
+    yield dict(row, parts=json.loads(parts))
+
+def iter_words(path, format=None):
+  format = format or detect_format(path)
+  readers = {'json': iter_json_array, 'jsonl': iter_jsonl, 'csv': iter_csv}
+  with open(path, 'r', encoding='utf-8', newline='' if format == 'csv' else None) as file:
+    for word in readers[format](file):
+      yield word
+
+def _batches(words, batch_size):
+  batch = []
+  for word in words:
+    batch.append((
+      word['kanji'],
+      word['romaji'],
+      word['english'],
+      json.dumps(word.get('parts', []))
+    ))
+    if len(batch) >= batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+# Find or create each group by name, returns their ids
+def _group_ids(cursor, group_names):
+  group_ids = []
+  for name in group_names:
+    cursor.execute('SELECT id FROM groups WHERE name = ?', (name,))
+    row = cursor.fetchone()
+    if row:
+      group_ids.append(row[0])
+    else:
+      cursor.execute('INSERT INTO groups (name) VALUES (?)', (name,))
+      group_ids.append(cursor.lastrowid)
+  return group_ids
+
+def import_words(connection, path, group_names=(), format=None, batch_size=5000):
+  cursor = connection.cursor()
+  group_ids = _group_ids(cursor, group_names)
+  connection.commit()
+
+  cursor.execute('''
+    CREATE TEMP TABLE IF NOT EXISTS import_words (
+      kanji TEXT NOT NULL,
+      romaji TEXT NOT NULL,
+      english TEXT NOT NULL,
+      parts TEXT NOT NULL,
+      UNIQUE (kanji, romaji)
+    )
+  ''')
+  cursor.execute('CREATE TEMP TABLE IF NOT EXISTS import_groups (id INTEGER PRIMARY KEY)')
+  cursor.execute('DELETE FROM import_groups')
+  cursor.executemany('INSERT INTO import_groups (id) VALUES (?)', [(group_id,) for group_id in group_ids])
+  connection.commit()
+
+  stats = {'read': 0, 'inserted': 0, 'skipped': 0, 'groups': dict(zip(group_names, group_ids))}
+  try:
+    for batch in _batches(iter_words(path, format), batch_size):
+      cursor.execute('DELETE FROM import_words')
+      # Duplicates within the file collapse onto the first occurrence
+      cursor.executemany('''
+        INSERT OR IGNORE INTO import_words (kanji, romaji, english, parts) VALUES (?, ?, ?, ?)
+      ''', batch)
+
+      cursor.execute('''
+        INSERT INTO words (kanji, romaji, english, parts)
+        SELECT i.kanji, i.romaji, i.english, i.parts
+        FROM import_words i
+        WHERE NOT EXISTS (
+          SELECT 1 FROM words w WHERE w.kanji = i.kanji AND w.romaji = i.romaji
+        )
+      ''')
+      inserted = cursor.rowcount
+
+      cursor.execute('''
+        INSERT OR IGNORE INTO word_groups (word_id, group_id)
+        SELECT w.id, g.id
+        FROM import_words i
+        JOIN words w ON w.kanji = i.kanji AND w.romaji = i.romaji
+        CROSS JOIN import_groups g
+      ''')
+      connection.commit()
+
+      stats['read'] += len(batch)
+      stats['inserted'] += inserted
+      stats['skipped'] += len(batch) - inserted
+  finally:
+    if connection.in_transaction:
+      connection.rollback()
+    cursor.execute('DROP TABLE IF EXISTS temp.import_words')
+    cursor.execute('DROP TABLE IF EXISTS temp.import_groups')
+
+  # Refresh the counter cache once for the whole import
+  cursor.executemany('''
+    UPDATE groups
+    SET words_count = (SELECT COUNT(*) FROM word_groups WHERE group_id = ?)
+    WHERE id = ?
+  ''', [(group_id, group_id) for group_id in group_ids])
+  connection.commit()
+  return stats
@@ -0,0 +1,248 @@
+import json
+import logging
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+
+from lib import queries
+from lib.db import CATALOG_SCHEMA
+
+# Database upkeep, run by `invoke maintenance` or in the background when
+# MAINTENANCE_INTERVAL is set in app.py:
+#
+# - review items older than archive_days are folded into word_review_archive
+#   (one row per session and word) and deleted, in batches of batch_size
+#   rows with a commit after each so writers are never held up for long
+# - ANALYZE and PRAGMA optimize refresh the planner statistics
+# - freed pages are returned to the file system with PRAGMA incremental_vacuum
+#   and the WAL is checkpointed and truncated
+#
+# Every run is recorded in maintenance_runs with a report of the space
+# reclaimed and the timings of a few route queries before and after.
+#
+# With users sharded over several files (lib/db.py) each shard is maintained
+# the same way, with the main database attached for the timed queries.
+
+DEFAULT_ARCHIVE_DAYS = 365
+DEFAULT_BATCH_SIZE = 5000
+
+log = logging.getLogger('lang_portal.maintenance')
+
+# Reviews to archive next, oldest first through idx_word_review_items_created_at
+ARCHIVE_BATCH = '''
+  SELECT id FROM word_review_items
+  WHERE created_at < ?
+  ORDER BY created_at
+  LIMIT ?
+'''
+
+ARCHIVE_REVIEWS = '''
+  INSERT INTO word_review_archive
+    (study_session_id, word_id, user_id, correct_count, wrong_count, last_reviewed_at, last_review_id)
+  SELECT study_session_id, word_id, user_id,
+         SUM(correct = 1), SUM(correct = 0), MAX(created_at), MAX(id)
+  FROM word_review_items
+  WHERE id IN (SELECT value FROM json_each(?))
+  GROUP BY study_session_id, word_id
+  ON CONFLICT (study_session_id, word_id) DO UPDATE SET
+    correct_count = correct_count + excluded.correct_count,
+    wrong_count = wrong_count + excluded.wrong_count,
+    last_reviewed_at = MAX(last_reviewed_at, excluded.last_reviewed_at),
+    last_review_id = MAX(last_review_id, excluded.last_review_id)
+'''
+
+DELETE_REVIEWS = 'DELETE FROM word_review_items WHERE id IN (SELECT value FROM json_each(?))'
+
+# catalog is the main database to attach when database is a shard
+def connect(database, catalog=None):
+  connection = sqlite3.connect(database, timeout=5)
+  connection.row_factory = sqlite3.Row
+  if catalog is not None:
+    connection.execute(f'ATTACH DATABASE ? AS {CATALOG_SCHEMA}', (catalog,))
+  return connection
+
+# Runs a DELETE ... LIMIT ? style statement until it deletes nothing,
+# committing after every batch. params come before the batch size. Returns
+# the number of rows deleted.
+def delete_in_batches(connection, statement, batch_size=DEFAULT_BATCH_SIZE, params=()):
+  deleted = 0
+  while True:
+    count = connection.execute(statement, (*params, batch_size)).rowcount
+    connection.commit()
+    if count <= 0:
+      return deleted
+    deleted += count
+
+# Folds the reviews logged before `before` into word_review_archive.
+# Returns the number of review items archived.
+def archive_reviews(connection, before, batch_size=DEFAULT_BATCH_SIZE):
+  archived = 0
+  while True:
+    ids = [row[0] for row in connection.execute(ARCHIVE_BATCH, (before, batch_size))]
+    if not ids:
+      return archived
+    ids_json = json.dumps(ids)
+    try:
+      connection.execute(ARCHIVE_REVIEWS, (ids_json,))
+      connection.execute(DELETE_REVIEWS, (ids_json,))
+      connection.commit()
+    except Exception:
+      connection.rollback()
+      raise
+    archived += len(ids)
+
+def database_size(connection):
+  page_size = connection.execute('PRAGMA page_size').fetchone()[0]
+  page_count = connection.execute('PRAGMA page_count').fetchone()[0]
+  freelist_count = connection.execute('PRAGMA freelist_count').fetchone()[0]
+  path = connection.execute('PRAGMA database_list').fetchone()['file']
+  wal_path = path + '-wal'
+  return {
+    'file_bytes': os.path.getsize(path) if path and os.path.exists(path) else page_count * page_size,
+    'wal_bytes': os.path.getsize(wal_path) if path and os.path.exists(wal_path) else 0,
+    'free_bytes': freelist_count * page_size
+  }
+
+# Route queries timed before and after maintenance, as (name, sql, params).
+# Parameters point at the newest session, its user and its group.
+def _timed_queries(connection):
+  session = connection.execute('SELECT id, user_id, group_id FROM study_sessions ORDER BY created_at DESC LIMIT 1').fetchone()
+  session_id, user_id, group_id = (session['id'], session['user_id'], session['group_id']) if session else (0, 0, 0)
+  return [
+    ('words by correct_count', queries.WORDS_PAGE.format(sort_by='correct_count', order='DESC'), (user_id, 100, 0)),
+    ('study sessions', queries.SESSIONS_PAGE, (user_id, 100, 0)),
+    ('session words', queries.SESSION_WORDS_PAGE, (session_id, session_id, 100, 0)),
+    ('due words', queries.DUE_WORDS, (group_id, user_id, datetime.now(), 100)),
+    ('current streak', queries.CURRENT_STREAK, (user_id,)),
+  ]
+
+# Median milliseconds of a few runs of each query
+def time_queries(connection, runs=5):
+  timings = {}
+  for name, sql, params in _timed_queries(connection):
+    samples = []
+    for _ in range(runs):
+      started = time.perf_counter()
+      connection.execute(sql, params).fetchall()
+      samples.append((time.perf_counter() - started) * 1000)
+    timings[name] = round(statistics.median(samples), 3)
+  return timings
+
+def auto_vacuum_mode(connection):
+  return {0: 'none', 1: 'full', 2: 'incremental'}[connection.execute('PRAGMA auto_vacuum').fetchone()[0]]
+
+# Databases created before auto_vacuum was set (see lib/db.py PRAGMAS) need
+# a full VACUUM once to switch to incremental vacuuming. This rewrites the
+# whole file and blocks writers while it runs.
+def enable_incremental_vacuum(connection):
+  if auto_vacuum_mode(connection) == 'incremental':
+    return False
+  connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+  connection.execute('VACUUM')
+  return True
+
+def run_maintenance(database, archive_days=DEFAULT_ARCHIVE_DAYS, batch_size=DEFAULT_BATCH_SIZE, full_vacuum=False,
+                    catalog=None):
+  connection = connect(database, catalog)
+  try:
+    started_at = datetime.now()
+    run_id = connection.execute('INSERT INTO maintenance_runs (started_at) VALUES (?)', (started_at,)).lastrowid
+    connection.commit()
+
+    report = {'size_before': database_size(connection), 'queries_before': time_queries(connection)}
+    steps = {}
+
+    step_started = time.perf_counter()
+    report['archived_reviews'] = 0
+    if archive_days is not None:
+      before = started_at - timedelta(days=archive_days)
+      report['archived_reviews'] = archive_reviews(connection, before, batch_size)
+    steps['archive'] = time.perf_counter() - step_started
+
+    step_started = time.perf_counter()
+    # Only this file, not an attached catalog
+    connection.execute('ANALYZE main')
+    connection.execute('PRAGMA main.optimize')
+    connection.commit()
+    steps['analyze'] = time.perf_counter() - step_started
+
+    step_started = time.perf_counter()
+    report['full_vacuum'] = full_vacuum and enable_incremental_vacuum(connection)
+    report['auto_vacuum'] = auto_vacuum_mode(connection)
+    if report['auto_vacuum'] == 'incremental':
+      # Each step of the statement frees one page and execute() only steps
+      # once, executescript runs it to the end
+      connection.executescript('PRAGMA incremental_vacuum;')
+    # Freed pages only leave the file once the WAL is checkpointed
+    connection.execute('PRAGMA main.wal_checkpoint(TRUNCATE)').fetchall()
+    steps['vacuum'] = time.perf_counter() - step_started
+
+    report['size_after'] = database_size(connection)
+    report['queries_after'] = time_queries(connection)
+    before, after = report['size_before'], report['size_after']
+    report['reclaimed_bytes'] = before['file_bytes'] + before['wal_bytes'] - after['file_bytes'] - after['wal_bytes']
+    report['seconds'] = {name: round(seconds, 3) for name, seconds in steps.items()}
+
+    connection.execute(
+      'UPDATE maintenance_runs SET finished_at = ?, report = ? WHERE id = ?',
+      (datetime.now(), json.dumps(report), run_id)
+    )
+    connection.commit()
+    return report
+  finally:
+    connection.close()
+
+def last_run_at(database):
+  connection = connect(database)
+  try:
+    row = connection.execute('SELECT MAX(finished_at) FROM maintenance_runs').fetchone()
+    return datetime.fromisoformat(row[0]) if row[0] else None
+  finally:
+    connection.close()
+
+# Daemon thread running run_maintenance every `interval` seconds, on the
+# database and then on the user shards that exist. Every worker process
+# starts one, the maintenance_runs table of the database lets them skip a
+# run another process has done within the interval.
+class MaintenanceScheduler(threading.Thread):
+  def __init__(self, database, interval, archive_days=DEFAULT_ARCHIVE_DAYS, batch_size=DEFAULT_BATCH_SIZE, shards=()):
+    super().__init__(name='maintenance', daemon=True)
+    self.database = database
+    self.interval = interval
+    self.archive_days = archive_days
+    self.batch_size = batch_size
+    self.shards = list(shards)
+    self._stopped = threading.Event()
+
+  def run(self):
+    while not self._stopped.wait(self._seconds_until_due()):
+      try:
+        # The database last, its run marks the whole pass as done
+        for shard in self.shards:
+          if os.path.exists(shard):
+            self._run(shard, catalog=self.database)
+        self._run(self.database)
+      except Exception:
+        log.exception('Maintenance failed')
+        self._stopped.wait(self.interval)
+
+  def _run(self, database, catalog=None):
+    report = run_maintenance(database, self.archive_days, self.batch_size, catalog=catalog)
+    log.info('Maintenance of %s archived %d reviews and reclaimed %d bytes',
+             database, report['archived_reviews'], report['reclaimed_bytes'])
+
+  def _seconds_until_due(self):
+    try:
+      last = last_run_at(self.database)
+    except sqlite3.Error:
+      last = None
+    if last is None:
+      # Never run yet, but don't slow down the startup
+      return min(self.interval, 60)
+    return max(0, self.interval - (datetime.now() - last).total_seconds())
+
+  def stop(self):
+    self._stopped.set()
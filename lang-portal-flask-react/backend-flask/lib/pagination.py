@@ -0,0 +1,105 @@
+import base64
+import json
+
+# Raised when a client sends a cursor we did not issue (or one that was
+# issued for a different sort), routes turn this into a 400
+class CursorError(ValueError):
+  pass
+
+def encode_cursor(sort_by, order, value, row_id, direction):
+  payload = json.dumps({
+    's': sort_by,
+    'o': order,
+    'v': value,
+    'i': row_id,
+    'd': direction
+  }, separators=(',', ':'))
+  return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+  try:
+    padded = token + '=' * (-len(token) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    if not isinstance(payload, dict) or not {'s', 'o', 'v', 'i', 'd'} <= payload.keys():
+      raise ValueError(payload)
+    if not isinstance(payload['s'], str) or not isinstance(payload['o'], str):
+      raise ValueError(payload)
+    if not isinstance(payload['v'], (str, int, float, type(None))):
+      raise ValueError(payload['v'])
+    if not isinstance(payload['i'], int) or isinstance(payload['i'], bool):
+      raise ValueError(payload['i'])
+    if payload['d'] not in ('next', 'prev'):
+      raise ValueError(payload['d'])
+    return payload
+  except Exception:
+    raise CursorError('Invalid cursor')
+
+# Keyset (seek) pagination over a sort expression with the row id as the
+# tie breaker, e.g. WHERE (w.kanji, w.id) > (?, ?) ORDER BY w.kanji, w.id
+#
+# Every page is an index range scan starting right after the previous one,
+# so page 1000 costs the same as page 1 and no COUNT(*) is needed.
+class Keyset:
+  def __init__(self, sort_by, sort_expr, order, id_expr, cursor=None, sort_key=None):
+    self.sort_by = sort_by
+    self.sort_expr = sort_expr
+    self.order = order
+    self.id_expr = id_expr
+    # Name of the result column holding the sort value (defaults to sort_by)
+    self.sort_key = sort_key or sort_by
+    self.direction = 'next'
+    self.value = None
+    self.row_id = None
+    self.first_page = True
+
+    if cursor:
+      payload = decode_cursor(cursor)
+      if payload['s'] != sort_by or payload['o'] != order:
+        raise CursorError('Cursor does not match sort_by/order')
+      self.direction = payload['d']
+      self.value = payload['v']
+      self.row_id = payload['i']
+      self.first_page = False
+
+  def ascending(self):
+    # Walking backwards flips the direction we scan the index in
+    return (self.order == 'asc') == (self.direction == 'next')
+
+  # The (value, row id) of the cursor row to continue after, None on the
+  # first page
+  def after(self):
+    return None if self.first_page else (self.value, self.row_id)
+
+  # SQL condition (and its parameters) to AND into the query's WHERE clause
+  def where(self):
+    if self.first_page:
+      return '1 = 1', ()
+    op = '>' if self.ascending() else '<'
+    return f'({self.sort_expr}, {self.id_expr}) {op} (?, ?)', (self.value, self.row_id)
+
+  def order_by(self):
+    direction = 'ASC' if self.ascending() else 'DESC'
+    return f'{self.sort_expr} {direction}, {self.id_expr} {direction}'
+
+  # Takes the rows fetched with LIMIT per_page + 1 and returns the page rows
+  # in display order along with the cursors for the neighbouring pages
+  def page(self, rows, per_page):
+    rows = list(rows)
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if self.direction == 'prev':
+      rows.reverse()
+
+    if not rows:
+      return rows, None, None
+
+    def cursor_for(row, direction):
+      return encode_cursor(self.sort_by, self.order, row[self.sort_key], row['id'], direction)
+
+    if self.direction == 'next':
+      next_cursor = cursor_for(rows[-1], 'next') if has_more else None
+      prev_cursor = None if self.first_page else cursor_for(rows[0], 'prev')
+    else:
+      next_cursor = cursor_for(rows[-1], 'next')
+      prev_cursor = cursor_for(rows[0], 'prev') if has_more else None
+    return rows, next_cursor, prev_cursor
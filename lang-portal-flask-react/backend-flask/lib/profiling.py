@@ -0,0 +1,261 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+from flask import g, request, Response, has_app_context
+
+# Request and SQL profiling for the Flask app, enabled in create_app with
+# METRICS_ENABLED. Pooled connections (lib/db.py) get ProfiledCursor
+# cursors that time every statement from execute until its rows have been
+# fetched, statements slower than SLOW_QUERY_MS are logged to the
+# 'lang_portal.slow_queries' logger, and GET /metrics exposes the latency
+# histograms in the Prometheus text format. Metrics are kept per process.
+
+# Histogram buckets in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+slow_query_log = logging.getLogger('lang_portal.slow_queries')
+
+# Turns a statement into a label shared by every execution of it: literals
+# become ?, whitespace is collapsed and IN lists are shortened
+def fingerprint(sql):
+  sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+  sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+  sql = ' '.join(sql.split())
+  sql = re.sub(r'\(\?(?:, ?\?)+\)', '(?, ...)', sql)
+  return sql
+
+def _label_value(value):
+  return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=''):
+  pairs = [f'{name}="{_label_value(value)}"' for name, value in zip(names, values)]
+  if extra:
+    pairs.append(extra)
+  return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Histogram:
+  def __init__(self, name, help, label_names, buckets=BUCKETS):
+    self.name = name
+    self.help = help
+    self.label_names = label_names
+    self.buckets = buckets
+    self._series = {}
+    self._lock = threading.Lock()
+
+  def observe(self, labels, value):
+    with self._lock:
+      series = self._series.get(labels)
+      if series is None:
+        series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+      counts = series[0]
+      for index, bound in enumerate(self.buckets):
+        if value <= bound:
+          counts[index] += 1
+      series[1] += value
+      series[2] += 1
+
+  def render(self):
+    lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+    with self._lock:
+      series = sorted(self._series.items())
+      for labels, (counts, total, count) in series:
+        for bound, bucket_count in zip(self.buckets, counts):
+          le = 'le="%s"' % bound
+          lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le)} {bucket_count}')
+        le = 'le="+Inf"'
+        lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le)} {count}')
+        lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {total}')
+        lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {count}')
+    return lines
+
+class Counter:
+  def __init__(self, name, help, label_names):
+    self.name = name
+    self.help = help
+    self.label_names = label_names
+    self._values = {}
+    self._lock = threading.Lock()
+
+  def inc(self, labels, amount=1):
+    with self._lock:
+      self._values[labels] = self._values.get(labels, 0) + amount
+
+  def render(self):
+    lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+    with self._lock:
+      for labels, value in sorted(self._values.items()):
+        lines.append(f'{self.name}{_labels(self.label_names, labels)} {value}')
+    return lines
+
+class Profiler:
+  def __init__(self, slow_query_ms=100):
+    self.slow_query_ms = slow_query_ms
+    self.requests = Histogram(
+      'langportal_http_request_duration_seconds',
+      'Time to handle a request, until the response is returned (streamed bodies not included).',
+      ('method', 'route', 'status')
+    )
+    self.statements = Histogram(
+      'langportal_sql_statement_duration_seconds',
+      'Time spent executing a SQL statement and fetching its rows.',
+      ('statement',)
+    )
+    self.statement_rows = Counter(
+      'langportal_sql_statement_rows_total',
+      'Rows returned (SELECT) or changed (INSERT/UPDATE/DELETE) by a SQL statement.',
+      ('statement',)
+    )
+    self.slow_statements = Counter(
+      'langportal_sql_slow_statements_total',
+      'SQL statements slower than the slow query threshold.',
+      ('statement',)
+    )
+    # Cursors with a SELECT whose rows may not all have been fetched yet,
+    # finished once the response has been sent
+    self._pending = threading.local()
+
+  def observe_statement(self, sql, seconds, rows):
+    label = (fingerprint(sql),)
+    self.statements.observe(label, seconds)
+    self.statement_rows.inc(label, rows)
+    if has_app_context() and 'profile_db_seconds' in g:
+      g.profile_db_seconds += seconds
+    if seconds * 1000 >= self.slow_query_ms:
+      self.slow_statements.inc(label)
+      slow_query_log.warning('%.1f ms, %d rows: %s', seconds * 1000, rows, ' '.join(sql.split()))
+
+  def track(self, cursor):
+    pending = getattr(self._pending, 'cursors', None)
+    if pending is None:
+      pending = self._pending.cursors = set()
+    pending.add(cursor)
+
+  def untrack(self, cursor):
+    getattr(self._pending, 'cursors', set()).discard(cursor)
+
+  def flush(self):
+    for cursor in list(getattr(self._pending, 'cursors', ())):
+      cursor.finish_statement()
+
+  def render(self):
+    lines = []
+    for metric in (self.requests, self.statements, self.statement_rows, self.slow_statements):
+      lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+  def init_app(self, app):
+    @app.before_request
+    def start_timer():
+      g.profile_started_at = time.perf_counter()
+      g.profile_db_seconds = 0.0
+
+    @app.after_request
+    def record_request(response):
+      if 'profile_started_at' in g:
+        elapsed = time.perf_counter() - g.profile_started_at
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        self.requests.observe((request.method, route, response.status_code), elapsed)
+        response.headers['Server-Timing'] = (
+          f'app;dur={elapsed * 1000:.1f}, db;dur={g.profile_db_seconds * 1000:.1f}'
+        )
+      # Streamed responses keep fetching rows after the request has been
+      # torn down, so their statements are finished once the body is sent
+      response.call_on_close(self.flush)
+      return response
+
+    @app.teardown_request
+    def finish_statements(exception):
+      # after_request doesn't run for unhandled errors
+      if exception is not None:
+        self.flush()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+      return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+# Connection and cursor classes used by the pools when profiling is on
+class ProfiledConnection(sqlite3.Connection):
+  profiler = None
+
+  def cursor(self, factory=None):
+    return super().cursor(factory or ProfiledCursor)
+
+class ProfiledCursor(sqlite3.Cursor):
+  _statement = None
+
+  def _profiler(self):
+    return self.connection.profiler
+
+  def _timed(self, method, *args):
+    started_at = time.perf_counter()
+    try:
+      return method(*args)
+    finally:
+      self._elapsed = time.perf_counter() - started_at
+
+  def execute(self, sql, parameters=()):
+    self.finish_statement()
+    self._timed(super().execute, sql, parameters)
+    self._start_statement(sql)
+    return self
+
+  def executemany(self, sql, seq_of_parameters):
+    self.finish_statement()
+    self._timed(super().executemany, sql, seq_of_parameters)
+    self._start_statement(sql)
+    return self
+
+  def _start_statement(self, sql):
+    if self.description is None:
+      # Nothing to fetch, rowcount is the number of changed rows
+      self._statement = [sql, self._elapsed, max(self.rowcount, 0)]
+      self.finish_statement()
+    else:
+      self._statement = [sql, self._elapsed, 0]
+      self._profiler().track(self)
+
+  def _fetched(self, rows, done):
+    if self._statement is not None:
+      self._statement[1] += self._elapsed
+      self._statement[2] += rows
+      if done:
+        self.finish_statement()
+
+  def finish_statement(self):
+    statement, self._statement = self._statement, None
+    if statement is not None:
+      profiler = self._profiler()
+      profiler.untrack(self)
+      profiler.observe_statement(*statement)
+
+  def fetchone(self):
+    row = self._timed(super().fetchone)
+    self._fetched(1 if row is not None else 0, row is None)
+    return row
+
+  def fetchmany(self, size=None):
+    size = self.arraysize if size is None else size
+    rows = self._timed(super().fetchmany, size)
+    self._fetched(len(rows), len(rows) < size)
+    return rows
+
+  def fetchall(self):
+    rows = self._timed(super().fetchall)
+    self._fetched(len(rows), True)
+    return rows
+
+  def __next__(self):
+    try:
+      row = self._timed(super().__next__)
+    except StopIteration:
+      self._fetched(0, True)
+      raise
+    self._fetched(1, False)
+    return row
+
+  def close(self):
+    self.finish_statement()
+    super().close()
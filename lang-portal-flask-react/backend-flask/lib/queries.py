@@ -0,0 +1,604 @@
+# SQL used by the route handlers, shared by the Flask app (routes/) and the
+# ASGI app (asgi.py, routes_async/) so both serve exactly the same data.
+#
+# Statements with {placeholders} are completed with str.format by the
+# caller: {sort_by} / {order} with a validated column and direction, {where} /
+# {order_by} with the condition and ordering built by lib.pagination.Keyset.
+# Everything else is passed as query parameters.
+#
+# Study sessions, reviews and the dashboard rollups belong to a user (see
+# lib/users.py): those statements take the user id, mostly as their first
+# parameter. Words, groups and study activities are shared.
+
+# Words ----------
+
+WORD_LIST_COLUMNS = '''
+  w.id, w.kanji, w.romaji, w.english,
+  COALESCE(r.correct_count, 0) AS correct_count,
+  COALESCE(r.wrong_count, 0) AS wrong_count
+'''
+
+WORDS_PAGE = f'''
+  SELECT {WORD_LIST_COLUMNS}
+  FROM words w
+  LEFT JOIN word_reviews r ON r.user_id = ? AND r.word_id = w.id
+  ORDER BY {{sort_by}} {{order}}
+  LIMIT ? OFFSET ?
+'''
+
+WORDS_KEYSET = f'''
+  SELECT {WORD_LIST_COLUMNS}
+  FROM words w
+  LEFT JOIN word_reviews r ON r.user_id = ? AND r.word_id = w.id
+  WHERE {{where}}
+  ORDER BY {{order_by}}
+  LIMIT ?
+'''
+
+# Pages sorted by a review counter (correct_count / wrong_count) are read in
+# two legs and merged by routes.words.count_sorted_rows, so neither leg
+# sorts or reads past the page: the user's word_reviews rows walked along
+# idx_word_reviews_user_<counter>, and the words without a row (a count of
+# 0) walked by id between two bounds. {column} is the counter, {where} /
+# {order} come from routes.words.reviewed_words_statement and
+# unreviewed_words_statement.
+REVIEWED_WORDS_BY_COUNT = f'''
+  SELECT {WORD_LIST_COLUMNS}
+  FROM word_reviews r
+  CROSS JOIN words w ON w.id = r.word_id
+  WHERE r.user_id = ?{{where}}
+  ORDER BY r.{{column}} {{order}}, r.word_id {{order}}
+  LIMIT ?
+'''
+
+UNREVIEWED_WORDS = '''
+  SELECT w.id, w.kanji, w.romaji, w.english, 0 AS correct_count, 0 AS wrong_count
+  FROM words w
+  WHERE w.id > ? AND w.id < ?
+    AND NOT EXISTS (SELECT 1 FROM word_reviews r WHERE r.user_id = ? AND r.word_id = w.id)
+  ORDER BY w.id {order}
+  LIMIT ?
+'''
+
+WORDS_COUNT = 'SELECT COUNT(*) FROM words'
+
+WORD_EXISTS = 'SELECT id FROM words WHERE id = ?'
+
+WORD_DETAIL = '''
+  SELECT w.id, w.kanji, w.romaji, w.english,
+         COALESCE(r.correct_count, 0) AS correct_count,
+         COALESCE(r.wrong_count, 0) AS wrong_count,
+         GROUP_CONCAT(DISTINCT g.id || '::' || g.name) as groups
+  FROM words w
+  LEFT JOIN word_reviews r ON r.user_id = ? AND r.word_id = w.id
+  LEFT JOIN word_groups wg ON w.id = wg.word_id
+  LEFT JOIN groups g ON wg.group_id = g.id
+  WHERE w.id = ?
+  GROUP BY w.id
+'''
+
+# Ranked matches from the words_fts trigram index (see lib/search.py).
+# Words equal to one of the terms (a JSON array) come first, then by BM25
+# with kanji matches weighted above romaji and romaji above English.
+SEARCH_WORDS = f'''
+  SELECT {WORD_LIST_COLUMNS}
+  FROM words_fts
+  JOIN words w ON w.id = words_fts.rowid
+  LEFT JOIN word_reviews r ON r.user_id = ? AND r.word_id = w.id
+  WHERE words_fts MATCH ?
+  ORDER BY EXISTS (
+             SELECT 1 FROM json_each(?) t
+             WHERE t.value IN (w.kanji, lower(w.romaji), lower(w.english))
+           ) DESC,
+           bm25(words_fts, 10.0, 5.0, 1.0)
+  LIMIT ?
+'''
+
+# Queries too short for the trigram index are prefix matches on the kanji,
+# romaji and English indexes, shortest words first
+SEARCH_WORDS_PREFIX = f'''
+  SELECT {WORD_LIST_COLUMNS}
+  FROM words w
+  LEFT JOIN word_reviews r ON r.user_id = ? AND r.word_id = w.id
+  WHERE w.id IN (
+    SELECT id FROM (SELECT id FROM words WHERE kanji >= ? AND kanji < ? ORDER BY kanji, id LIMIT ?)
+    UNION
+    SELECT id FROM (SELECT id FROM words WHERE romaji >= ? AND romaji < ? ORDER BY romaji, id LIMIT ?)
+    UNION
+    SELECT id FROM (SELECT id FROM words WHERE english >= ? AND english < ? ORDER BY english, id LIMIT ?)
+  )
+  ORDER BY length(w.kanji), w.id
+  LIMIT ?
+'''
+
+# Ids out of a JSON array of word ids that exist, checked in one query
+KNOWN_WORDS = '''
+  SELECT w.id FROM words w
+  JOIN json_each(?) ids ON ids.value = w.id
+'''
+
+# Loaded by lib/vocabulary.py, the in-memory copy of the vocabulary
+VOCABULARY_WORDS = 'SELECT id, kanji, romaji, english FROM words ORDER BY id'
+
+VOCABULARY_GROUPS = 'SELECT word_id, group_id FROM word_groups ORDER BY word_id, group_id'
+
+USER_WORD_COUNTS = 'SELECT word_id, correct_count, wrong_count FROM word_reviews WHERE user_id = ?'
+
+# Groups ----------
+
+GROUPS_PAGE = '''
+  SELECT id, name, words_count
+  FROM groups
+  ORDER BY {sort_by} {order}
+  LIMIT ? OFFSET ?
+'''
+
+GROUPS_COUNT = 'SELECT COUNT(*) FROM groups'
+
+GROUPS_ALL = 'SELECT id, name FROM groups'
+
+GROUP_EXISTS = 'SELECT id FROM groups WHERE id = ?'
+
+GROUP_NAME = 'SELECT name FROM groups WHERE id = ?'
+
+GROUP_DETAIL = '''
+  SELECT id, name, words_count
+  FROM groups
+  WHERE id = ?
+'''
+
+GROUP_WORDS_PAGE = f'''
+  SELECT {WORD_LIST_COLUMNS}
+  FROM words w
+  JOIN word_groups wg ON w.id = wg.word_id
+  LEFT JOIN word_reviews r ON r.user_id = ? AND r.word_id = w.id
+  WHERE wg.group_id = ?
+  ORDER BY {{sort_by}} {{order}}
+  LIMIT ? OFFSET ?
+'''
+
+GROUP_WORDS_KEYSET = f'''
+  SELECT {WORD_LIST_COLUMNS}
+  FROM words w
+  JOIN word_groups wg ON w.id = wg.word_id
+  LEFT JOIN word_reviews r ON r.user_id = ? AND r.word_id = w.id
+  WHERE wg.group_id = ? AND {{where}}
+  ORDER BY {{order_by}}
+  LIMIT ?
+'''
+
+# The two legs of a group's count-sorted page, see REVIEWED_WORDS_BY_COUNT.
+# CROSS JOIN keeps word_reviews the outer loop so its index gives the order.
+GROUP_REVIEWED_WORDS_BY_COUNT = f'''
+  SELECT {WORD_LIST_COLUMNS}
+  FROM word_reviews r
+  CROSS JOIN word_groups wg ON wg.group_id = ? AND wg.word_id = r.word_id
+  CROSS JOIN words w ON w.id = r.word_id
+  WHERE r.user_id = ?{{where}}
+  ORDER BY r.{{column}} {{order}}, r.word_id {{order}}
+  LIMIT ?
+'''
+
+GROUP_UNREVIEWED_WORDS = '''
+  SELECT w.id, w.kanji, w.romaji, w.english, 0 AS correct_count, 0 AS wrong_count
+  FROM word_groups wg
+  JOIN words w ON w.id = wg.word_id
+  WHERE wg.group_id = ? AND wg.word_id > ? AND wg.word_id < ?
+    AND NOT EXISTS (SELECT 1 FROM word_reviews r WHERE r.user_id = ? AND r.word_id = wg.word_id)
+  ORDER BY wg.word_id {order}
+  LIMIT ?
+'''
+
+GROUP_WORDS_COUNT = '''
+  SELECT COUNT(*)
+  FROM word_groups
+  WHERE group_id = ?
+'''
+
+# Each word's JSON is kept pre-rendered in words.payload (see
+# sql/migrations/0005_words_payload.sql)
+GROUP_WORDS_RAW = '''
+  SELECT w.payload
+  FROM word_groups wg
+  JOIN words w ON w.id = wg.word_id
+  WHERE wg.group_id = ?
+  ORDER BY wg.word_id
+'''
+
+# Study sessions for a group. Review counts and last activity are
+# maintained on study_sessions, so this needs no per session queries
+GROUP_SESSIONS = '''
+  SELECT
+    s.id,
+    s.group_id,
+    s.study_activity_id,
+    s.created_at as start_time,
+    COALESCE(s.ended_at, s.last_activity_at, s.created_at) as end_time,
+    a.name as activity_name,
+    g.name as group_name,
+    s.correct_count + s.wrong_count as review_count
+  FROM study_sessions s
+  JOIN study_activities a ON s.study_activity_id = a.id
+  JOIN groups g ON s.group_id = g.id
+  WHERE s.user_id = ? AND s.group_id = ?
+'''
+
+GROUP_SESSIONS_PAGE = f'''
+  {GROUP_SESSIONS}
+  ORDER BY {{sort_by}} {{order}}
+  LIMIT ? OFFSET ?
+'''
+
+# Sort expressions refer to the columns of GROUP_SESSIONS so computed values
+# like review_count can be seeked on
+GROUP_SESSIONS_KEYSET = f'''
+  SELECT *, {{sort_by}} AS sort_value
+  FROM ({GROUP_SESSIONS})
+  WHERE {{where}}
+  ORDER BY {{order_by}}
+  LIMIT ?
+'''
+
+GROUP_SESSIONS_COUNT = '''
+  SELECT COUNT(*)
+  FROM study_sessions
+  WHERE user_id = ? AND group_id = ?
+'''
+
+# Study sessions ----------
+
+SESSION_COLUMNS = '''
+  ss.id,
+  ss.group_id,
+  g.name as group_name,
+  sa.id as activity_id,
+  sa.name as activity_name,
+  ss.created_at,
+  COALESCE(ss.ended_at, ss.last_activity_at, ss.created_at) as end_time,
+  ss.correct_count + ss.wrong_count as review_items_count
+'''
+
+SESSIONS_FROM = '''
+  FROM study_sessions ss
+  JOIN groups g ON g.id = ss.group_id
+  JOIN study_activities sa ON sa.id = ss.study_activity_id
+'''
+
+SESSIONS_PAGE = f'''
+  SELECT {SESSION_COLUMNS}
+  {SESSIONS_FROM}
+  WHERE ss.user_id = ?
+  ORDER BY ss.created_at DESC
+  LIMIT ? OFFSET ?
+'''
+
+SESSIONS_KEYSET = f'''
+  SELECT {SESSION_COLUMNS}
+  {SESSIONS_FROM}
+  WHERE ss.user_id = ? AND {{where}}
+  ORDER BY {{order_by}}
+  LIMIT ?
+'''
+
+# Total kept in the dashboard rollup so no table scan is needed
+SESSIONS_COUNT = '''
+  SELECT COALESCE((SELECT total_sessions FROM dashboard_stats WHERE user_id = ?), 0) as count
+'''
+
+# A session of another user is "not found"
+SESSION_EXISTS = 'SELECT id FROM study_sessions WHERE user_id = ? AND id = ?'
+
+SESSION_DETAIL = f'''
+  SELECT {SESSION_COLUMNS}
+  {SESSIONS_FROM}
+  WHERE ss.user_id = ? AND ss.id = ?
+'''
+
+# Reviews of one session, from word_review_items and (once archived by
+# lib/maintenance.py) word_review_archive. Takes the session id twice,
+# check that it is the user's with SESSION_EXISTS or SESSION_DETAIL first.
+SESSION_REVIEWS = '''
+  WITH session_reviews AS (
+    SELECT word_id, correct = 1 AS correct_count, correct = 0 AS wrong_count
+    FROM word_review_items
+    WHERE study_session_id = ?
+    UNION ALL
+    SELECT word_id, correct_count, wrong_count
+    FROM word_review_archive
+    WHERE study_session_id = ?
+  )
+'''
+
+# Words reviewed in a session with their review status in that session
+SESSION_WORDS_PAGE = f'''
+  {SESSION_REVIEWS}
+  SELECT
+    w.*,
+    SUM(sr.correct_count) as session_correct_count,
+    SUM(sr.wrong_count) as session_wrong_count
+  FROM session_reviews sr
+  JOIN words w ON w.id = sr.word_id
+  GROUP BY w.id
+  ORDER BY w.kanji
+  LIMIT ? OFFSET ?
+'''
+
+SESSION_WORDS_COUNT = f'''
+  {SESSION_REVIEWS}
+  SELECT COUNT(DISTINCT word_id) as count
+  FROM session_reviews
+'''
+
+INSERT_SESSION = '''
+  INSERT INTO study_sessions (user_id, group_id, study_activity_id, created_at)
+  VALUES (?, ?, ?, ?)
+'''
+
+# Ending an already ended session keeps the first time
+END_SESSION = 'UPDATE study_sessions SET ended_at = COALESCE(ended_at, ?) WHERE user_id = ? AND id = ?'
+
+SESSION_ENDED_AT = 'SELECT ended_at FROM study_sessions WHERE id = ?'
+
+# Totals pushed to the live session streams (lib/events.py), read from the
+# session row the review trigger keeps up to date
+SESSION_PROGRESS = '''
+  SELECT id,
+    correct_count,
+    wrong_count,
+    correct_count + wrong_count AS review_items_count,
+    COALESCE(ended_at, last_activity_at, created_at) AS end_time,
+    ended_at
+  FROM study_sessions
+  WHERE user_id = ? AND id = ?
+'''
+
+# A user's review history is deleted in batches
+# (lib.maintenance.delete_in_batches) so no single transaction, and with it
+# the WAL, grows with the history. Each statement takes the user id.
+RESET_SESSIONS_BATCHES = [
+  'DELETE FROM word_review_items WHERE id IN (SELECT id FROM word_review_items WHERE user_id = ? LIMIT ?)',
+  '''DELETE FROM word_review_archive WHERE study_session_id IN (
+       SELECT a.study_session_id FROM study_sessions ss
+       JOIN word_review_archive a ON a.study_session_id = ss.id
+       WHERE ss.user_id = ? LIMIT ?
+     )'''
+]
+
+# Then whatever was logged in the meantime goes with the sessions in one
+# transaction. Reviews have a foreign key to the sessions, so they go first.
+# The user's dashboard rollups go with them, which leaves them as a rebuild
+# (sql/dashboard/rebuild_stats.sql) would. Each statement takes the user id.
+RESET_SESSIONS = [
+  'DELETE FROM word_review_items WHERE user_id = ?',
+  '''DELETE FROM word_review_archive
+     WHERE study_session_id IN (SELECT id FROM study_sessions WHERE user_id = ?)''',
+  'DELETE FROM study_sessions WHERE user_id = ?',
+  'DELETE FROM word_review_stats WHERE user_id = ?',
+  'DELETE FROM study_days WHERE user_id = ?',
+  'DELETE FROM group_activity WHERE user_id = ?',
+  'DELETE FROM dashboard_stats WHERE user_id = ?'
+]
+
+# Reviews ----------
+
+INSERT_REVIEW_ITEM = '''
+  INSERT INTO word_review_items (user_id, word_id, correct, study_session_id, created_at, idempotency_key)
+  VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+# Idempotency keys out of a JSON array that the user has already logged
+LOGGED_REVIEW_KEYS = '''
+  SELECT idempotency_key FROM word_review_items
+  WHERE user_id = ? AND idempotency_key IN (SELECT value FROM json_each(?))
+'''
+
+UPSERT_WORD_REVIEW = '''
+  INSERT INTO word_reviews (user_id, word_id, correct_count, wrong_count, last_reviewed)
+  VALUES (?, ?, ?, ?, ?)
+  ON CONFLICT (user_id, word_id) DO UPDATE SET
+    correct_count = correct_count + excluded.correct_count,
+    wrong_count = wrong_count + excluded.wrong_count,
+    last_reviewed = MAX(last_reviewed, excluded.last_reviewed)
+'''
+
+# The user's scheduling state of the words in a JSON array of word ids
+REVIEW_SCHEDULES = '''
+  SELECT r.word_id, r.ease, r.interval_days, r.repetitions
+  FROM json_each(?) ids
+  JOIN word_reviews r ON r.user_id = ? AND r.word_id = ids.value
+'''
+
+UPDATE_SCHEDULE = '''
+  UPDATE word_reviews
+  SET ease = ?, interval_days = ?, repetitions = ?, due_at = ?
+  WHERE user_id = ? AND word_id = ?
+'''
+
+# Words of a group that are due for the user, most overdue first. Walks
+# idx_word_reviews_user_due_at up to now and checks group membership by index,
+# stopping at the limit. CROSS JOIN keeps SQLite from starting with the
+# group's words and sorting them instead.
+DUE_WORDS = '''
+  SELECT w.id, w.kanji, w.romaji, w.english,
+         r.correct_count, r.wrong_count, r.ease, r.interval_days, r.due_at
+  FROM word_reviews r
+  CROSS JOIN word_groups wg ON wg.group_id = ? AND wg.word_id = r.word_id
+  JOIN words w ON w.id = r.word_id
+  WHERE r.user_id = ? AND r.due_at <= ?
+  ORDER BY r.due_at, r.word_id
+  LIMIT ?
+'''
+
+# Words of a group the user never reviewed, to fill up a due batch
+NEW_WORDS = '''
+  SELECT w.id, w.kanji, w.romaji, w.english,
+         0 AS correct_count, 0 AS wrong_count, NULL AS ease, NULL AS interval_days, NULL AS due_at
+  FROM word_groups wg
+  JOIN words w ON w.id = wg.word_id
+  WHERE wg.group_id = ?
+    AND NOT EXISTS (SELECT 1 FROM word_reviews r WHERE r.user_id = ? AND r.word_id = wg.word_id)
+  ORDER BY wg.word_id
+  LIMIT ?
+'''
+
+# Study activities ----------
+
+ACTIVITIES = 'SELECT id, name, url, preview_url FROM study_activities'
+
+ACTIVITY_DETAIL = 'SELECT id, name, url, preview_url FROM study_activities WHERE id = ?'
+
+ACTIVITY_EXISTS = 'SELECT id FROM study_activities WHERE id = ?'
+
+ACTIVITY_SESSIONS_COUNT = '''
+  SELECT COUNT(*) as count
+  FROM study_sessions ss
+  JOIN groups g ON g.id = ss.group_id
+  WHERE ss.user_id = ? AND ss.study_activity_id = ?
+'''
+
+ACTIVITY_SESSIONS_PAGE = f'''
+  SELECT {SESSION_COLUMNS}
+  {SESSIONS_FROM}
+  WHERE ss.user_id = ? AND ss.study_activity_id = ?
+  ORDER BY ss.created_at DESC
+  LIMIT ? OFFSET ?
+'''
+
+ACTIVITY_SESSIONS_KEYSET = f'''
+  SELECT {SESSION_COLUMNS}
+  {SESSIONS_FROM}
+  WHERE ss.user_id = ? AND ss.study_activity_id = ? AND {{where}}
+  ORDER BY {{order_by}}
+  LIMIT ?
+'''
+
+# Dashboard ----------
+
+# The most recent study session, the counts are maintained on
+# study_sessions as reviews come in
+RECENT_SESSION = '''
+  SELECT
+    ss.id,
+    ss.group_id,
+    sa.name as activity_name,
+    ss.created_at,
+    ss.correct_count,
+    ss.wrong_count
+  FROM study_sessions ss
+  JOIN study_activities sa ON ss.study_activity_id = sa.id
+  WHERE ss.user_id = ?
+  ORDER BY ss.created_at DESC
+  LIMIT 1
+'''
+
+# Totals are kept current by triggers on words, study_sessions and
+# word_review_items (see sql/migrations/0011_users.sql). A user without a
+# session yet has no dashboard_stats row.
+DASHBOARD_STATS = '''
+  SELECT c.total_vocabulary,
+         COALESCE(d.total_sessions, 0) AS total_sessions,
+         COALESCE(d.total_reviews, 0) AS total_reviews,
+         COALESCE(d.total_correct, 0) AS total_correct,
+         COALESCE(d.words_studied, 0) AS words_studied,
+         COALESCE(d.mastered_words, 0) AS mastered_words
+  FROM catalog_stats c
+  LEFT JOIN dashboard_stats d ON d.user_id = ?
+  WHERE c.id = 1
+'''
+
+# Groups the user studied in the last 30 days
+ACTIVE_GROUPS = '''
+  SELECT COUNT(*) as active_groups
+  FROM group_activity
+  WHERE user_id = ? AND last_session_at >= date('now', '-30 days')
+'''
+
+# Consecutive days with at least one study session, over study_days which
+# holds one row per day rather than per session
+CURRENT_STREAK = '''
+  WITH streak_calc AS (
+    SELECT
+      study_date,
+      julianday(study_date) - julianday(lag(study_date, 1) over (order by study_date)) as days_diff
+    FROM study_days
+    WHERE user_id = ?
+  )
+  SELECT COUNT(*) as streak
+  FROM (
+    SELECT study_date
+    FROM streak_calc
+    WHERE days_diff = 1 OR days_diff IS NULL
+    ORDER BY study_date DESC
+  )
+'''
+
+# Exports ----------
+
+# Every word with the user's review counts, in id order after since_id. line
+# is the NDJSON line, rendered by SQLite.
+EXPORT_WORDS = '''
+  SELECT w.id, w.kanji, w.romaji, w.english, w.parts,
+         COALESCE(r.correct_count, 0) AS correct_count,
+         COALESCE(r.wrong_count, 0) AS wrong_count,
+         json_object(
+           'id', w.id,
+           'kanji', w.kanji,
+           'romaji', w.romaji,
+           'english', w.english,
+           'parts', json(w.parts),
+           'correct_count', COALESCE(r.correct_count, 0),
+           'wrong_count', COALESCE(r.wrong_count, 0)
+         ) AS line
+  FROM words w
+  LEFT JOIN word_reviews r ON r.user_id = ? AND r.word_id = w.id
+  WHERE w.id > ?
+  ORDER BY w.id
+'''
+
+# The user's logged reviews and their archived ones (one row per session
+# and word, with the id and time of the last review folded into it). Both
+# legs are read in keyset order from their (user_id, ...) indexes and merged
+# by SQLite, no sort. Takes the user id and the keyset parameters once per
+# leg.
+EXPORT_REVIEWS_TEMPLATE = '''
+  SELECT id, word_id, study_session_id, correct, created_at,
+         correct = 1 AS correct_count, correct = 0 AS wrong_count, 0 AS archived,
+         json_object(
+           'id', id,
+           'word_id', word_id,
+           'study_session_id', study_session_id,
+           'correct', json(CASE WHEN correct THEN 'true' ELSE 'false' END),
+           'created_at', created_at
+         ) AS line
+  FROM word_review_items
+  WHERE user_id = ? AND {where}
+  UNION ALL
+  SELECT last_review_id, word_id, study_session_id, NULL, last_reviewed_at,
+         correct_count, wrong_count, 1,
+         json_object(
+           'id', last_review_id,
+           'word_id', word_id,
+           'study_session_id', study_session_id,
+           'created_at', last_reviewed_at,
+           'correct_count', correct_count,
+           'wrong_count', wrong_count,
+           'archived', json('true')
+         )
+  FROM word_review_archive
+  WHERE user_id = ? AND {archive_where}
+  ORDER BY {order_by}
+'''
+
+# Reviews with id > ?
+EXPORT_REVIEWS = EXPORT_REVIEWS_TEMPLATE.format(
+  where='id > ?',
+  archive_where='last_review_id > ?',
+  order_by='id'
+)
+
+# Reviews created after ? with id > ?
+EXPORT_REVIEWS_SINCE = EXPORT_REVIEWS_TEMPLATE.format(
+  where='created_at > ? AND id > ?',
+  archive_where='last_reviewed_at > ? AND last_review_id > ?',
+  order_by='created_at, id'
+)
@@ -0,0 +1,161 @@
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+
+from flask import g
+
+# Route requests whose SQL is checked with EXPLAIN QUERY PLAN, along with the
+# tables each one is allowed to read in full. Anything else read in full in
+# a plan is reported as a regression: a plain "SCAN <table>" (no index), or
+# any scan of a table in a statement that then sorts its result with
+# "USE TEMP B-TREE FOR ORDER BY", since the sort needs every row first.
+# The sort is reported too, unless 'ORDER BY' is among the allowed names.
+#
+# Allowed scans are for queries that inherently read the whole table, like
+# the dashboard aggregates. Allowed sorts are over rows already narrowed
+# down by an index: search matches, a group's words or sessions, a
+# session's reviews, the small groups table.
+ROUTE_CHECKS = [
+  ('GET', '/words', ()),
+  ('GET', '/words?sort_by=correct_count&order=desc', ()),
+  ('GET', '/words?sort_by=wrong_count&page=3', ()),
+  ('GET', '/words?cursor=', ()),
+  ('GET', '/words?sort_by=correct_count&cursor=', ()),
+  ('GET', '/words?sort_by=wrong_count&order=desc&cursor=', ()),
+  ('GET', '/words/{word_id}', ()),
+  ('GET', '/api/words/search?q=harau', ('ORDER BY',)),
+  ('GET', '/api/words/search?q=ha', ('ORDER BY',)),
+  ('GET', '/api/words/search?q=hxrau', ('ORDER BY',)),
+  ('GET', '/groups', ('groups', 'ORDER BY')),
+  ('GET', '/groups/{group_id}', ()),
+  ('GET', '/groups/{group_id}/words', ('ORDER BY',)),
+  ('GET', '/groups/{group_id}/words?sort_by=correct_count&order=desc', ()),
+  ('GET', '/groups/{group_id}/words?cursor=', ('ORDER BY',)),
+  ('GET', '/groups/{group_id}/words?sort_by=correct_count&cursor=', ()),
+  ('GET', '/groups/{group_id}/words?sort_by=wrong_count&order=desc&cursor=', ()),
+  ('GET', '/api/groups/{group_id}/words/raw', ()),
+  ('GET', '/api/groups/{group_id}/due', ()),
+  ('GET', '/groups/{group_id}/study_sessions', ()),
+  ('GET', '/groups/{group_id}/study_sessions?sort_by=reviewItemsCount&cursor=', ('ORDER BY',)),
+  ('GET', '/api/study-sessions', ()),
+  ('GET', '/api/study-sessions?cursor=', ()),
+  ('GET', '/api/study-sessions/{session_id}', ('ORDER BY',)),
+  ('GET', '/api/study-activities', ('study_activities',)),
+  ('GET', '/api/study-activities/{activity_id}', ()),
+  ('GET', '/api/study-activities/{activity_id}/sessions', ()),
+  ('GET', '/api/study-activities/{activity_id}/launch', ('groups',)),
+  ('GET', '/dashboard/recent-session', ()),
+  ('GET', '/dashboard/stats', ('study_days', 'ORDER BY')),
+  ('GET', '/api/export/words?since_id=1', ()),
+  ('GET', '/api/export/reviews?since=2020-01-01', ()),
+  ('GET', '/api/export/reviews?since_id=1&format=csv', ()),
+  ('POST', '/study_sessions/{session_id}/review', ()),
+]
+
+# Matches a full table scan, e.g. "SCAN words"
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+# Matches any scan, "SCAN w USING INDEX ..." and "SCAN w USING COVERING
+# INDEX ..." included: reading an index in order stops at the LIMIT, unless
+# the rows are sorted afterwards
+SCAN = re.compile(r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$')
+SORT = re.compile(r'^USE TEMP B-TREE FOR (?:\w+ )*?ORDER BY$')
+
+# (plan detail, table alias or None for the sort) of the full reads in a
+# statement's plan
+def full_scans(cursor, sql):
+  details = [row[3] for row in cursor.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()]
+  if not any(SORT.match(detail) for detail in details):
+    return [(detail, FULL_SCAN.match(detail).group(1)) for detail in details if FULL_SCAN.match(detail)]
+  scans = [(detail, SCAN.match(detail).group(1)) for detail in details if SCAN.match(detail)]
+  return scans + [(detail, None) for detail in details if SORT.match(detail)]
+
+# EXPLAIN reports the alias when there is one ("SCAN w"), so the table
+# name comes from the statement itself
+def _table_for_alias(sql, alias):
+  match = re.search(r'(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?' + re.escape(alias) + r'\b', sql, re.IGNORECASE)
+  return match.group(1) if match else alias
+
+# Runs every registered route against a scratch copy of the database and
+# returns a list of (route, sql, plan detail) for unexpected full scans
+def check_query_plans(database):
+  from app import create_app
+
+  scratch_dir = tempfile.mkdtemp()
+  scratch_db = os.path.join(scratch_dir, 'plans.db')
+  source = sqlite3.connect(database)
+  target = sqlite3.connect(scratch_db)
+  source.backup(target)
+  source.close()
+  target.close()
+
+  try:
+    app = create_app({'DATABASE': scratch_db})
+    statements = []
+
+    @app.before_request
+    def trace_statements():
+      for connection in (app.db.get(), app.db.get_read()):
+        connection.set_trace_callback(statements.append)
+
+    @app.teardown_request
+    def stop_tracing(exception):
+      for key in ('db', 'db_read'):
+        if key in g:
+          g.get(key).set_trace_callback(None)
+
+    client = app.test_client()
+    ids = _sample_ids(app, client)
+
+    problems = []
+    connection = sqlite3.connect(scratch_db)
+    cursor = connection.cursor()
+    for method, url, allowed in ROUTE_CHECKS:
+      url = url.format(**ids)
+      statements.clear()
+      if method == 'POST':
+        response = client.post(url, json={'word_id': ids['word_id'], 'correct': True})
+      else:
+        response = client.get(url)
+      # Drain streamed responses so their request context is torn down
+      response.get_data()
+      response.close()
+      if response.status_code >= 400:
+        problems.append((url, None, f'HTTP {response.status_code}'))
+        continue
+
+      for sql in statements:
+        if not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')):
+          continue
+        # Scanning a CTE's result is fine, the tables inside it are checked
+        cte_names = set(re.findall(r'(\w+)\s+AS\s*\(', sql, re.IGNORECASE))
+        for detail, alias in full_scans(cursor, sql):
+          table = 'ORDER BY' if alias is None else _table_for_alias(sql, alias)
+          if table not in allowed and table not in cte_names:
+            problems.append((url, ' '.join(sql.split()), detail))
+    connection.close()
+    return problems
+  finally:
+    app.db.dispose()
+    shutil.rmtree(scratch_dir, ignore_errors=True)
+
+# Ids to plug into the route templates, creating a study session with a
+# review in the scratch database if there is none yet
+def _sample_ids(app, client):
+  connection = sqlite3.connect(app.config['DATABASE'])
+  try:
+    word_id, group_id = connection.execute('SELECT word_id, group_id FROM word_groups LIMIT 1').fetchone()
+    activity_id = connection.execute('SELECT id FROM study_activities LIMIT 1').fetchone()[0]
+  finally:
+    connection.close()
+
+  response = client.post('/study_sessions', json={'group_id': group_id, 'study_activity_id': activity_id})
+  session_id = response.get_json()['session_id']
+  client.post(f'/study_sessions/{session_id}/review', json={'word_id': word_id, 'correct': True})
+  return {
+    'word_id': word_id,
+    'group_id': group_id,
+    'activity_id': activity_id,
+    'session_id': session_id
+  }
@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+# SM-2 spaced repetition. Every word has an ease factor, the current
+# interval in days and the number of correct reviews in a row. A correct
+# answer grows the interval (1 day, 6 days, then interval * ease), a wrong
+# one starts the word over at 1 day and lowers its ease.
+#
+# Reviews are pass/fail, so they map onto SM-2 grades 4 and 1.
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+CORRECT_GRADE = 4
+WRONG_GRADE = 1
+
+# Longest interval, without it a word answered correctly often enough would
+# get a due date past the year 9999
+MAX_INTERVAL_DAYS = 36500
+
+# Returns the new (ease, interval_days, repetitions, due_at)
+def schedule(ease, interval_days, repetitions, correct, reviewed_at):
+  grade = CORRECT_GRADE if correct else WRONG_GRADE
+  if grade >= 3:
+    if repetitions == 0:
+      interval_days = 1
+    elif repetitions == 1:
+      interval_days = 6
+    else:
+      interval_days = min(MAX_INTERVAL_DAYS, round(interval_days * ease, 2))
+    repetitions += 1
+  else:
+    repetitions = 0
+    interval_days = 1
+  ease = max(MIN_EASE, ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+  return ease, interval_days, repetitions, reviewed_at + timedelta(days=interval_days)
+
+# Parameters for queries.UPDATE_SCHEDULE. states maps word_id to the
+# user's current (ease, interval_days, repetitions), items are the review
+# rows from routes.study_sessions.review_rows, applied in the order they
+# happened.
+def schedule_rows(states, items):
+  states = dict(states)
+  due = {}
+  for user_id, word_id, correct, session_id, created_at, _ in sorted(items, key=lambda item: item[4]):
+    ease, interval_days, repetitions = states.get(word_id, (DEFAULT_EASE, 0, 0))
+    ease, interval_days, repetitions, due_at = schedule(ease, interval_days, repetitions, correct, created_at)
+    states[word_id] = (ease, interval_days, repetitions)
+    due[word_id] = (due_at, user_id)
+  return [(*states[word_id], due_at, user_id, word_id) for word_id, (due_at, user_id) in due.items()]
@@ -0,0 +1,198 @@
+import json
+import re
+import unicodedata
+
+from lib import queries
+
+# Query side of GET /api/words/search. The words_fts index (see
+# sql/migrations/0009_words_search.sql) uses the trigram tokenizer, so any
+# substring of three or more characters of the kanji, romaji or English
+# matches. Queries are normalized here so that kana and the common romaji
+# spellings find the Hepburn romaji stored in words.romaji:
+#
+#   はらう, ハラウ, harau, HARAU -> harau
+#   benkyō, benkyô, benkyoo -> benkyou (and benkyoo)
+#   si, ti, tu, hu, zi (Kunrei) -> shi, chi, tsu, fu, ji
+
+# Shortest query the trigram index can answer, shorter ones use the prefix
+# indexes on words instead
+MIN_FTS_LENGTH = 3
+
+# Fuzzy matches need at least this similarity() to the query
+MIN_SIMILARITY = 0.3
+
+# Candidates fetched per requested result when falling back to fuzzy matching
+FUZZY_CANDIDATES = 5
+
+KANA = {
+  'あ': 'a', 'い': 'i', 'う': 'u', 'え': 'e', 'お': 'o',
+  'か': 'ka', 'き': 'ki', 'く': 'ku', 'け': 'ke', 'こ': 'ko',
+  'さ': 'sa', 'し': 'shi', 'す': 'su', 'せ': 'se', 'そ': 'so',
+  'た': 'ta', 'ち': 'chi', 'つ': 'tsu', 'て': 'te', 'と': 'to',
+  'な': 'na', 'に': 'ni', 'ぬ': 'nu', 'ね': 'ne', 'の': 'no',
+  'は': 'ha', 'ひ': 'hi', 'ふ': 'fu', 'へ': 'he', 'ほ': 'ho',
+  'ま': 'ma', 'み': 'mi', 'む': 'mu', 'め': 'me', 'も': 'mo',
+  'や': 'ya', 'ゆ': 'yu', 'よ': 'yo',
+  'ら': 'ra', 'り': 'ri', 'る': 'ru', 'れ': 're', 'ろ': 'ro',
+  'わ': 'wa', 'ゐ': 'i', 'ゑ': 'e', 'を': 'o', 'ん': 'n',
+  'が': 'ga', 'ぎ': 'gi', 'ぐ': 'gu', 'げ': 'ge', 'ご': 'go',
+  'ざ': 'za', 'じ': 'ji', 'ず': 'zu', 'ぜ': 'ze', 'ぞ': 'zo',
+  'だ': 'da', 'ぢ': 'ji', 'づ': 'zu', 'で': 'de', 'ど': 'do',
+  'ば': 'ba', 'び': 'bi', 'ぶ': 'bu', 'べ': 'be', 'ぼ': 'bo',
+  'ぱ': 'pa', 'ぴ': 'pi', 'ぷ': 'pu', 'ぺ': 'pe', 'ぽ': 'po',
+  'ぁ': 'a', 'ぃ': 'i', 'ぅ': 'u', 'ぇ': 'e', 'ぉ': 'o', 'ゔ': 'vu',
+}
+
+# Combinations with a small ya/yu/yo (and small vowels in loanwords)
+KANA_DIGRAPHS = {
+  'きゃ': 'kya', 'きゅ': 'kyu', 'きょ': 'kyo',
+  'しゃ': 'sha', 'しゅ': 'shu', 'しょ': 'sho', 'しぇ': 'she',
+  'ちゃ': 'cha', 'ちゅ': 'chu', 'ちょ': 'cho', 'ちぇ': 'che',
+  'にゃ': 'nya', 'にゅ': 'nyu', 'にょ': 'nyo',
+  'ひゃ': 'hya', 'ひゅ': 'hyu', 'ひょ': 'hyo',
+  'みゃ': 'mya', 'みゅ': 'myu', 'みょ': 'myo',
+  'りゃ': 'rya', 'りゅ': 'ryu', 'りょ': 'ryo',
+  'ぎゃ': 'gya', 'ぎゅ': 'gyu', 'ぎょ': 'gyo',
+  'じゃ': 'ja', 'じゅ': 'ju', 'じょ': 'jo', 'じぇ': 'je',
+  'びゃ': 'bya', 'びゅ': 'byu', 'びょ': 'byo',
+  'ぴゃ': 'pya', 'ぴゅ': 'pyu', 'ぴょ': 'pyo',
+  'ふぁ': 'fa', 'ふぃ': 'fi', 'ふぇ': 'fe', 'ふぉ': 'fo',
+  'てぃ': 'ti', 'でぃ': 'di', 'うぃ': 'wi', 'うぇ': 'we', 'うぉ': 'wo',
+}
+
+# Kunrei / Nihon-shiki spellings and long vowel marks, rewritten to the
+# Hepburn style used by the seed data
+ROMAJI_SPELLINGS = [
+  ('ā', 'aa'), ('ī', 'ii'), ('ū', 'uu'), ('ē', 'ei'), ('ō', 'ou'),
+  ('â', 'aa'), ('î', 'ii'), ('û', 'uu'), ('ê', 'ei'), ('ô', 'ou'),
+  ('sya', 'sha'), ('syu', 'shu'), ('syo', 'sho'), ('si', 'shi'),
+  ('tya', 'cha'), ('tyu', 'chu'), ('tyo', 'cho'), ('ti', 'chi'), ('tu', 'tsu'),
+  ('zya', 'ja'), ('zyu', 'ju'), ('zyo', 'jo'), ('zi', 'ji'), ('hu', 'fu'),
+  ("n'", 'n'),
+]
+
+def katakana_to_hiragana(text):
+  return ''.join(chr(ord(c) - 0x60) if 'ァ' <= c <= 'ヶ' else c for c in text)
+
+def is_kana(text):
+  return bool(text) and all('ぁ' <= c <= 'ゖ' or 'ァ' <= c <= 'ヺ' or c == 'ー' for c in text)
+
+def kana_to_romaji(text):
+  text = katakana_to_hiragana(text)
+  romaji = ''
+  double_next = False
+  index = 0
+  while index < len(text):
+    syllable = KANA_DIGRAPHS.get(text[index:index + 2])
+    if syllable:
+      index += 2
+    else:
+      char = text[index]
+      index += 1
+      if char == 'っ':
+        double_next = True
+        continue
+      if char == 'ー':
+        # Long vowel mark repeats the previous vowel
+        romaji += romaji[-1:] if romaji[-1:] in 'aiueo' else ''
+        continue
+      syllable = KANA.get(char, char)
+    if double_next:
+      syllable = ('t' if syllable.startswith('ch') else syllable[0]) + syllable
+      double_next = False
+    romaji += syllable
+  return romaji
+
+def normalize_romaji(text):
+  # Already Hepburn spellings (shi, chi, tsu) must not be rewritten again
+  text = text.lower()
+  text = re.sub(r'sh|ch|ts', lambda match: match.group(0).upper(), text)
+  for spelling, hepburn in ROMAJI_SPELLINGS:
+    text = text.replace(spelling, hepburn)
+  return text.lower()
+
+# Splits a query into the text to look for in every column and the romaji
+# spellings of it to look for in words.romaji
+def query_terms(q):
+  q = unicodedata.normalize('NFKC', q).strip()
+  if is_kana(q):
+    romaji_terms = [kana_to_romaji(q)]
+  elif re.fullmatch(r"[a-zA-Zāīūēōâîûêô' -]+", q):
+    romaji = normalize_romaji(q)
+    # Long vowels are written both ways (toori / touri)
+    romaji_terms = [romaji, romaji.replace('ou', 'oo'), romaji.replace('oo', 'ou')]
+  else:
+    romaji_terms = []
+  return q, [term for term in dict.fromkeys(romaji_terms) if term and term != q]
+
+def _fts_string(term):
+  return '"' + term.replace('"', '""') + '"'
+
+# FTS5 MATCH expression finding the query as a substring of any column, or
+# one of its romaji spellings in the romaji column. Empty when every term is
+# too short for the trigram index.
+def match_expression(q, romaji_terms):
+  parts = [_fts_string(q)] if len(q) >= MIN_FTS_LENGTH else []
+  parts += ['romaji : ' + _fts_string(term) for term in romaji_terms if len(term) >= MIN_FTS_LENGTH]
+  return ' OR '.join(parts)
+
+def trigrams(text):
+  text = text.lower()
+  return {text[i:i + 3] for i in range(len(text) - 2)}
+
+# MATCH expression for words sharing any trigram with the terms, the
+# candidates are then filtered and ranked with similarity()
+def fuzzy_expression(terms):
+  grams = set()
+  for term in terms:
+    grams |= trigrams(term)
+  return ' OR '.join(_fts_string(gram) for gram in sorted(grams))
+
+# Trigram similarity (Dice coefficient) between the closest term and column
+def similarity(terms, word):
+  best = 0
+  for term in terms:
+    term_grams = trigrams(term)
+    if not term_grams:
+      continue
+    for column in ('kanji', 'romaji', 'english'):
+      column_grams = trigrams(word[column] or '')
+      if column_grams:
+        best = max(best, 2 * len(term_grams & column_grams) / (len(term_grams) + len(column_grams)))
+  return best
+
+# Upper bound for a prefix range scan, e.g. kanji >= 'ab' AND kanji < prefix_end('ab')
+def prefix_end(prefix):
+  return prefix + '\U0010ffff'
+
+# Statement and parameters for a search, the trigram index when the query
+# is long enough, the prefix indexes otherwise. Review counts are the user's.
+def search_statement(user_id, q, romaji_terms, limit):
+  expression = match_expression(q, romaji_terms)
+  if expression:
+    return queries.SEARCH_WORDS, (user_id, expression, json.dumps([q.lower(), *romaji_terms]), limit)
+  lowered = q.lower()
+  romaji = romaji_terms[0] if romaji_terms else lowered
+  return queries.SEARCH_WORDS_PREFIX, (
+    user_id,
+    q, prefix_end(q), limit,
+    romaji, prefix_end(romaji), limit,
+    lowered, prefix_end(lowered), limit,
+    limit
+  )
+
+# Fallback when a search finds nothing, e.g. for typos: words sharing
+# trigrams with the query. None when the query is too short for it.
+def fuzzy_statement(user_id, q, romaji_terms, limit):
+  terms = [q, *romaji_terms]
+  expression = fuzzy_expression(terms)
+  if not expression:
+    return None
+  return queries.SEARCH_WORDS, (user_id, expression, json.dumps([term.lower() for term in terms]), limit * FUZZY_CANDIDATES)
+
+def rank_fuzzy(q, romaji_terms, rows, limit):
+  terms = [q, *romaji_terms]
+  scored = [(similarity(terms, row), row) for row in rows]
+  scored = [(score, row) for score, row in scored if score >= MIN_SIMILARITY]
+  scored.sort(key=lambda item: -item[0])
+  return [row for score, row in scored[:limit]]
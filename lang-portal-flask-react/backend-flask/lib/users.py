@@ -0,0 +1,38 @@
+from flask import g, request, jsonify
+
+# Learners are told apart by the X-User-Id request header, a positive
+# integer. Study sessions, reviews and the dashboard rollups are scoped to
+# it, words, groups and study activities are shared by everyone. There is no
+# authentication here: put the app behind something that does it and sets
+# the header. Requests without the header act as DEFAULT_USER_ID, which is
+# also who owns the history recorded before users existed. A ?user_id=
+# query parameter is accepted in place of the header, for clients that
+# can't set headers like the browser's EventSource.
+
+DEFAULT_USER_ID = 1
+USER_HEADER = 'X-User-Id'
+USER_PARAM = 'user_id'
+
+class UserIdError(ValueError):
+  pass
+
+def parse_user_id(value):
+  if value is None or value == '':
+    return DEFAULT_USER_ID
+  try:
+    user_id = int(value)
+  except (TypeError, ValueError):
+    raise UserIdError(f'{USER_HEADER} must be a positive integer')
+  if user_id < 1:
+    raise UserIdError(f'{USER_HEADER} must be a positive integer')
+  return user_id
+
+# Sets g.user_id for every request, before any database connection is taken
+# (lib/db.py picks the user's shard with it)
+def init_app(app):
+  @app.before_request
+  def load_user():
+    try:
+      g.user_id = parse_user_id(request.headers.get(USER_HEADER) or request.args.get(USER_PARAM))
+    except UserIdError as e:
+      return jsonify({"error": str(e)}), 400
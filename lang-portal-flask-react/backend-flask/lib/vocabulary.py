@@ -0,0 +1,270 @@
+import bisect
+import sqlite3
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+
+from lib import queries
+from lib.pagination import CursorError
+
+# Optional in-memory copy of the vocabulary (VOCABULARY_INDEX in app.py) for
+# the read mostly word listings: GET /words, /words/<id> and
+# /groups/<id>/words are then served without any SQL.
+#
+# Words are stored by column: ids in an array, the strings interned in
+# lists, every group as an array of word positions, and for each sortable
+# text column the positions presorted by (value, id), so a page in either
+# direction is a slice and a keyset page a binary search. Review counts
+# belong to a user: they are loaded from word_reviews the first time a user
+# lists words, kept for the most recent users and updated in place by the
+# review routes. Count orders are sorted when first asked for.
+#
+# Staleness is detected through the response cache's tag versions (see
+# lib/cache.py): an import bumps 'words' and 'groups', which reloads the
+# words, and a 'reviews' bump that did not come with note_reviews (another
+# worker, a reset, an invoke task) drops the loaded counts. The versions
+# must be shared by every worker and the invoke tasks, so app.py only
+# builds the index with CACHE_BACKEND='sqlite'.
+#
+# Counts are loaded without holding the lock. A load that overlaps a review
+# write of this process (begin_reviews to note_reviews) or a 'reviews' bump
+# may or may not include those reviews: it serves its request but is not
+# kept.
+
+TEXT_COLUMNS = ('kanji', 'romaji', 'english')
+COUNT_COLUMNS = ('correct_count', 'wrong_count')
+
+class Catalog:
+  # Snapshot of the words and groups, never changed once loaded
+  def __init__(self, connection):
+    self.ids = array('q')
+    self.columns = {column: [] for column in TEXT_COLUMNS}
+    for row in connection.execute(queries.VOCABULARY_WORDS):
+      self.ids.append(row[0])
+      for column, value in zip(TEXT_COLUMNS, row[1:]):
+        self.columns[column].append(sys.intern(value))
+    self.positions = {word_id: position for position, word_id in enumerate(self.ids)}
+
+    self.group_names = {group_id: name for group_id, name in connection.execute(queries.GROUPS_ALL)}
+    # Positions of each group's words, and the groups of the word at
+    # position p as group_ids[group_start[p]:group_start[p + 1]]
+    self.members = {group_id: array('l') for group_id in self.group_names}
+    self.group_start = array('l', [0]) * (len(self.ids) + 1)
+    self.group_ids = array('l')
+    for word_id, group_id in connection.execute(queries.VOCABULARY_GROUPS):
+      position = self.positions.get(word_id)
+      if position is None or group_id not in self.members:
+        continue
+      self.members[group_id].append(position)
+      self.group_ids.append(group_id)
+      self.group_start[position + 1] += 1
+    for position in range(len(self.ids)):
+      self.group_start[position + 1] += self.group_start[position]
+
+    # Positions are in id order and sorted() is stable, so ties stay in id
+    # order like the (column, id) indexes the SQL reads
+    self.orders = {
+      column: array('l', sorted(range(len(self.ids)), key=values.__getitem__))
+      for column, values in self.columns.items()
+    }
+    self.group_orders = {}
+
+  def __len__(self):
+    return len(self.ids)
+
+  def order(self, column, group_id=None):
+    if group_id is None:
+      return self.orders[column]
+    key = (column, group_id)
+    if key not in self.group_orders:
+      self.group_orders[key] = array('l', sorted(self.members[group_id], key=self.columns[column].__getitem__))
+    return self.group_orders[key]
+
+class UserCounts:
+  # A user's review counts, by word position. writes is the
+  # VocabularyIndex write count when they were read.
+  def __init__(self, catalog, rows, writes):
+    self.writes = writes
+    self.counts = {column: array('l', [0]) * len(catalog) for column in COUNT_COLUMNS}
+    for word_id, correct_count, wrong_count in rows:
+      position = catalog.positions.get(word_id)
+      if position is not None:
+        self.counts['correct_count'][position] = correct_count
+        self.counts['wrong_count'][position] = wrong_count
+    self.orders = {}
+
+  def order(self, catalog, column, group_id=None):
+    key = (column, group_id)
+    order = self.orders.get(key)
+    if order is None:
+      positions = range(len(catalog)) if group_id is None else catalog.members[group_id]
+      order = self.orders[key] = array('l', sorted(positions, key=self.counts[column].__getitem__))
+    return order
+
+class VocabularyIndex:
+  def __init__(self, database, db, cache, max_users=64):
+    self.database = database
+    self.db = db
+    self.cache = cache
+    self.max_users = max_users
+    self._users = OrderedDict()
+    self._lock = threading.RLock()
+    self._catalog_version = None
+    self._reviews_version = None
+    # Review writes started by this process, see begin_reviews
+    self._writes = 0
+    self._load_catalog(*self._versions())
+
+  def _versions(self):
+    words, groups, reviews = self.cache.backend.versions(['words', 'groups', 'reviews'])
+    return (words, groups), reviews
+
+  # Always from the main database, which holds the words when sharding too
+  def _load_catalog(self, catalog_version, reviews_version):
+    connection = sqlite3.connect(self.database)
+    try:
+      self.catalog = Catalog(connection)
+    finally:
+      connection.close()
+    self._users.clear()
+    self._catalog_version = catalog_version
+    self._reviews_version = reviews_version
+
+  # Reload the words when an import bumped their tags, drop the counts when
+  # reviews were written elsewhere. Called with the lock held.
+  def _refresh(self):
+    catalog_version, reviews_version = self._versions()
+    if catalog_version != self._catalog_version:
+      self._load_catalog(catalog_version, reviews_version)
+    elif reviews_version != self._reviews_version:
+      self._users.clear()
+      self._reviews_version = reviews_version
+    return self.catalog
+
+  # The current catalog and the user's counts
+  def _state(self, user_id):
+    with self._lock:
+      catalog = self._refresh()
+      user = self._users.get(user_id)
+      if user is not None:
+        self._users.move_to_end(user_id)
+        return catalog, user
+      reviews_version = self._reviews_version
+      writes = self._writes
+
+    # Read through the request's connection, from the user's shard. Other
+    # requests don't wait for it.
+    cursor = self.db.read_cursor()
+    cursor.execute(queries.USER_WORD_COUNTS, (user_id,))
+    user = UserCounts(catalog, cursor.fetchall(), writes)
+
+    with self._lock:
+      if self._refresh() is catalog and self._reviews_version == reviews_version and self._writes == writes:
+        self._users[user_id] = user
+        while len(self._users) > self.max_users:
+          self._users.popitem(last=False)
+    return catalog, user
+
+  # Call before writing reviews, pass what it returns to note_reviews
+  def begin_reviews(self):
+    with self._lock:
+      self._writes += 1
+      return self._writes
+
+  # Fold reviews just committed by this process (the items returned by
+  # routes.study_sessions.record_reviews) into the user's counts. Call after
+  # invalidating the 'reviews' cache tag.
+  def note_reviews(self, user_id, items, writes):
+    with self._lock:
+      reviews_version = self._versions()[1]
+      # Anything but our own bump means someone else wrote reviews too
+      if reviews_version != self._reviews_version + 1:
+        self._users.clear()
+      self._reviews_version = reviews_version
+
+      user = self._users.get(user_id)
+      if user is None:
+        return
+      # Loaded after begin_reviews, it may already have the reviews
+      if user.writes >= writes:
+        del self._users[user_id]
+        return
+      for _, word_id, correct, _, _, _ in items:
+        position = self.catalog.positions.get(word_id)
+        if position is not None:
+          user.counts['correct_count' if correct else 'wrong_count'][position] += 1
+      user.orders = {}
+
+  def _row(self, catalog, user, position):
+    return {
+      "id": catalog.ids[position],
+      "kanji": catalog.columns['kanji'][position],
+      "romaji": catalog.columns['romaji'][position],
+      "english": catalog.columns['english'][position],
+      "correct_count": user.counts['correct_count'][position],
+      "wrong_count": user.counts['wrong_count'][position]
+    }
+
+  def _order(self, catalog, user, column, group_id):
+    if column in TEXT_COLUMNS:
+      return catalog.order(column, group_id)
+    return user.order(catalog, column, group_id)
+
+  def group_name(self, group_id):
+    with self._lock:
+      return self._refresh().group_names.get(group_id)
+
+  # Number of words, in a group when given one
+  def count(self, group_id=None):
+    with self._lock:
+      catalog = self._refresh()
+    return len(catalog) if group_id is None else len(catalog.members[group_id])
+
+  # Rows of queries.WORDS_PAGE / GROUP_WORDS_PAGE
+  def page(self, user_id, sort_by, order, limit, offset, group_id=None):
+    catalog, user = self._state(user_id)
+    positions = self._order(catalog, user, sort_by, group_id)
+    offset = max(0, offset)
+    if order == 'asc':
+      selected = positions[offset:offset + limit]
+    else:
+      stop = max(0, len(positions) - offset)
+      selected = positions[max(0, stop - limit):stop][::-1]
+    return [self._row(catalog, user, position) for position in selected]
+
+  # Rows of queries.WORDS_KEYSET / GROUP_WORDS_KEYSET for a
+  # lib.pagination.Keyset, in scan order for Keyset.page
+  def keyset_rows(self, user_id, keyset, limit, group_id=None):
+    catalog, user = self._state(user_id)
+    positions = self._order(catalog, user, keyset.sort_by, group_id)
+    values = catalog.columns[keyset.sort_by] if keyset.sort_by in TEXT_COLUMNS else user.counts[keyset.sort_by]
+
+    if keyset.first_page:
+      start = 0 if keyset.ascending() else len(positions)
+    else:
+      value_type = str if keyset.sort_by in TEXT_COLUMNS else int
+      if not isinstance(keyset.value, value_type) or not isinstance(keyset.row_id, int):
+        raise CursorError('Invalid cursor')
+      key = lambda position: (values[position], catalog.ids[position])
+      if keyset.ascending():
+        start = bisect.bisect_right(positions, (keyset.value, keyset.row_id), key=key)
+      else:
+        start = bisect.bisect_left(positions, (keyset.value, keyset.row_id), key=key)
+
+    if keyset.ascending():
+      selected = positions[start:start + limit]
+    else:
+      selected = positions[max(0, start - limit):start][::-1]
+    return [self._row(catalog, user, position) for position in selected]
+
+  # Row of queries.WORD_DETAIL with the groups as a list, or None
+  def word(self, user_id, word_id):
+    catalog, user = self._state(user_id)
+    position = catalog.positions.get(word_id)
+    if position is None:
+      return None
+    row = self._row(catalog, user, position)
+    group_ids = catalog.group_ids[catalog.group_start[position]:catalog.group_start[position + 1]]
+    row["groups"] = [{"id": group_id, "name": catalog.group_names[group_id]} for group_id in group_ids]
+    return row
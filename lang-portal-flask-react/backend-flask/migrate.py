@@ -1,31 +1,71 @@
 import sqlite3
 import os
+import sys
 
-def run_migrations():
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'sql', 'migrations')
+# Schema of the user shards (see lib/db.py), applied when a shard is opened
+SHARD_MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'sql', 'shard_migrations')
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), 'words.db')
+
+# Migrations are the files in sql/migrations named <version>_<name>.sql.
+# Each one is applied once, in version order, and recorded in schema_migrations.
+# report is called with a line about each migration run, e.g. a logger's
+# info method when migrating from within the app.
+def list_migrations(migrations_dir=MIGRATIONS_DIR):
+    migration_files = sorted([f for f in os.listdir(migrations_dir) if f.endswith('.sql')])
+    return [(f.split('_', 1)[0], f) for f in migration_files]
+
+def applied_versions(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    return {row[0] for row in conn.execute('SELECT version FROM schema_migrations')}
+
+def apply_migrations(conn, migrations_dir=MIGRATIONS_DIR, report=print):
+    applied = applied_versions(conn)
+    newly_applied = []
+    for version, migration_file in list_migrations(migrations_dir):
+        if version in applied:
+            continue
+        report(f"Running migration: {migration_file}")
+        with open(os.path.join(migrations_dir, migration_file)) as f:
+            migration_sql = f.read()
+        # Run the migration and its bookkeeping row in one transaction so a
+        # failing migration leaves no trace and is retried next time
+        try:
+            conn.executescript(
+                'BEGIN;\n' + migration_sql + ';\n' +
+                f"INSERT INTO schema_migrations (version, name) VALUES ('{version}', '{migration_file}');\n" +
+                'COMMIT;'
+            )
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        newly_applied.append(migration_file)
+    return newly_applied
+
+def run_migrations(db_path=DEFAULT_DB_PATH, migrations_dir=MIGRATIONS_DIR):
     # Connect to the database
-    db_path = os.path.join(os.path.dirname(__file__), 'word_bank.db')
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
     
     try:
-        # Get list of migration files
-        migrations_dir = os.path.join(os.path.dirname(__file__), 'sql', 'migrations')
-        migration_files = sorted([f for f in os.listdir(migrations_dir) if f.endswith('.sql')])
-        
-        # Run each migration
-        for migration_file in migration_files:
-            print(f"Running migration: {migration_file}")
-            with open(os.path.join(migrations_dir, migration_file)) as f:
-                migration_sql = f.read()
-                conn.executescript(migration_sql)
-                conn.commit()
-        
+        newly_applied = apply_migrations(conn, migrations_dir)
+        if not newly_applied:
+            print("Database is up to date")
         print("Migrations completed successfully")
+        return True
     except Exception as e:
         print(f"Error running migrations: {str(e)}")
-        conn.rollback()
+        return False
     finally:
         conn.close()
 
 if __name__ == '__main__':
-    run_migrations()
+    sys.exit(0 if run_migrations() else 1)
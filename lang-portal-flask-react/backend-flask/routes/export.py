@@ -0,0 +1,102 @@
+from flask import request, jsonify, g, Response, stream_with_context
+from flask_cors import cross_origin
+from datetime import datetime
+import csv
+import io
+
+from lib import queries
+
+# Rows pulled from SQLite per fetchmany call while streaming an export
+EXPORT_BATCH_SIZE = 1000
+
+WORD_COLUMNS = ['id', 'kanji', 'romaji', 'english', 'parts', 'correct_count', 'wrong_count']
+REVIEW_COLUMNS = ['id', 'word_id', 'study_session_id', 'correct', 'created_at', 'correct_count', 'wrong_count', 'archived']
+
+# Yields the export body batch by batch, so memory use does not depend on
+# the size of the table. NDJSON lines are rendered by SQLite (json_object)
+# in the `line` column, CSV rows are written from the named columns.
+def stream_rows(cursor, export_format, columns):
+  if export_format == 'csv':
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+  while True:
+    rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+    if not rows:
+      break
+    if export_format == 'csv':
+      writer.writerows([row[column] for column in columns] for row in rows)
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+    else:
+      yield ''.join(row['line'] + '\n' for row in rows)
+  if export_format == 'csv' and buffer.getvalue():
+    yield buffer.getvalue()
+
+def export_response(cursor, export_format, columns, name):
+  if export_format == 'csv':
+    mimetype = 'text/csv'
+    filename = f'{name}.csv'
+  else:
+    mimetype = 'application/x-ndjson'
+    filename = f'{name}.ndjson'
+  response = Response(stream_with_context(stream_rows(cursor, export_format, columns)), mimetype=mimetype)
+  response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+  return response
+
+def load(app):
+  # Endpoint: GET /api/export/words streams the full vocabulary with the
+  # user's review counts.
+  # ?format=ndjson (default) or csv, ?since_id=N only returns words with id > N
+  @app.route('/api/export/words', methods=['GET'])
+  @cross_origin()
+  def export_words():
+    try:
+      export_format = request.args.get('format', 'ndjson')
+      if export_format not in ['ndjson', 'csv']:
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+      since_id = request.args.get('since_id', 0, type=int)
+
+      cursor = app.db.read_cursor()
+      cursor.execute(queries.EXPORT_WORDS, (g.user_id, since_id))
+      return export_response(cursor, export_format, WORD_COLUMNS, 'words')
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
+  # Endpoint: GET /api/export/reviews streams the user's reviews in the order
+  # they were logged. ?since=<ISO timestamp> returns reviews created after
+  # that time, ?since_id=N reviews with id > N (exact for incremental jobs).
+  # Reviews folded into word_review_archive (lib/maintenance.py) come as one
+  # row per session and word with "archived": true, their counts, and the id
+  # and time of the last review in it. Rows archived before migration 0013
+  # have id 0 and are only in exports without since_id.
+  @app.route('/api/export/reviews', methods=['GET'])
+  @cross_origin()
+  def export_reviews():
+    try:
+      export_format = request.args.get('format', 'ndjson')
+      if export_format not in ['ndjson', 'csv']:
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+      since_id = request.args.get('since_id', type=int)
+      since = request.args.get('since')
+
+      # Archive rows without a known review id have id 0
+      live_since_id = since_id or 0
+      archive_since_id = -1 if since_id is None else since_id
+
+      cursor = app.db.read_cursor()
+      if since:
+        try:
+          since = datetime.fromisoformat(since.replace('Z', '+00:00'))
+        except ValueError:
+          return jsonify({"error": "since must be an ISO 8601 date"}), 400
+        if since.tzinfo is not None:
+          since = since.astimezone().replace(tzinfo=None)
+        cursor.execute(queries.EXPORT_REVIEWS_SINCE,
+                       (g.user_id, since, live_since_id, g.user_id, since, archive_since_id))
+      else:
+        cursor.execute(queries.EXPORT_REVIEWS, (g.user_id, live_since_id, g.user_id, archive_since_id))
+      return export_response(cursor, export_format, REVIEW_COLUMNS, 'reviews')
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
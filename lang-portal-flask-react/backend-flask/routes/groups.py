@@ -1,13 +1,33 @@
-from flask import request, jsonify, g
+from flask import request, jsonify, g, Response, stream_with_context
 from flask_cors import cross_origin
+from datetime import datetime
 import json
 
+from lib.pagination import Keyset, CursorError
+from lib import queries
+from routes.words import WORD_SORT_EXPRESSIONS, COUNT_COLUMNS, count_sorted_page
+
+# Most words returned by one GET /api/groups/<id>/due request
+MAX_DUE_LIMIT = 100
+
+# Sortable session columns (frontend sort keys), expressed over the
+# columns of the group sessions query
+SESSION_SORT_EXPRESSIONS = {
+  'created_at': 'start_time',
+  'startTime': 'start_time',
+  'endTime': 'end_time',
+  'activityName': 'activity_name',
+  'groupName': 'group_name',
+  'reviewItemsCount': 'review_count'
+}
+
 def load(app):
   @app.route('/groups', methods=['GET'])
   @cross_origin()
+  @app.cache.cached('groups')
   def get_groups():
     try:
-      cursor = app.db.cursor()
+      cursor = app.db.read_cursor()
 
       # Get the current page number from query parameters (default is 1)
       page = int(request.args.get('page', 1))
@@ -26,17 +46,13 @@ def load(app):
         order = 'asc'
 
       # Query to fetch groups with sorting and the cached word count
-      cursor.execute(f'''
-        SELECT id, name, words_count
-        FROM groups
-        ORDER BY {sort_by} {order}
-        LIMIT ? OFFSET ?
-      ''', (groups_per_page, offset))
+      cursor.execute(queries.GROUPS_PAGE.format(sort_by=sort_by, order=order),
+                     (groups_per_page, offset))
 
       groups = cursor.fetchall()
 
       # Query the total number of groups
-      cursor.execute('SELECT COUNT(*) FROM groups')
+      cursor.execute(queries.GROUPS_COUNT)
       total_groups = cursor.fetchone()[0]
       total_pages = (total_groups + groups_per_page - 1) // groups_per_page
 
@@ -60,16 +76,13 @@ def load(app):
 
   @app.route('/groups/<int:id>', methods=['GET'])
   @cross_origin()
+  @app.cache.cached('groups')
   def get_group(id):
     try:
-      cursor = app.db.cursor()
+      cursor = app.db.read_cursor()
 
       # Get group details
-      cursor.execute('''
-        SELECT id, name, words_count
-        FROM groups
-        WHERE id = ?
-      ''', (id,))
+      cursor.execute(queries.GROUP_DETAIL, (id,))
       
       group = cursor.fetchone()
       if not group:
@@ -87,8 +100,6 @@ def load(app):
   @cross_origin()
   def get_group_words(id):
     try:
-      cursor = app.db.cursor()
-      
       # Get pagination parameters
       page = int(request.args.get('page', 1))
       words_per_page = 10
@@ -106,33 +117,63 @@ def load(app):
         order = 'asc'
 
       # First, check if the group exists
-      cursor.execute('SELECT name FROM groups WHERE id = ?', (id,))
-      group = cursor.fetchone()
-      if not group:
+      if app.vocabulary:
+        group_exists = app.vocabulary.group_name(id) is not None
+      else:
+        cursor = app.db.read_cursor()
+        cursor.execute(queries.GROUP_NAME, (id,))
+        group_exists = cursor.fetchone() is not None
+      if not group_exists:
         return jsonify({"error": "Group not found"}), 404
 
-      # Query to fetch words with pagination and sorting
-      cursor.execute(f'''
-        SELECT w.*, 
-               COALESCE(wr.correct_count, 0) as correct_count,
-               COALESCE(wr.wrong_count, 0) as wrong_count
-        FROM words w
-        JOIN word_groups wg ON w.id = wg.word_id
-        LEFT JOIN word_reviews wr ON w.id = wr.word_id
-        WHERE wg.group_id = ?
-        ORDER BY {sort_by} {order}
-        LIMIT ? OFFSET ?
-      ''', (id, words_per_page, offset))
-      
-      words = cursor.fetchall()
+      # Cursor mode, see GET /words
+      if 'cursor' in request.args:
+        keyset = Keyset(sort_by, WORD_SORT_EXPRESSIONS[sort_by], order, 'w.id',
+                        cursor=request.args.get('cursor'))
+        if app.vocabulary:
+          rows = app.vocabulary.keyset_rows(g.user_id, keyset, words_per_page + 1, group_id=id)
+        elif sort_by in COUNT_COLUMNS:
+          rows = count_sorted_page(cursor, g.user_id, sort_by, keyset.ascending(), words_per_page + 1,
+                                   after=keyset.after(), group_id=id)
+        else:
+          where, params = keyset.where()
+          cursor.execute(queries.GROUP_WORDS_KEYSET.format(where=where, order_by=keyset.order_by()),
+                         (g.user_id, id, *params, words_per_page + 1))
+          rows = cursor.fetchall()
+        words, next_cursor, prev_cursor = keyset.page(rows, words_per_page)
+
+        return jsonify({
+          'words': [{
+            "id": word["id"],
+            "kanji": word["kanji"],
+            "romaji": word["romaji"],
+            "english": word["english"],
+            "correct_count": word["correct_count"],
+            "wrong_count": word["wrong_count"]
+          } for word in words],
+          'next_cursor': next_cursor,
+          'prev_cursor': prev_cursor
+        })
+
+      if app.vocabulary:
+        words = app.vocabulary.page(g.user_id, sort_by, order, words_per_page, offset, group_id=id)
+        total_words = app.vocabulary.count(id)
+      else:
+        # Query to fetch words with pagination and sorting
+        if sort_by in COUNT_COLUMNS:
+          # Like OFFSET, a page number below 1 gives the first page
+          start = max(0, offset)
+          words = count_sorted_page(cursor, g.user_id, sort_by, order == 'asc', start + words_per_page,
+                                    group_id=id)[start:]
+        else:
+          cursor.execute(queries.GROUP_WORDS_PAGE.format(sort_by=sort_by, order=order),
+                         (g.user_id, id, words_per_page, offset))
 
-      # Get total words count for pagination
-      cursor.execute('''
-        SELECT COUNT(*) 
-        FROM word_groups 
-        WHERE group_id = ?
-      ''', (id,))
-      total_words = cursor.fetchone()[0]
+          words = cursor.fetchall()
+
+        # Get total words count for pagination
+        cursor.execute(queries.GROUP_WORDS_COUNT, (id,))
+        total_words = cursor.fetchone()[0]
       total_pages = (total_words + words_per_page - 1) // words_per_page
 
       # Format the response
@@ -152,50 +193,70 @@ def load(app):
         'total_pages': total_pages,
         'current_page': page
       })
+    except CursorError as e:
+      return jsonify({"error": str(e)}), 400
     except Exception as e:
       return jsonify({"error": str(e)}), 500
 
   @app.route('/api/groups/<int:id>/words/raw', methods=['GET'])
   @cross_origin()
+  @app.cache.cached('words', 'groups')
   def get_group_words_raw(id):
     try:
-      cursor = app.db.cursor()
+      cursor = app.db.read_cursor()
 
       # First, check if the group exists
-      cursor.execute('SELECT name FROM groups WHERE id = ?', (id,))
+      cursor.execute(queries.GROUP_NAME, (id,))
       group = cursor.fetchone()
       if not group:
         return jsonify({"error": "Group not found"}), 404
 
-      # SQL query to fetch words along with group information
-      cursor.execute('''
-        SELECT g.id as group_id, g.name as group_name, w.*
-        FROM groups g
-        JOIN word_groups wg ON g.id = wg.group_id
-        JOIN words w ON w.id = wg.word_id
-        WHERE g.id = ?;
-      ''', (id,))
-      
-      data = cursor.fetchall()
-      
-      # Format the response
-      result = {
-        "group_id": id,
-        "group_name": data[0]["group_name"] if data else group["name"],
-        "words": []
-      }
-      
-      for row in data:
-        word = {
-          "id": row["id"],
-          "kanji": row["kanji"],
-          "romaji": row["romaji"],
-          "english": row["english"],
-          "parts": json.loads(row["parts"])  # Deserialize 'parts' field
-        }
-        result["words"].append(word)
-      
-      return jsonify(result)
+      # Each word's JSON is kept pre-rendered in words.payload, so the rows
+      # are written into the response body as they are read, with no per row
+      # decode/encode
+      cursor.execute(queries.GROUP_WORDS_RAW, (id,))
+
+      def generate():
+        yield '{"group_id":%d,"group_name":%s,"words":[' % (id, json.dumps(group["name"]))
+        separator = ''
+        while True:
+          rows = cursor.fetchmany(500)
+          if not rows:
+            break
+          yield separator + ','.join(row["payload"] for row in rows)
+          separator = ','
+        yield ']}\n'
+
+      return Response(stream_with_context(generate()), mimetype='application/json')
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
+  # Next batch of words to study in a group: words whose review is due
+  # (most overdue first, see lib/scheduler.py), topped up with words that
+  # were never reviewed. Not cached since it depends on the current time.
+  @app.route('/api/groups/<int:id>/due', methods=['GET'])
+  @cross_origin()
+  def get_group_due_words(id):
+    try:
+      cursor = app.db.read_cursor()
+
+      limit = request.args.get('limit', 20, type=int)
+      limit = min(max(1, limit), MAX_DUE_LIMIT)
+
+      cursor.execute(queries.GROUP_NAME, (id,))
+      if not cursor.fetchone():
+        return jsonify({"error": "Group not found"}), 404
+
+      cursor.execute(queries.DUE_WORDS, (id, g.user_id, datetime.now(), limit))
+      words = cursor.fetchall()
+      if len(words) < limit:
+        cursor.execute(queries.NEW_WORDS, (id, g.user_id, limit - len(words)))
+        words += cursor.fetchall()
+
+      return jsonify({
+        'group_id': id,
+        'words': [due_word_data(word) for word in words]
+      })
     except Exception as e:
       return jsonify({"error": str(e)}), 500
 
@@ -203,7 +264,7 @@ def load(app):
   @cross_origin()
   def get_group_study_sessions(id):
     try:
-      cursor = app.db.cursor()
+      cursor = app.db.read_cursor()
       
       # Get pagination parameters
       page = int(request.args.get('page', 1))
@@ -214,63 +275,35 @@ def load(app):
       sort_by = request.args.get('sort_by', 'created_at')
       order = request.args.get('order', 'desc')  # Default to newest first
 
-      # Map frontend sort keys to database columns
-      sort_mapping = {
-        'startTime': 'created_at',
-        'endTime': 'last_activity_time',
-        'activityName': 'a.name',
-        'groupName': 'g.name',
-        'reviewItemsCount': 'review_count'
-      }
-
-      # Use mapped sort column or default to created_at
-      sort_column = sort_mapping.get(sort_by, 'created_at')
-
-      # Get total count for pagination
-      cursor.execute('''
-        SELECT COUNT(*)
-        FROM study_sessions
-        WHERE group_id = ?
-      ''', (id,))
-      total_sessions = cursor.fetchone()[0]
-      total_pages = (total_sessions + sessions_per_page - 1) // sessions_per_page
-
-      # Get study sessions for this group with dynamic calculations
-      cursor.execute(f'''
-        SELECT 
-          s.id,
-          s.group_id,
-          s.study_activity_id,
-          s.created_at as start_time,
-          (
-            SELECT MAX(created_at)
-            FROM word_review_items
-            WHERE study_session_id = s.id
-          ) as last_activity_time,
-          a.name as activity_name,
-          g.name as group_name,
-          (
-            SELECT COUNT(*)
-            FROM word_review_items
-            WHERE study_session_id = s.id
-          ) as review_count
-        FROM study_sessions s
-        JOIN study_activities a ON s.study_activity_id = a.id
-        JOIN groups g ON s.group_id = g.id
-        WHERE s.group_id = ?
-        ORDER BY {sort_column} {order}
-        LIMIT ? OFFSET ?
-      ''', (id, sessions_per_page, offset))
-      
-      sessions = cursor.fetchall()
+      # Validate sort parameters, sort keys are the frontend's column names
+      if sort_by not in SESSION_SORT_EXPRESSIONS:
+        sort_by = 'created_at'
+      sort_column = SESSION_SORT_EXPRESSIONS[sort_by]
+      if order not in ['asc', 'desc']:
+        order = 'desc'
+
+      cursor_mode = 'cursor' in request.args
+      if cursor_mode:
+        # Cursor mode, see GET /words
+        keyset = Keyset(sort_by, sort_column, order, 'id',
+                        cursor=request.args.get('cursor'), sort_key='sort_value')
+        where, params = keyset.where()
+        cursor.execute(queries.GROUP_SESSIONS_KEYSET.format(sort_by=sort_column, where=where, order_by=keyset.order_by()),
+                       (g.user_id, id, *params, sessions_per_page + 1))
+        sessions, next_cursor, prev_cursor = keyset.page(cursor.fetchall(), sessions_per_page)
+      else:
+        # Get total count for pagination
+        cursor.execute(queries.GROUP_SESSIONS_COUNT, (g.user_id, id))
+        total_sessions = cursor.fetchone()[0]
+        total_pages = (total_sessions + sessions_per_page - 1) // sessions_per_page
+
+        cursor.execute(queries.GROUP_SESSIONS_PAGE.format(sort_by=sort_column, order=order),
+                       (g.user_id, id, sessions_per_page, offset))
+        sessions = cursor.fetchall()
+
       sessions_data = []
       
       for session in sessions:
-        # If there's no last_activity_time, use start_time + 30 minutes
-        end_time = session["last_activity_time"]
-        if not end_time:
-            end_time = cursor.execute('SELECT datetime(?, "+30 minutes")', (session["start_time"],)).fetchone()[0]
-        
         sessions_data.append({
           "id": session["id"],
           "group_id": session["group_id"],
@@ -278,14 +311,36 @@ def load(app):
           "study_activity_id": session["study_activity_id"],
           "activity_name": session["activity_name"],
           "start_time": session["start_time"],
-          "end_time": end_time,
+          "end_time": session["end_time"],
           "review_items_count": session["review_count"]
         })
 
+      if cursor_mode:
+        return jsonify({
+          'study_sessions': sessions_data,
+          'next_cursor': next_cursor,
+          'prev_cursor': prev_cursor
+        })
+
       return jsonify({
         'study_sessions': sessions_data,
         'total_pages': total_pages,
         'current_page': page
       })
+    except CursorError as e:
+      return jsonify({"error": str(e)}), 400
     except Exception as e:
-      return jsonify({"error": str(e)}), 500
\ No newline at end of file
+      return jsonify({"error": str(e)}), 500
+
+def due_word_data(word):
+  return {
+    "id": word["id"],
+    "kanji": word["kanji"],
+    "romaji": word["romaji"],
+    "english": word["english"],
+    "correct_count": word["correct_count"],
+    "wrong_count": word["wrong_count"],
+    "ease": word["ease"],
+    "interval_days": word["interval_days"],
+    "due_at": word["due_at"]
+  }
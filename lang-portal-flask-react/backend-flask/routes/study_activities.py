@@ -1,13 +1,16 @@
-from flask import jsonify, request
+from flask import jsonify, request, g
 from flask_cors import cross_origin
 import math
 
+from lib.pagination import Keyset, CursorError
+from lib import queries
+
 def load(app):
     @app.route('/api/study-activities', methods=['GET'])
     @cross_origin()
     def get_study_activities():
         cursor = app.db.cursor()
-        cursor.execute('SELECT id, name, url, preview_url FROM study_activities')
+        cursor.execute(queries.ACTIVITIES)
         activities = cursor.fetchall()
         
         return jsonify([{
@@ -21,7 +24,7 @@ def load(app):
     @cross_origin()
     def get_study_activity(id):
         cursor = app.db.cursor()
-        cursor.execute('SELECT id, name, url, preview_url FROM study_activities WHERE id = ?', (id,))
+        cursor.execute(queries.ACTIVITY_DETAIL, (id,))
         activity = cursor.fetchone()
         
         if not activity:
@@ -40,7 +43,7 @@ def load(app):
         cursor = app.db.cursor()
         
         # Verify activity exists
-        cursor.execute('SELECT id FROM study_activities WHERE id = ?', (id,))
+        cursor.execute(queries.ACTIVITY_EXISTS, (id,))
         if not cursor.fetchone():
             return jsonify({'error': 'Activity not found'}), 404
 
@@ -49,34 +52,40 @@ def load(app):
         per_page = request.args.get('per_page', 10, type=int)
         offset = (page - 1) * per_page
 
+        # Cursor mode: newest first, seeking on (created_at, id)
+        if 'cursor' in request.args:
+            try:
+                keyset = Keyset('created_at', 'ss.created_at', 'desc', 'ss.id',
+                                cursor=request.args.get('cursor'))
+            except CursorError as e:
+                return jsonify({'error': str(e)}), 400
+            where, params = keyset.where()
+            cursor.execute(queries.ACTIVITY_SESSIONS_KEYSET.format(where=where, order_by=keyset.order_by()),
+                           (g.user_id, id, *params, per_page + 1))
+            sessions, next_cursor, prev_cursor = keyset.page(cursor.fetchall(), per_page)
+
+            return jsonify({
+                'items': [{
+                    'id': session['id'],
+                    'group_id': session['group_id'],
+                    'group_name': session['group_name'],
+                    'activity_id': session['activity_id'],
+                    'activity_name': session['activity_name'],
+                    'start_time': session['created_at'],
+                    'end_time': session['end_time'],
+                    'review_items_count': session['review_items_count']
+                } for session in sessions],
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'prev_cursor': prev_cursor
+            })
+
         # Get total count
-        cursor.execute('''
-            SELECT COUNT(*) as count 
-            FROM study_sessions ss
-            JOIN groups g ON g.id = ss.group_id
-            WHERE ss.study_activity_id = ?
-        ''', (id,))
+        cursor.execute(queries.ACTIVITY_SESSIONS_COUNT, (g.user_id, id))
         total_count = cursor.fetchone()['count']
 
         # Get paginated sessions
-        cursor.execute('''
-            SELECT 
-                ss.id,
-                ss.group_id,
-                g.name as group_name,
-                sa.name as activity_name,
-                ss.created_at,
-                ss.study_activity_id as activity_id,
-                COUNT(wri.id) as review_items_count
-            FROM study_sessions ss
-            JOIN groups g ON g.id = ss.group_id
-            JOIN study_activities sa ON sa.id = ss.study_activity_id
-            LEFT JOIN word_review_items wri ON wri.study_session_id = ss.id
-            WHERE ss.study_activity_id = ?
-            GROUP BY ss.id, ss.group_id, g.name, sa.name, ss.created_at, ss.study_activity_id
-            ORDER BY ss.created_at DESC
-            LIMIT ? OFFSET ?
-        ''', (id, per_page, offset))
+        cursor.execute(queries.ACTIVITY_SESSIONS_PAGE, (g.user_id, id, per_page, offset))
         sessions = cursor.fetchall()
 
         return jsonify({
@@ -87,7 +96,7 @@ def load(app):
                 'activity_id': session['activity_id'],
                 'activity_name': session['activity_name'],
                 'start_time': session['created_at'],
-                'end_time': session['created_at'],  # For now, just use the same time since we don't track end time
+                'end_time': session['end_time'],
                 'review_items_count': session['review_items_count']
             } for session in sessions],
             'total': total_count,
@@ -98,18 +107,19 @@ def load(app):
 
     @app.route('/api/study-activities/<int:id>/launch', methods=['GET'])
     @cross_origin()
+    @app.cache.cached('activities', 'groups')
     def get_study_activity_launch_data(id):
         cursor = app.db.cursor()
         
         # Get activity details
-        cursor.execute('SELECT id, name, url, preview_url FROM study_activities WHERE id = ?', (id,))
+        cursor.execute(queries.ACTIVITY_DETAIL, (id,))
         activity = cursor.fetchone()
         
         if not activity:
             return jsonify({'error': 'Activity not found'}), 404
         
         # Get available groups
-        cursor.execute('SELECT id, name FROM groups')
+        cursor.execute(queries.GROUPS_ALL)
         groups = cursor.fetchall()
         
         return jsonify({
@@ -1,9 +1,182 @@
-from flask import request, jsonify, g
+from flask import request, jsonify, g, Response
 from flask_cors import cross_origin
 from datetime import datetime
+import json
 import math
+import sqlite3
+
+from lib.pagination import Keyset, CursorError
+from lib import queries
+from lib.scheduler import schedule_rows
+from lib.maintenance import delete_in_batches
+from lib.events import HEARTBEAT, format_event, session_topic
+
+# Most reviews accepted by one POST /study_sessions/<id>/reviews request
+MAX_BATCH_REVIEWS = 1000
+
+# Reviews may carry a client generated idempotency key (the header below for
+# POST /study_sessions/<id>/review, an "idempotency_key" field per review).
+# A review whose key the user already logged is not counted again, so a
+# client can safely retry a request that timed out.
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+# Parameters for queries.INSERT_REVIEW_ITEM and queries.UPSERT_WORD_REVIEW.
+# reviews is a list of (word_id, correct, created_at, idempotency_key) where
+# created_at may be None for "now" and the key None for none.
+def review_rows(user_id, session_id, reviews):
+  # Timestamps are local time like study_sessions.created_at (not SQLite's
+  # UTC CURRENT_TIMESTAMP) so session durations come out right
+  now = datetime.now()
+  items = [(user_id, word_id, correct, session_id, created_at or now, key) for word_id, correct, created_at, key in reviews]
+
+  # One upsert per distinct word instead of a select + update per review
+  totals = {}
+  for word_id, correct, created_at, _ in reviews:
+    correct_count, wrong_count, last_reviewed = totals.get(word_id, (0, 0, None))
+    reviewed_at = created_at or now
+    totals[word_id] = (
+      correct_count + (1 if correct else 0),
+      wrong_count + (0 if correct else 1),
+      max(last_reviewed, reviewed_at) if last_reviewed else reviewed_at
+    )
+  return items, [(user_id, word_id, *counts) for word_id, counts in totals.items()]
+
+# Store review attempts, fold them into the user's per-word word_reviews
+# totals and reschedule the words. The caller validates the ids (the session
+# being the user's) and commits. Returns the stored review items.
+def record_reviews(cursor, user_id, session_id, reviews):
+  items, totals = review_rows(user_id, session_id, reviews)
+  cursor.executemany(queries.INSERT_REVIEW_ITEM, items)
+  cursor.executemany(queries.UPSERT_WORD_REVIEW, totals)
+
+  cursor.execute(queries.REVIEW_SCHEDULES, (json.dumps([row[1] for row in totals]), user_id))
+  states = {row['word_id']: (row['ease'], row['interval_days'], row['repetitions']) for row in cursor.fetchall()}
+  cursor.executemany(queries.UPDATE_SCHEDULE, schedule_rows(states, items))
+  return items
+
+# Data of the events sent to GET /api/study-sessions/<id>/events, from a
+# queries.SESSION_PROGRESS row and the items returned by record_reviews
+def session_progress(session):
+  return {
+    "session_id": session["id"],
+    "correct_count": session["correct_count"],
+    "wrong_count": session["wrong_count"],
+    "review_items_count": session["review_items_count"],
+    "end_time": session["end_time"],
+    "ended": session["ended_at"] is not None
+  }
+
+def reviews_event(session, items):
+  return {
+    **session_progress(session),
+    "reviews": [{
+      "word_id": word_id,
+      "correct": bool(correct),
+      "created_at": str(created_at)
+    } for _, word_id, correct, _, created_at, _ in items]
+  }
+
+# Response streaming the events of a subscription (lib/events.py), starting
+# with the session as it is now. Ends when the subscriber falls too far
+# behind, the client then reconnects and gets a new snapshot.
+def event_stream(subscription, session):
+  def generate():
+    yield format_event('session', session_progress(session))
+    while not subscription.overflowed:
+      event = subscription.get()
+      if event is None:
+        yield HEARTBEAT
+      else:
+        id, name, data = event
+        yield format_event(name, data, id=id)
+
+  response = Response(generate(), mimetype='text/event-stream')
+  response.headers['Cache-Control'] = 'no-cache'
+  response.headers['X-Accel-Buffering'] = 'no'  # nginx would buffer the stream otherwise
+  # Runs when the client goes away, whether or not the stream started
+  response.call_on_close(subscription.close)
+  return response
+
+# Accepts ISO 8601 strings (a trailing Z included), returns a naive local
+# datetime like the ones stored by the rest of the app
+def parse_timestamp(value):
+  timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+  if timestamp.tzinfo is not None:
+    timestamp = timestamp.astimezone().replace(tzinfo=None)
+  return timestamp
+
+# Word ids referenced by a batch of reviews, to check with queries.KNOWN_WORDS
+def review_word_ids(data):
+  word_ids = {item.get('word_id') for item in data if isinstance(item, dict)}
+  return [word_id for word_id in word_ids if isinstance(word_id, int)]
+
+def valid_idempotency_key(key):
+  return key is None or (isinstance(key, str) and 0 < len(key) <= MAX_IDEMPOTENCY_KEY_LENGTH)
+
+# Key of the review at index in a batch: its own idempotency_key, or one
+# derived from the request's Idempotency-Key header when it has none
+def review_key(item, index, request_key=None):
+  key = item.get('idempotency_key') if isinstance(item, dict) else None
+  if key is None and request_key is not None:
+    key = f'{request_key}:{index}'
+  return key
+
+# Keys of a batch of reviews, to check with queries.LOGGED_REVIEW_KEYS
+def review_keys(data, request_key=None):
+  keys = {review_key(item, index, request_key) for index, item in enumerate(data)}
+  return [key for key in keys if key is not None and valid_idempotency_key(key)]
+
+# Check a batch of reviews from POST /study_sessions/<id>/reviews against the
+# set of existing word ids and the keys already logged. Returns the valid,
+# new reviews (for record_reviews) and a result entry per item.
+def validate_reviews(data, known_words, logged_keys=(), request_key=None):
+  results = []
+  reviews = []
+  logged_keys = set(logged_keys)
+  for index, item in enumerate(data):
+    error = None
+    word_id = item.get('word_id') if isinstance(item, dict) else None
+    key = review_key(item, index, request_key)
+    if not isinstance(item, dict):
+      error = "Review must be an object"
+    elif word_id is None or item.get('correct') is None:
+      error = "word_id and correct fields are required"
+    elif not isinstance(item['correct'], (bool, int)) or item['correct'] not in (0, 1):
+      error = "correct must be a boolean"
+    elif not valid_idempotency_key(key):
+      error = f"idempotency_key must be a string of at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters"
+    elif key in logged_keys:
+      # Logged by an earlier request, or earlier in this batch
+      results.append({"index": index, "word_id": word_id, "status": "duplicate"})
+      continue
+    elif word_id not in known_words:
+      error = "Word not found"
+
+    created_at = None
+    if error is None and item.get('timestamp') is not None:
+      try:
+        created_at = parse_timestamp(str(item['timestamp']))
+      except ValueError:
+        error = "timestamp must be an ISO 8601 date"
+
+    if error:
+      results.append({"index": index, "word_id": word_id, "status": "error", "error": error})
+    else:
+      reviews.append((word_id, bool(item['correct']), created_at, key))
+      results.append({"index": index, "word_id": word_id, "status": "ok"})
+      if key is not None:
+        logged_keys.add(key)
+  return reviews, results
 
 def load(app):
+  # Push committed reviews to the session's live streams, if anyone listens
+  def publish_reviews(cursor, session_id, items):
+    topic = session_topic(g.user_id, session_id)
+    if app.events.subscriber_count(topic):
+      cursor.execute(queries.SESSION_PROGRESS, (g.user_id, session_id))
+      app.events.publish(topic, 'reviews', reviews_event(cursor.fetchone(), items))
+
   @app.route('/study_sessions', methods=['POST'])
   @cross_origin()
   def create_study_session():
@@ -25,22 +198,19 @@ def load(app):
 
       # Check if the group exists
       cursor = app.db.cursor()
-      cursor.execute('SELECT id FROM groups WHERE id = ?', (group_id,))
+      cursor.execute(queries.GROUP_EXISTS, (group_id,))
       group = cursor.fetchone()
       if not group:
         return jsonify({"error": "Group not found"}), 404
 
       # Check if the study_activity exists
-      cursor.execute('SELECT id FROM study_activities WHERE id = ?', (study_activity_id,))
+      cursor.execute(queries.ACTIVITY_EXISTS, (study_activity_id,))
       study_activity = cursor.fetchone()
       if not study_activity:
         return jsonify({"error": "Study activity not found"}), 404
 
       # Insert the study session
-      cursor.execute('''
-        INSERT INTO study_sessions (group_id, study_activity_id, created_at)
-        VALUES (?, ?, ?)
-      ''', (group_id, study_activity_id, datetime.now()))
+      cursor.execute(queries.INSERT_SESSION, (g.user_id, group_id, study_activity_id, datetime.now()))
       
       app.db.commit()
       
@@ -62,33 +232,37 @@ def load(app):
       per_page = request.args.get('per_page', 10, type=int)
       offset = (page - 1) * per_page
 
-      # Get total count
-      cursor.execute('''
-        SELECT COUNT(*) as count 
-        FROM study_sessions ss
-        JOIN groups g ON g.id = ss.group_id
-        JOIN study_activities sa ON sa.id = ss.study_activity_id
-      ''')
+      # Cursor mode: newest first, seeking on (created_at, id)
+      if 'cursor' in request.args:
+        keyset = Keyset('created_at', 'ss.created_at', 'desc', 'ss.id',
+                        cursor=request.args.get('cursor'))
+        where, params = keyset.where()
+        cursor.execute(queries.SESSIONS_KEYSET.format(where=where, order_by=keyset.order_by()),
+                       (g.user_id, *params, per_page + 1))
+        sessions, next_cursor, prev_cursor = keyset.page(cursor.fetchall(), per_page)
+
+        return jsonify({
+          'items': [{
+            'id': session['id'],
+            'group_id': session['group_id'],
+            'group_name': session['group_name'],
+            'activity_id': session['activity_id'],
+            'activity_name': session['activity_name'],
+            'start_time': session['created_at'],
+            'end_time': session['end_time'],
+            'review_items_count': session['review_items_count']
+          } for session in sessions],
+          'per_page': per_page,
+          'next_cursor': next_cursor,
+          'prev_cursor': prev_cursor
+        })
+
+      # Get total count, kept in the dashboard rollup so no table scan is needed
+      cursor.execute(queries.SESSIONS_COUNT, (g.user_id,))
       total_count = cursor.fetchone()['count']
 
       # Get paginated sessions
-      cursor.execute('''
-        SELECT 
-          ss.id,
-          ss.group_id,
-          g.name as group_name,
-          sa.id as activity_id,
-          sa.name as activity_name,
-          ss.created_at,
-          COUNT(wri.id) as review_items_count
-        FROM study_sessions ss
-        JOIN groups g ON g.id = ss.group_id
-        JOIN study_activities sa ON sa.id = ss.study_activity_id
-        LEFT JOIN word_review_items wri ON wri.study_session_id = ss.id
-        GROUP BY ss.id
-        ORDER BY ss.created_at DESC
-        LIMIT ? OFFSET ?
-      ''', (per_page, offset))
+      cursor.execute(queries.SESSIONS_PAGE, (g.user_id, per_page, offset))
       sessions = cursor.fetchall()
 
       return jsonify({
@@ -99,7 +273,7 @@ def load(app):
           'activity_id': session['activity_id'],
           'activity_name': session['activity_name'],
           'start_time': session['created_at'],
-          'end_time': session['created_at'],  # For now, just use the same time since we don't track end time
+          'end_time': session['end_time'],
           'review_items_count': session['review_items_count']
         } for session in sessions],
         'total': total_count,
@@ -107,6 +281,8 @@ def load(app):
         'per_page': per_page,
         'total_pages': math.ceil(total_count / per_page)
       })
+    except CursorError as e:
+      return jsonify({"error": str(e)}), 400
     except Exception as e:
       return jsonify({"error": str(e)}), 500
 
@@ -117,22 +293,7 @@ def load(app):
       cursor = app.db.cursor()
       
       # Get session details
-      cursor.execute('''
-        SELECT 
-          ss.id,
-          ss.group_id,
-          g.name as group_name,
-          sa.id as activity_id,
-          sa.name as activity_name,
-          ss.created_at,
-          COUNT(wri.id) as review_items_count
-        FROM study_sessions ss
-        JOIN groups g ON g.id = ss.group_id
-        JOIN study_activities sa ON sa.id = ss.study_activity_id
-        LEFT JOIN word_review_items wri ON wri.study_session_id = ss.id
-        WHERE ss.id = ?
-        GROUP BY ss.id
-      ''', (id,))
+      cursor.execute(queries.SESSION_DETAIL, (g.user_id, id))
       
       session = cursor.fetchone()
       if not session:
@@ -144,28 +305,12 @@ def load(app):
       offset = (page - 1) * per_page
 
       # Get the words reviewed in this session with their review status
-      cursor.execute('''
-        SELECT 
-          w.*,
-          COALESCE(SUM(CASE WHEN wri.correct = 1 THEN 1 ELSE 0 END), 0) as session_correct_count,
-          COALESCE(SUM(CASE WHEN wri.correct = 0 THEN 1 ELSE 0 END), 0) as session_wrong_count
-        FROM words w
-        JOIN word_review_items wri ON wri.word_id = w.id
-        WHERE wri.study_session_id = ?
-        GROUP BY w.id
-        ORDER BY w.kanji
-        LIMIT ? OFFSET ?
-      ''', (id, per_page, offset))
+      cursor.execute(queries.SESSION_WORDS_PAGE, (id, id, per_page, offset))
       
       words = cursor.fetchall()
 
       # Get total count of words
-      cursor.execute('''
-        SELECT COUNT(DISTINCT w.id) as count
-        FROM words w
-        JOIN word_review_items wri ON wri.word_id = w.id
-        WHERE wri.study_session_id = ?
-      ''', (id,))
+      cursor.execute(queries.SESSION_WORDS_COUNT, (id, id))
       
       total_count = cursor.fetchone()['count']
 
@@ -177,7 +322,7 @@ def load(app):
           'activity_id': session['activity_id'],
           'activity_name': session['activity_name'],
           'start_time': session['created_at'],
-          'end_time': session['created_at'],  # For now, just use the same time
+          'end_time': session['end_time'],
           'review_items_count': session['review_items_count']
         },
         'words': [{
@@ -196,6 +341,28 @@ def load(app):
     except Exception as e:
       return jsonify({"error": str(e)}), 500
 
+  # Server-sent events for a session: a 'session' event with its totals
+  # first, then a 'reviews' event for every write logging reviews to it and
+  # another 'session' event once it is ended. Saves dashboards from polling
+  # the session and /dashboard/recent-session.
+  @app.route('/api/study-sessions/<int:id>/events', methods=['GET'])
+  @cross_origin()
+  def get_study_session_events(id):
+    # Subscribe before reading the totals so no review falls in between
+    subscription = app.events.subscribe(session_topic(g.user_id, id))
+    try:
+      cursor = app.db.cursor()
+      cursor.execute(queries.SESSION_PROGRESS, (g.user_id, id))
+      session = cursor.fetchone()
+    except Exception as e:
+      subscription.close()
+      return jsonify({"error": str(e)}), 500
+    if not session:
+      subscription.close()
+      return jsonify({"error": "Study session not found"}), 404
+
+    return event_stream(subscription, session)
+
   @app.route('/study_sessions/<id>/review', methods=['POST'])
   @cross_origin()
   def log_review(id):
@@ -203,64 +370,139 @@ def load(app):
 
     word_id = request.json.get('word_id')
     correct = request.json.get('correct')
+    key = request.headers.get(IDEMPOTENCY_HEADER) or request.json.get('idempotency_key')
         
     if word_id is None or correct is None:
         return jsonify({"error": "word_id and correct fields are required"}), 400
+    if not valid_idempotency_key(key):
+        return jsonify({"error": f"idempotency_key must be a string of at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters"}), 400
 
     # Check if word exists
-    cursor.execute('SELECT id FROM words WHERE id = ?', (word_id,))
+    cursor.execute(queries.WORD_EXISTS, (word_id,))
     if not cursor.fetchone():
         return jsonify({"error": "Word not found"}), 404
 
     # Check if study session exists
-    cursor.execute('SELECT id FROM study_sessions WHERE id = ?', (id,))
+    cursor.execute(queries.SESSION_EXISTS, (g.user_id, id))
     if not cursor.fetchone():
         return jsonify({"error": "Study session not found"}), 404
 
-    # Insert the individual review attempt into word_review_items
-    cursor.execute('''
-        INSERT INTO word_review_items (word_id, correct, study_session_id) VALUES (?, ?, ?)
-    ''', (word_id, correct, id))
-    
-    # Update or insert aggregate review record in word_reviews
-    cursor.execute('''
-        SELECT * FROM word_reviews WHERE word_id = ?
-    ''', (word_id,))
-    review = cursor.fetchone()
-
-    if review:
-        # Update existing record
-        if correct:
-            cursor.execute('''
-           UPDATE word_reviews SET correct_count = correct_count + 1, last_reviewed = ? WHERE word_id = ?
-            ''', (datetime.now(), word_id))
-        else:
-            cursor.execute('''
-                UPDATE word_reviews SET wrong_count = wrong_count + 1, last_reviewed = ? WHERE word_id = ?
-            ''', (datetime.now(), word_id))
-    else:
-        # Insert new record
-        cursor.execute('''
-            INSERT INTO word_reviews (word_id, correct_count, wrong_count, last_reviewed)
-            VALUES (?, ?, ?, ?)
-        ''', (word_id, 1 if correct else 0, 0 if correct else 1, datetime.now()))
+    # A retry of a review that made it the first time
+    if key is not None:
+      cursor.execute(queries.LOGGED_REVIEW_KEYS, (g.user_id, json.dumps([key])))
+      if cursor.fetchone():
+        return jsonify({"message": "Review already logged", "duplicate": True})
+
+    # Insert the review attempt and update the aggregate in word_reviews
+    writes = app.vocabulary.begin_reviews() if app.vocabulary else None
+    try:
+      items = record_reviews(cursor, g.user_id, id, [(word_id, correct, None, key)])
+      app.db.commit()
+    except sqlite3.IntegrityError:
+      # The same key is being logged by a concurrent request
+      app.db.get().rollback()
+      return jsonify({"error": "Review is being logged by another request"}), 409
 
-    app.db.commit()
+    app.cache.invalidate('reviews')
+    if app.vocabulary:
+      app.vocabulary.note_reviews(g.user_id, items, writes)
+    publish_reviews(cursor, id, items)
     return jsonify({"message": "Review logged successfully"})
 
+  # Log many answers at once, e.g. everything a typing tutor session
+  # collected. Body: [{"word_id": 1, "correct": true, "timestamp": "...",
+  # "idempotency_key": "..."}] (or {"reviews": [...]}). Valid items are
+  # stored in one transaction, invalid ones and ones already logged are
+  # reported in the per-item results and skipped.
+  @app.route('/study_sessions/<int:id>/reviews', methods=['POST'])
+  @cross_origin()
+  def log_reviews(id):
+    try:
+      data = request.get_json(silent=True)
+      if isinstance(data, dict):
+        data = data.get('reviews')
+      if not isinstance(data, list):
+        return jsonify({"error": "Request body must be a list of reviews"}), 400
+      if len(data) > MAX_BATCH_REVIEWS:
+        return jsonify({"error": f"At most {MAX_BATCH_REVIEWS} reviews per request"}), 400
+
+      cursor = app.db.cursor()
+
+      # Check if study session exists
+      cursor.execute(queries.SESSION_EXISTS, (g.user_id, id))
+      if not cursor.fetchone():
+        return jsonify({"error": "Study session not found"}), 404
+
+      # Check every referenced word, and every key, in one query each
+      cursor.execute(queries.KNOWN_WORDS, (json.dumps(review_word_ids(data)),))
+      known_words = {row['id'] for row in cursor.fetchall()}
+      request_key = request.headers.get(IDEMPOTENCY_HEADER)
+      cursor.execute(queries.LOGGED_REVIEW_KEYS, (g.user_id, json.dumps(review_keys(data, request_key))))
+      logged_keys = {row['idempotency_key'] for row in cursor.fetchall()}
+      reviews, results = validate_reviews(data, known_words, logged_keys, request_key)
+
+      if reviews:
+        writes = app.vocabulary.begin_reviews() if app.vocabulary else None
+        try:
+          items = record_reviews(cursor, g.user_id, id, reviews)
+          app.db.commit()
+        except sqlite3.IntegrityError:
+          app.db.get().rollback()
+          return jsonify({"error": "Reviews are being logged by another request"}), 409
+        app.cache.invalidate('reviews')
+        if app.vocabulary:
+          app.vocabulary.note_reviews(g.user_id, items, writes)
+        publish_reviews(cursor, id, items)
+
+      duplicates = sum(1 for result in results if result["status"] == "duplicate")
+      return jsonify({
+        "logged": len(reviews),
+        "duplicates": duplicates,
+        "failed": len(data) - len(reviews) - duplicates,
+        "results": results
+      })
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
+  # Mark a session as finished. Until then a session's end time is the time
+  # of its latest review. Ending an already ended session keeps the first time.
+  @app.route('/study_sessions/<int:id>/end', methods=['POST'])
+  @cross_origin()
+  def end_study_session(id):
+    try:
+      cursor = app.db.cursor()
+      cursor.execute(queries.END_SESSION, (datetime.now(), g.user_id, id))
+      if cursor.rowcount == 0:
+        return jsonify({"error": "Study session not found"}), 404
+      app.db.commit()
+
+      cursor.execute(queries.SESSION_ENDED_AT, (id,))
+      ended_at = cursor.fetchone()["ended_at"]
+
+      topic = session_topic(g.user_id, id)
+      if app.events.subscriber_count(topic):
+        cursor.execute(queries.SESSION_PROGRESS, (g.user_id, id))
+        app.events.publish(topic, 'session', session_progress(cursor.fetchone()))
+
+      return jsonify({"session_id": id, "end_time": ended_at})
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
   @app.route('/api/study-sessions/reset', methods=['POST'])
   @cross_origin()
   def reset_study_sessions():
     try:
       cursor = app.db.cursor()
       
-      # First delete all word review items since they have foreign key constraints
-      cursor.execute('DELETE FROM word_review_items')
-      
-      # Then delete all study sessions
-      cursor.execute('DELETE FROM study_sessions')
+      # Delete the user's review items, then their study sessions along
+      # with their dashboard rollups (which don't follow deletes)
+      for statement in queries.RESET_SESSIONS_BATCHES:
+        delete_in_batches(app.db.get(), statement, params=(g.user_id,))
+      for statement in queries.RESET_SESSIONS:
+        cursor.execute(statement, (g.user_id,))
       
       app.db.commit()
+      app.cache.invalidate('reviews', 'sessions')
       
       return jsonify({"message": "Study history cleared successfully"}), 200
     except Exception as e:
@@ -1,6 +1,95 @@
 from flask import request, jsonify, g
 from flask_cors import cross_origin
+import heapq
 import json
+from itertools import islice
+
+from lib.pagination import Keyset, CursorError
+from lib import queries
+from lib.search import query_terms, search_statement, fuzzy_statement, rank_fuzzy
+
+# SQL expressions behind each sortable column, used for keyset pagination
+WORD_SORT_EXPRESSIONS = {
+  'kanji': 'w.kanji',
+  'romaji': 'w.romaji',
+  'english': 'w.english',
+  'correct_count': 'COALESCE(r.correct_count, 0)',
+  'wrong_count': 'COALESCE(r.wrong_count, 0)'
+}
+
+# Review counters, sorted on by reading word_reviews along its per-user
+# indexes (see queries.REVIEWED_WORDS_BY_COUNT) rather than the expressions
+# above
+COUNT_COLUMNS = ('correct_count', 'wrong_count')
+
+# Upper bound for word ids when walking words without reviews
+MAX_WORD_ID = 2 ** 63 - 1
+
+# First leg of a page sorted by a review counter: limit of the user's
+# word_reviews rows starting after (count, word id) when given, in the
+# ascending or descending scan direction
+def reviewed_words_statement(user_id, column, ascending, limit, after=None, group_id=None):
+  op = '>' if ascending else '<'
+  order = 'ASC' if ascending else 'DESC'
+  where, bound = '', ()
+  if after is not None:
+    value, row_id = after
+    if not isinstance(value, int) or not isinstance(row_id, int):
+      raise CursorError('Invalid cursor')
+    where, bound = f' AND (r.{column}, r.word_id) {op} (?, ?)', after
+  if group_id is None:
+    return (queries.REVIEWED_WORDS_BY_COUNT.format(column=column, where=where, order=order),
+            (user_id, *bound, limit))
+  return (queries.GROUP_REVIEWED_WORDS_BY_COUNT.format(column=column, where=where, order=order),
+          (group_id, user_id, *bound, limit))
+
+# Second leg, the words without reviews, which sort as (0, id). The rows the
+# first leg returned tell how far it can go: when they fill the page it
+# ends at their last row, so with that row past 0 in a descending walk
+# there is nothing to read at all (None). Also None when the page starts
+# past every word without reviews.
+def unreviewed_words_statement(user_id, column, ascending, limit, reviewed, after=None, group_id=None):
+  low, high = 0, MAX_WORD_ID
+  if after is not None:
+    value, row_id = after
+    if value == 0:
+      if ascending:
+        low = row_id
+      else:
+        high = row_id
+    elif (value > 0) == ascending:
+      return None
+
+  if len(reviewed) >= limit:
+    value, row_id = reviewed[-1][column], reviewed[-1]['id']
+    if value == 0:
+      if ascending:
+        high = min(high, row_id)
+      else:
+        low = max(low, row_id)
+    elif not ascending:
+      return None
+
+  order = 'ASC' if ascending else 'DESC'
+  if group_id is None:
+    return (queries.UNREVIEWED_WORDS.format(order=order), (low, high, user_id, limit))
+  return (queries.GROUP_UNREVIEWED_WORDS.format(order=order), (group_id, low, high, user_id, limit))
+
+# Merges the rows of both legs into the first limit rows of the page
+def count_sorted_rows(reviewed, unreviewed, column, ascending, limit):
+  key = lambda row: (row[column], row['id'])
+  return list(islice(heapq.merge(reviewed, unreviewed, key=key, reverse=not ascending), limit))
+
+# Rows of a page sorted by a review counter, read through a sqlite3 cursor
+def count_sorted_page(cursor, user_id, column, ascending, limit, after=None, group_id=None):
+  reviewed = cursor.execute(*reviewed_words_statement(user_id, column, ascending, limit, after, group_id)).fetchall()
+  statement = unreviewed_words_statement(user_id, column, ascending, limit, reviewed, after, group_id)
+  unreviewed = cursor.execute(*statement).fetchall() if statement else []
+  return count_sorted_rows(reviewed, unreviewed, column, ascending, limit)
+
+# Limits for GET /api/words/search
+MAX_SEARCH_RESULTS = 100
+MAX_SEARCH_LENGTH = 100
 
 def load(app):
   # Endpoint: GET /words with pagination (50 words per page)
@@ -8,8 +97,6 @@ def load(app):
   @cross_origin()
   def get_words():
     try:
-      cursor = app.db.cursor()
-
       # Get the current page number from query parameters (default is 1)
       page = int(request.args.get('page', 1))
       # Ensure page number is positive
@@ -28,22 +115,56 @@ def load(app):
       if order not in ['asc', 'desc']:
         order = 'asc'
 
-      # Query to fetch words with sorting
-      cursor.execute(f'''
-        SELECT w.id, w.kanji, w.romaji, w.english, 
-            COALESCE(r.correct_count, 0) AS correct_count,
-            COALESCE(r.wrong_count, 0) AS wrong_count
-        FROM words w
-        LEFT JOIN word_reviews r ON w.id = r.word_id
-        ORDER BY {sort_by} {order}
-        LIMIT ? OFFSET ?
-      ''', (words_per_page, offset))
+      # Cursor mode: ?cursor= (empty for the first page) switches to keyset
+      # pagination which skips OFFSET and the COUNT(*) query entirely
+      if 'cursor' in request.args:
+        keyset = Keyset(sort_by, WORD_SORT_EXPRESSIONS[sort_by], order, 'w.id',
+                        cursor=request.args.get('cursor'))
+        if app.vocabulary:
+          rows = app.vocabulary.keyset_rows(g.user_id, keyset, words_per_page + 1)
+        elif sort_by in COUNT_COLUMNS:
+          cursor = app.db.read_cursor()
+          rows = count_sorted_page(cursor, g.user_id, sort_by, keyset.ascending(), words_per_page + 1,
+                                   after=keyset.after())
+        else:
+          cursor = app.db.read_cursor()
+          where, params = keyset.where()
+          cursor.execute(queries.WORDS_KEYSET.format(where=where, order_by=keyset.order_by()),
+                         (g.user_id, *params, words_per_page + 1))
+          rows = cursor.fetchall()
+        words, next_cursor, prev_cursor = keyset.page(rows, words_per_page)
 
-      words = cursor.fetchall()
+        return jsonify({
+          "words": [{
+            "id": word["id"],
+            "kanji": word["kanji"],
+            "romaji": word["romaji"],
+            "english": word["english"],
+            "correct_count": word["correct_count"],
+            "wrong_count": word["wrong_count"]
+          } for word in words],
+          "next_cursor": next_cursor,
+          "prev_cursor": prev_cursor
+        })
+
+      if app.vocabulary:
+        words = app.vocabulary.page(g.user_id, sort_by, order, words_per_page, offset)
+        total_words = app.vocabulary.count()
+      else:
+        cursor = app.db.read_cursor()
+
+        # Query to fetch words with sorting
+        if sort_by in COUNT_COLUMNS:
+          words = count_sorted_page(cursor, g.user_id, sort_by, order == 'asc', offset + words_per_page)[offset:]
+        else:
+          cursor.execute(queries.WORDS_PAGE.format(sort_by=sort_by, order=order),
+                         (g.user_id, words_per_page, offset))
 
-      # Query the total number of words
-      cursor.execute('SELECT COUNT(*) FROM words')
-      total_words = cursor.fetchone()[0]
+          words = cursor.fetchall()
+
+        # Query the total number of words
+        cursor.execute(queries.WORDS_COUNT)
+        total_words = cursor.fetchone()[0]
       total_pages = (total_words + words_per_page - 1) // words_per_page
 
       # Format the response
@@ -65,46 +186,84 @@ def load(app):
         "total_words": total_words
       })
 
+    except CursorError as e:
+      return jsonify({"error": str(e)}), 400
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
+  # Endpoint: GET /api/words/search?q=...&limit=20 finds words by kanji,
+  # kana, romaji (Hepburn or Kunrei, with or without long vowel marks) or
+  # English, ranked best match first. When nothing matches, similar words
+  # are returned instead and "fuzzy" is true.
+  @app.route('/api/words/search', methods=['GET'])
+  @cross_origin()
+  def search_words():
+    try:
+      q, romaji_terms = query_terms(request.args.get('q', ''))
+      if not q:
+        return jsonify({"error": "q is required"}), 400
+      if len(q) > MAX_SEARCH_LENGTH:
+        return jsonify({"error": f"q must be at most {MAX_SEARCH_LENGTH} characters"}), 400
+      limit = request.args.get('limit', 20, type=int)
+      limit = min(max(1, limit), MAX_SEARCH_RESULTS)
+
+      cursor = app.db.read_cursor()
+      cursor.execute(*search_statement(g.user_id, q, romaji_terms, limit))
+      words = cursor.fetchall()
+
+      fuzzy = False
+      statement = fuzzy_statement(g.user_id, q, romaji_terms, limit) if not words else None
+      if statement:
+        cursor.execute(*statement)
+        words = rank_fuzzy(q, romaji_terms, cursor.fetchall(), limit)
+        fuzzy = True
+
+      return jsonify({
+        "query": q,
+        "fuzzy": fuzzy,
+        "words": [{
+          "id": word["id"],
+          "kanji": word["kanji"],
+          "romaji": word["romaji"],
+          "english": word["english"],
+          "correct_count": word["correct_count"],
+          "wrong_count": word["wrong_count"]
+        } for word in words]
+      })
     except Exception as e:
       return jsonify({"error": str(e)}), 500
-    finally:
-      app.db.close()
 
   # Endpoint: GET /words/:id to get a single word with its details
   @app.route('/words/<int:word_id>', methods=['GET'])
   @cross_origin()
+  @app.cache.cached('words', 'groups', 'reviews', per_user=True)
   def get_word(word_id):
     try:
-      cursor = app.db.cursor()
-      
-      # Query to fetch the word and its details
-      cursor.execute('''
-        SELECT w.id, w.kanji, w.romaji, w.english,
-               COALESCE(r.correct_count, 0) AS correct_count,
-               COALESCE(r.wrong_count, 0) AS wrong_count,
-               GROUP_CONCAT(DISTINCT g.id || '::' || g.name) as groups
-        FROM words w
-        LEFT JOIN word_reviews r ON w.id = r.word_id
-        LEFT JOIN word_groups wg ON w.id = wg.word_id
-        LEFT JOIN groups g ON wg.group_id = g.id
-        WHERE w.id = ?
-        GROUP BY w.id
-      ''', (word_id,))
-      
-      word = cursor.fetchone()
-      
-      if not word:
-        return jsonify({"error": "Word not found"}), 404
-      
-      # Parse the groups string into a list of group objects
-      groups = []
-      if word["groups"]:
-        for group_str in word["groups"].split(','):
-          group_id, group_name = group_str.split('::')
-          groups.append({
-            "id": int(group_id),
-            "name": group_name
-          })
+      if app.vocabulary:
+        word = app.vocabulary.word(g.user_id, word_id)
+        if not word:
+          return jsonify({"error": "Word not found"}), 404
+        groups = word["groups"]
+      else:
+        cursor = app.db.read_cursor()
+
+        # Query to fetch the word and its details
+        cursor.execute(queries.WORD_DETAIL, (g.user_id, word_id))
+
+        word = cursor.fetchone()
+
+        if not word:
+          return jsonify({"error": "Word not found"}), 404
+
+        # Parse the groups string into a list of group objects
+        groups = []
+        if word["groups"]:
+          for group_str in word["groups"].split(','):
+            group_id, group_name = group_str.split('::')
+            groups.append({
+              "id": int(group_id),
+              "name": group_name
+            })
       
       return jsonify({
         "word": {
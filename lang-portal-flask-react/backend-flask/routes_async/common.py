@@ -0,0 +1,33 @@
+# Helpers shared by the async route modules
+
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import JSONResponse
+
+from lib.users import USER_HEADER, USER_PARAM, UserIdError, parse_user_id
+
+# Same as Flask's request.args.get(name, default, type=int)
+def int_arg(request, name, default):
+  try:
+    return int(request.query_params.get(name, default))
+  except ValueError:
+    return default
+
+# Counterpart of lib.users.init_app: puts the X-User-Id of every request in
+# request.state.user_id, or answers 400 when it is not a valid id
+class UserMiddleware:
+  def __init__(self, app):
+    self.app = app
+
+  async def __call__(self, scope, receive, send):
+    if scope['type'] == 'http':
+      try:
+        user_id = parse_user_id(Headers(scope=scope).get(USER_HEADER)
+                                or QueryParams(scope['query_string']).get(USER_PARAM))
+      except UserIdError as e:
+        await JSONResponse({"error": str(e)}, status_code=400)(scope, receive, send)
+        return
+      scope.setdefault('state', {})['user_id'] = user_id
+    await self.app(scope, receive, send)
+
+def current_user_id(request):
+  return request.state.user_id
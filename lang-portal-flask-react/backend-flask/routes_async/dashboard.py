@@ -0,0 +1,52 @@
+from starlette.responses import JSONResponse
+
+from lib import queries
+from routes_async.common import current_user_id
+
+# Async versions of the endpoints in routes/dashboard.py, the ones polled
+# the most by open dashboards
+def load(app):
+    db = app.state.db
+
+    async def get_recent_session(request):
+        try:
+            session = await db.fetchone(queries.RECENT_SESSION, (current_user_id(request),), user_id=current_user_id(request))
+            if not session:
+                return JSONResponse(None)
+
+            return JSONResponse({
+                "id": session["id"],
+                "group_id": session["group_id"],
+                "activity_name": session["activity_name"],
+                "created_at": session["created_at"],
+                "correct_count": session["correct_count"],
+                "wrong_count": session["wrong_count"]
+            })
+        except Exception as e:
+            return JSONResponse({"error": str(e)}, status_code=500)
+
+    async def get_study_stats(request):
+        try:
+            async with db.read(current_user_id(request)) as connection:
+                async with connection.execute(queries.DASHBOARD_STATS, (current_user_id(request),)) as cursor:
+                    stats = await cursor.fetchone()
+                async with connection.execute(queries.ACTIVE_GROUPS, (current_user_id(request),)) as cursor:
+                    active_groups = (await cursor.fetchone())["active_groups"]
+                async with connection.execute(queries.CURRENT_STREAK, (current_user_id(request),)) as cursor:
+                    current_streak = (await cursor.fetchone())["streak"]
+
+            success_rate = stats["total_correct"] * 1.0 / stats["total_reviews"] if stats["total_reviews"] else 0
+            return JSONResponse({
+                "total_vocabulary": stats["total_vocabulary"],
+                "total_words_studied": stats["words_studied"],
+                "mastered_words": stats["mastered_words"],
+                "success_rate": success_rate,
+                "total_sessions": stats["total_sessions"],
+                "active_groups": active_groups,
+                "current_streak": current_streak
+            })
+        except Exception as e:
+            return JSONResponse({"error": str(e)}, status_code=500)
+
+    app.add_route('/dashboard/recent-session', get_recent_session, methods=['GET'])
+    app.add_route('/dashboard/stats', get_study_stats, methods=['GET'])
@@ -0,0 +1,236 @@
+from datetime import datetime
+import json
+
+from starlette.responses import JSONResponse, StreamingResponse
+
+from lib.pagination import Keyset, CursorError
+from lib import queries
+from routes.words import WORD_SORT_EXPRESSIONS, COUNT_COLUMNS
+from routes.groups import SESSION_SORT_EXPRESSIONS, MAX_DUE_LIMIT, due_word_data
+from routes_async.common import int_arg, current_user_id
+from routes_async.words import word_data, count_sorted_page
+
+# Async versions of the endpoints in routes/groups.py
+def load(app):
+  db = app.state.db
+
+  async def get_groups(request):
+    try:
+      page = int_arg(request, 'page', 1)
+      groups_per_page = 10
+      offset = (page - 1) * groups_per_page
+
+      sort_by = request.query_params.get('sort_by', 'name')
+      order = request.query_params.get('order', 'asc')
+      if sort_by not in ['name', 'words_count']:
+        sort_by = 'name'
+      if order not in ['asc', 'desc']:
+        order = 'asc'
+
+      async with db.read() as connection:
+        async with connection.execute(queries.GROUPS_PAGE.format(sort_by=sort_by, order=order),
+                                      (groups_per_page, offset)) as cursor:
+          groups = await cursor.fetchall()
+        async with connection.execute(queries.GROUPS_COUNT) as cursor:
+          total_groups = (await cursor.fetchone())[0]
+      total_pages = (total_groups + groups_per_page - 1) // groups_per_page
+
+      return JSONResponse({
+        'groups': [group_data(group) for group in groups],
+        'total_pages': total_pages,
+        'current_page': page
+      })
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  async def get_group(request):
+    try:
+      group = await db.fetchone(queries.GROUP_DETAIL, (request.path_params['id'],))
+      if not group:
+        return JSONResponse({"error": "Group not found"}, status_code=404)
+      return JSONResponse(group_data(group))
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  async def get_group_words(request):
+    try:
+      id = request.path_params['id']
+      page = int_arg(request, 'page', 1)
+      words_per_page = 10
+      offset = (page - 1) * words_per_page
+
+      sort_by = request.query_params.get('sort_by', 'kanji')
+      order = request.query_params.get('order', 'asc')
+      if sort_by not in WORD_SORT_EXPRESSIONS:
+        sort_by = 'kanji'
+      if order not in ['asc', 'desc']:
+        order = 'asc'
+
+      async with db.read(current_user_id(request)) as connection:
+        async with connection.execute(queries.GROUP_NAME, (id,)) as cursor:
+          if not await cursor.fetchone():
+            return JSONResponse({"error": "Group not found"}, status_code=404)
+
+        if 'cursor' in request.query_params:
+          keyset = Keyset(sort_by, WORD_SORT_EXPRESSIONS[sort_by], order, 'w.id',
+                          cursor=request.query_params.get('cursor'))
+          if sort_by in COUNT_COLUMNS:
+            rows = await count_sorted_page(connection, current_user_id(request), sort_by, keyset.ascending(),
+                                           words_per_page + 1, after=keyset.after(), group_id=id)
+          else:
+            where, params = keyset.where()
+            async with connection.execute(queries.GROUP_WORDS_KEYSET.format(where=where, order_by=keyset.order_by()),
+                                          (current_user_id(request), id, *params, words_per_page + 1)) as cursor:
+              rows = await cursor.fetchall()
+          words, next_cursor, prev_cursor = keyset.page(rows, words_per_page)
+          return JSONResponse({
+            'words': [word_data(word) for word in words],
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor
+          })
+
+        if sort_by in COUNT_COLUMNS:
+          # Like OFFSET, a page number below 1 gives the first page
+          start = max(0, offset)
+          words = (await count_sorted_page(connection, current_user_id(request), sort_by, order == 'asc',
+                                           start + words_per_page, group_id=id))[start:]
+        else:
+          async with connection.execute(queries.GROUP_WORDS_PAGE.format(sort_by=sort_by, order=order),
+                                        (current_user_id(request), id, words_per_page, offset)) as cursor:
+            words = await cursor.fetchall()
+        async with connection.execute(queries.GROUP_WORDS_COUNT, (id,)) as cursor:
+          total_words = (await cursor.fetchone())[0]
+      total_pages = (total_words + words_per_page - 1) // words_per_page
+
+      return JSONResponse({
+        'words': [word_data(word) for word in words],
+        'total_pages': total_pages,
+        'current_page': page
+      })
+    except CursorError as e:
+      return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  async def get_group_words_raw(request):
+    try:
+      id = request.path_params['id']
+      group = await db.fetchone(queries.GROUP_NAME, (id,))
+      if not group:
+        return JSONResponse({"error": "Group not found"}, status_code=404)
+
+      # The connection is held while the body streams out, see the Flask route
+      async def generate():
+        async with db.read() as connection:
+          async with connection.execute(queries.GROUP_WORDS_RAW, (id,)) as cursor:
+            yield '{"group_id":%d,"group_name":%s,"words":[' % (id, json.dumps(group["name"]))
+            separator = ''
+            while True:
+              rows = await cursor.fetchmany(500)
+              if not rows:
+                break
+              yield separator + ','.join(row["payload"] for row in rows)
+              separator = ','
+        yield ']}\n'
+
+      return StreamingResponse(generate(), media_type='application/json')
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  async def get_group_due_words(request):
+    try:
+      id = request.path_params['id']
+      limit = min(max(1, int_arg(request, 'limit', 20)), MAX_DUE_LIMIT)
+
+      async with db.read(current_user_id(request)) as connection:
+        async with connection.execute(queries.GROUP_NAME, (id,)) as cursor:
+          if not await cursor.fetchone():
+            return JSONResponse({"error": "Group not found"}, status_code=404)
+
+        async with connection.execute(queries.DUE_WORDS, (id, current_user_id(request), datetime.now(), limit)) as cursor:
+          words = list(await cursor.fetchall())
+        if len(words) < limit:
+          async with connection.execute(queries.NEW_WORDS, (id, current_user_id(request), limit - len(words))) as cursor:
+            words += await cursor.fetchall()
+
+      return JSONResponse({
+        'group_id': id,
+        'words': [due_word_data(word) for word in words]
+      })
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  async def get_group_study_sessions(request):
+    try:
+      id = request.path_params['id']
+      page = int_arg(request, 'page', 1)
+      sessions_per_page = 10
+      offset = (page - 1) * sessions_per_page
+
+      sort_by = request.query_params.get('sort_by', 'created_at')
+      order = request.query_params.get('order', 'desc')
+      if sort_by not in SESSION_SORT_EXPRESSIONS:
+        sort_by = 'created_at'
+      sort_column = SESSION_SORT_EXPRESSIONS[sort_by]
+      if order not in ['asc', 'desc']:
+        order = 'desc'
+
+      cursor_mode = 'cursor' in request.query_params
+      async with db.read(current_user_id(request)) as connection:
+        if cursor_mode:
+          keyset = Keyset(sort_by, sort_column, order, 'id',
+                          cursor=request.query_params.get('cursor'), sort_key='sort_value')
+          where, params = keyset.where()
+          async with connection.execute(queries.GROUP_SESSIONS_KEYSET.format(sort_by=sort_column, where=where, order_by=keyset.order_by()),
+                                        (current_user_id(request), id, *params, sessions_per_page + 1)) as cursor:
+            rows = await cursor.fetchall()
+          sessions, next_cursor, prev_cursor = keyset.page(rows, sessions_per_page)
+        else:
+          async with connection.execute(queries.GROUP_SESSIONS_COUNT, (current_user_id(request), id)) as cursor:
+            total_sessions = (await cursor.fetchone())[0]
+          total_pages = (total_sessions + sessions_per_page - 1) // sessions_per_page
+          async with connection.execute(queries.GROUP_SESSIONS_PAGE.format(sort_by=sort_column, order=order),
+                                        (current_user_id(request), id, sessions_per_page, offset)) as cursor:
+            sessions = await cursor.fetchall()
+
+      sessions_data = [{
+        "id": session["id"],
+        "group_id": session["group_id"],
+        "group_name": session["group_name"],
+        "study_activity_id": session["study_activity_id"],
+        "activity_name": session["activity_name"],
+        "start_time": session["start_time"],
+        "end_time": session["end_time"],
+        "review_items_count": session["review_count"]
+      } for session in sessions]
+
+      if cursor_mode:
+        return JSONResponse({
+          'study_sessions': sessions_data,
+          'next_cursor': next_cursor,
+          'prev_cursor': prev_cursor
+        })
+
+      return JSONResponse({
+        'study_sessions': sessions_data,
+        'total_pages': total_pages,
+        'current_page': page
+      })
+    except CursorError as e:
+      return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  app.add_route('/groups', get_groups, methods=['GET'])
+  app.add_route('/groups/{id:int}', get_group, methods=['GET'])
+  app.add_route('/groups/{id:int}/words', get_group_words, methods=['GET'])
+  app.add_route('/api/groups/{id:int}/words/raw', get_group_words_raw, methods=['GET'])
+  app.add_route('/api/groups/{id:int}/due', get_group_due_words, methods=['GET'])
+  app.add_route('/groups/{id:int}/study_sessions', get_group_study_sessions, methods=['GET'])
+
+def group_data(group):
+  return {
+    "id": group["id"],
+    "group_name": group["name"],
+    "word_count": group["words_count"]
+  }
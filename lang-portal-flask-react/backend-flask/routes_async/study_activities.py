@@ -0,0 +1,94 @@
+from starlette.responses import JSONResponse
+import math
+
+from lib.pagination import Keyset, CursorError
+from lib import queries
+from routes_async.common import int_arg, current_user_id
+from routes_async.study_sessions import session_data
+
+# Async versions of the endpoints in routes/study_activities.py
+def load(app):
+    db = app.state.db
+
+    async def get_study_activities(request):
+        activities = await db.fetchall(queries.ACTIVITIES)
+        return JSONResponse([activity_data(activity) for activity in activities])
+
+    async def get_study_activity(request):
+        activity = await db.fetchone(queries.ACTIVITY_DETAIL, (request.path_params['id'],))
+        if not activity:
+            return JSONResponse({'error': 'Activity not found'}, status_code=404)
+        return JSONResponse(activity_data(activity))
+
+    async def get_study_activity_sessions(request):
+        id = request.path_params['id']
+        page = int_arg(request, 'page', 1)
+        per_page = int_arg(request, 'per_page', 10)
+        offset = (page - 1) * per_page
+
+        async with db.read(current_user_id(request)) as connection:
+            async with connection.execute(queries.ACTIVITY_EXISTS, (id,)) as cursor:
+                if not await cursor.fetchone():
+                    return JSONResponse({'error': 'Activity not found'}, status_code=404)
+
+            if 'cursor' in request.query_params:
+                try:
+                    keyset = Keyset('created_at', 'ss.created_at', 'desc', 'ss.id',
+                                    cursor=request.query_params.get('cursor'))
+                except CursorError as e:
+                    return JSONResponse({'error': str(e)}, status_code=400)
+                where, params = keyset.where()
+                async with connection.execute(queries.ACTIVITY_SESSIONS_KEYSET.format(where=where, order_by=keyset.order_by()),
+                                              (current_user_id(request), id, *params, per_page + 1)) as cursor:
+                    rows = await cursor.fetchall()
+                sessions, next_cursor, prev_cursor = keyset.page(rows, per_page)
+
+                return JSONResponse({
+                    'items': [session_data(session) for session in sessions],
+                    'per_page': per_page,
+                    'next_cursor': next_cursor,
+                    'prev_cursor': prev_cursor
+                })
+
+            async with connection.execute(queries.ACTIVITY_SESSIONS_COUNT, (current_user_id(request), id)) as cursor:
+                total_count = (await cursor.fetchone())['count']
+            async with connection.execute(queries.ACTIVITY_SESSIONS_PAGE, (current_user_id(request), id, per_page, offset)) as cursor:
+                sessions = await cursor.fetchall()
+
+        return JSONResponse({
+            'items': [session_data(session) for session in sessions],
+            'total': total_count,
+            'page': page,
+            'per_page': per_page,
+            'total_pages': math.ceil(total_count / per_page)
+        })
+
+    async def get_study_activity_launch_data(request):
+        async with db.read() as connection:
+            async with connection.execute(queries.ACTIVITY_DETAIL, (request.path_params['id'],)) as cursor:
+                activity = await cursor.fetchone()
+            if not activity:
+                return JSONResponse({'error': 'Activity not found'}, status_code=404)
+            async with connection.execute(queries.GROUPS_ALL) as cursor:
+                groups = await cursor.fetchall()
+
+        return JSONResponse({
+            'activity': activity_data(activity),
+            'groups': [{
+                'id': group['id'],
+                'name': group['name']
+            } for group in groups]
+        })
+
+    app.add_route('/api/study-activities', get_study_activities, methods=['GET'])
+    app.add_route('/api/study-activities/{id:int}', get_study_activity, methods=['GET'])
+    app.add_route('/api/study-activities/{id:int}/sessions', get_study_activity_sessions, methods=['GET'])
+    app.add_route('/api/study-activities/{id:int}/launch', get_study_activity_launch_data, methods=['GET'])
+
+def activity_data(activity):
+    return {
+        'id': activity['id'],
+        'title': activity['name'],
+        'launch_url': activity['url'],
+        'preview_url': activity['preview_url']
+    }
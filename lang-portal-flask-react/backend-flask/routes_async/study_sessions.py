@@ -0,0 +1,309 @@
+from starlette.responses import JSONResponse, StreamingResponse
+from datetime import datetime
+import json
+import math
+import sqlite3
+
+from lib.pagination import Keyset, CursorError
+from lib import queries
+from lib.scheduler import schedule_rows
+from lib.maintenance import DEFAULT_BATCH_SIZE
+from lib.events import HEARTBEAT, format_event, session_topic
+from routes.study_sessions import (
+  MAX_BATCH_REVIEWS, MAX_IDEMPOTENCY_KEY_LENGTH, IDEMPOTENCY_HEADER, review_rows, review_word_ids, review_keys,
+  valid_idempotency_key, validate_reviews, session_progress, reviews_event
+)
+from routes_async.common import int_arg, current_user_id
+
+# Async versions of the endpoints in routes/study_sessions.py
+
+# See routes.study_sessions.record_reviews
+async def record_reviews(connection, user_id, session_id, reviews):
+  items, totals = review_rows(user_id, session_id, reviews)
+  await connection.executemany(queries.INSERT_REVIEW_ITEM, items)
+  await connection.executemany(queries.UPSERT_WORD_REVIEW, totals)
+
+  async with connection.execute(queries.REVIEW_SCHEDULES, (json.dumps([row[1] for row in totals]), user_id)) as cursor:
+    states = {row['word_id']: (row['ease'], row['interval_days'], row['repetitions']) for row in await cursor.fetchall()}
+  await connection.executemany(queries.UPDATE_SCHEDULE, schedule_rows(states, items))
+  return items
+
+async def exists(connection, sql, *params):
+  async with connection.execute(sql, params) as cursor:
+    return await cursor.fetchone() is not None
+
+async def json_body(request):
+  try:
+    return await request.json()
+  except ValueError:
+    return None
+
+def load(app):
+  db = app.state.db
+  events = app.state.events
+
+  # See routes.study_sessions.load
+  async def publish(connection, user_id, session_id, name, data_for):
+    topic = session_topic(user_id, session_id)
+    if events.subscriber_count(topic):
+      async with connection.execute(queries.SESSION_PROGRESS, (user_id, session_id)) as cursor:
+        events.publish(topic, name, data_for(await cursor.fetchone()))
+
+  async def create_study_session(request):
+    try:
+      data = await json_body(request) or {}
+      group_id = data.get('group_id')
+      study_activity_id = data.get('study_activity_id')
+
+      if not group_id:
+        return JSONResponse({"error": "group_id is required"}, status_code=400)
+      if not study_activity_id:
+        return JSONResponse({"error": "study_activity_id is required"}, status_code=400)
+
+      async with db.write(current_user_id(request)) as connection:
+        if not await exists(connection, queries.GROUP_EXISTS, group_id):
+          return JSONResponse({"error": "Group not found"}, status_code=404)
+        if not await exists(connection, queries.ACTIVITY_EXISTS, study_activity_id):
+          return JSONResponse({"error": "Study activity not found"}, status_code=404)
+
+        async with connection.execute(queries.INSERT_SESSION, (current_user_id(request), group_id, study_activity_id, datetime.now())) as cursor:
+          session_id = cursor.lastrowid
+        await connection.commit()
+
+      return JSONResponse({"session_id": session_id}, status_code=201)
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  async def get_study_sessions(request):
+    try:
+      page = int_arg(request, 'page', 1)
+      per_page = int_arg(request, 'per_page', 10)
+      offset = (page - 1) * per_page
+
+      if 'cursor' in request.query_params:
+        keyset = Keyset('created_at', 'ss.created_at', 'desc', 'ss.id',
+                        cursor=request.query_params.get('cursor'))
+        where, params = keyset.where()
+        rows = await db.fetchall(queries.SESSIONS_KEYSET.format(where=where, order_by=keyset.order_by()),
+                                 (current_user_id(request), *params, per_page + 1), user_id=current_user_id(request))
+        sessions, next_cursor, prev_cursor = keyset.page(rows, per_page)
+        return JSONResponse({
+          'items': [session_data(session) for session in sessions],
+          'per_page': per_page,
+          'next_cursor': next_cursor,
+          'prev_cursor': prev_cursor
+        })
+
+      async with db.read(current_user_id(request)) as connection:
+        async with connection.execute(queries.SESSIONS_COUNT, (current_user_id(request),)) as cursor:
+          total_count = (await cursor.fetchone())['count']
+        async with connection.execute(queries.SESSIONS_PAGE, (current_user_id(request), per_page, offset)) as cursor:
+          sessions = await cursor.fetchall()
+
+      return JSONResponse({
+        'items': [session_data(session) for session in sessions],
+        'total': total_count,
+        'page': page,
+        'per_page': per_page,
+        'total_pages': math.ceil(total_count / per_page)
+      })
+    except CursorError as e:
+      return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  async def get_study_session(request):
+    try:
+      id = request.path_params['id']
+      page = int_arg(request, 'page', 1)
+      per_page = int_arg(request, 'per_page', 10)
+      offset = (page - 1) * per_page
+
+      async with db.read(current_user_id(request)) as connection:
+        async with connection.execute(queries.SESSION_DETAIL, (current_user_id(request), id)) as cursor:
+          session = await cursor.fetchone()
+        if not session:
+          return JSONResponse({"error": "Study session not found"}, status_code=404)
+
+        async with connection.execute(queries.SESSION_WORDS_PAGE, (id, id, per_page, offset)) as cursor:
+          words = await cursor.fetchall()
+        async with connection.execute(queries.SESSION_WORDS_COUNT, (id, id)) as cursor:
+          total_count = (await cursor.fetchone())['count']
+
+      return JSONResponse({
+        'session': session_data(session),
+        'words': [{
+          'id': word['id'],
+          'kanji': word['kanji'],
+          'romaji': word['romaji'],
+          'english': word['english'],
+          'correct_count': word['session_correct_count'],
+          'wrong_count': word['session_wrong_count']
+        } for word in words],
+        'total': total_count,
+        'page': page,
+        'per_page': per_page,
+        'total_pages': math.ceil(total_count / per_page)
+      })
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  async def get_study_session_events(request):
+    id = request.path_params['id']
+    subscription = events.subscribe_async(session_topic(current_user_id(request), id))
+    try:
+      session = await db.fetchone(queries.SESSION_PROGRESS, (current_user_id(request), id), user_id=current_user_id(request))
+    except Exception as e:
+      subscription.close()
+      return JSONResponse({"error": str(e)}, status_code=500)
+    if not session:
+      subscription.close()
+      return JSONResponse({"error": "Study session not found"}, status_code=404)
+
+    # Starlette cancels the generator when the client goes away
+    async def generate():
+      with subscription:
+        yield format_event('session', session_progress(session))
+        while not subscription.overflowed:
+          event = await subscription.get()
+          if event is None:
+            yield HEARTBEAT
+          else:
+            event_id, name, data = event
+            yield format_event(name, data, id=event_id)
+
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+  async def log_review(request):
+    try:
+      id = request.path_params['id']
+      data = await json_body(request) or {}
+      word_id = data.get('word_id')
+      correct = data.get('correct')
+      key = request.headers.get(IDEMPOTENCY_HEADER) or data.get('idempotency_key')
+
+      if word_id is None or correct is None:
+        return JSONResponse({"error": "word_id and correct fields are required"}, status_code=400)
+      if not valid_idempotency_key(key):
+        return JSONResponse({"error": f"idempotency_key must be a string of at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters"}, status_code=400)
+
+      async with db.write(current_user_id(request)) as connection:
+        if not await exists(connection, queries.WORD_EXISTS, word_id):
+          return JSONResponse({"error": "Word not found"}, status_code=404)
+        if not await exists(connection, queries.SESSION_EXISTS, current_user_id(request), id):
+          return JSONResponse({"error": "Study session not found"}, status_code=404)
+
+        if key is not None and await exists(connection, queries.LOGGED_REVIEW_KEYS, current_user_id(request), json.dumps([key])):
+          return JSONResponse({"message": "Review already logged", "duplicate": True})
+
+        try:
+          items = await record_reviews(connection, current_user_id(request), id, [(word_id, correct, None, key)])
+          await connection.commit()
+        except sqlite3.IntegrityError:
+          await connection.rollback()
+          return JSONResponse({"error": "Review is being logged by another request"}, status_code=409)
+        await publish(connection, current_user_id(request), id, 'reviews', lambda session: reviews_event(session, items))
+
+      await app.state.invalidate_cache('reviews')
+      return JSONResponse({"message": "Review logged successfully"})
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  async def log_reviews(request):
+    try:
+      id = request.path_params['id']
+      data = await json_body(request)
+      if isinstance(data, dict):
+        data = data.get('reviews')
+      if not isinstance(data, list):
+        return JSONResponse({"error": "Request body must be a list of reviews"}, status_code=400)
+      if len(data) > MAX_BATCH_REVIEWS:
+        return JSONResponse({"error": f"At most {MAX_BATCH_REVIEWS} reviews per request"}, status_code=400)
+
+      async with db.write(current_user_id(request)) as connection:
+        if not await exists(connection, queries.SESSION_EXISTS, current_user_id(request), id):
+          return JSONResponse({"error": "Study session not found"}, status_code=404)
+
+        async with connection.execute(queries.KNOWN_WORDS, (json.dumps(review_word_ids(data)),)) as cursor:
+          known_words = {row['id'] for row in await cursor.fetchall()}
+        request_key = request.headers.get(IDEMPOTENCY_HEADER)
+        async with connection.execute(queries.LOGGED_REVIEW_KEYS, (current_user_id(request), json.dumps(review_keys(data, request_key)))) as cursor:
+          logged_keys = {row['idempotency_key'] for row in await cursor.fetchall()}
+        reviews, results = validate_reviews(data, known_words, logged_keys, request_key)
+
+        if reviews:
+          try:
+            items = await record_reviews(connection, current_user_id(request), id, reviews)
+            await connection.commit()
+          except sqlite3.IntegrityError:
+            await connection.rollback()
+            return JSONResponse({"error": "Reviews are being logged by another request"}, status_code=409)
+          await publish(connection, current_user_id(request), id, 'reviews', lambda session: reviews_event(session, items))
+
+      if reviews:
+        await app.state.invalidate_cache('reviews')
+
+      duplicates = sum(1 for result in results if result["status"] == "duplicate")
+      return JSONResponse({
+        "logged": len(reviews),
+        "duplicates": duplicates,
+        "failed": len(data) - len(reviews) - duplicates,
+        "results": results
+      })
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  async def end_study_session(request):
+    try:
+      id = request.path_params['id']
+      async with db.write(current_user_id(request)) as connection:
+        async with connection.execute(queries.END_SESSION, (datetime.now(), current_user_id(request), id)) as cursor:
+          if cursor.rowcount == 0:
+            return JSONResponse({"error": "Study session not found"}, status_code=404)
+        await connection.commit()
+        async with connection.execute(queries.SESSION_ENDED_AT, (id,)) as cursor:
+          ended_at = (await cursor.fetchone())["ended_at"]
+        await publish(connection, current_user_id(request), id, 'session', session_progress)
+      return JSONResponse({"session_id": id, "end_time": ended_at})
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  async def reset_study_sessions(request):
+    try:
+      async with db.write(current_user_id(request)) as connection:
+        for statement in queries.RESET_SESSIONS_BATCHES:
+          while True:
+            cursor = await connection.execute(statement, (current_user_id(request), DEFAULT_BATCH_SIZE))
+            await connection.commit()
+            if cursor.rowcount <= 0:
+              break
+        for statement in queries.RESET_SESSIONS:
+          await connection.execute(statement, (current_user_id(request),))
+        await connection.commit()
+
+      await app.state.invalidate_cache('reviews', 'sessions')
+      return JSONResponse({"message": "Study history cleared successfully"})
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  app.add_route('/study_sessions', create_study_session, methods=['POST'])
+  app.add_route('/api/study-sessions', get_study_sessions, methods=['GET'])
+  app.add_route('/api/study-sessions/reset', reset_study_sessions, methods=['POST'])
+  app.add_route('/api/study-sessions/{id:int}/events', get_study_session_events, methods=['GET'])
+  app.add_route('/api/study-sessions/{id}', get_study_session, methods=['GET'])
+  app.add_route('/study_sessions/{id}/review', log_review, methods=['POST'])
+  app.add_route('/study_sessions/{id:int}/reviews', log_reviews, methods=['POST'])
+  app.add_route('/study_sessions/{id:int}/end', end_study_session, methods=['POST'])
+
+def session_data(session):
+  return {
+    'id': session['id'],
+    'group_id': session['group_id'],
+    'group_name': session['group_name'],
+    'activity_id': session['activity_id'],
+    'activity_name': session['activity_name'],
+    'start_time': session['created_at'],
+    'end_time': session['end_time'],
+    'review_items_count': session['review_items_count']
+  }
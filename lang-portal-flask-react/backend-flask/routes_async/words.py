@@ -0,0 +1,138 @@
+from starlette.responses import JSONResponse
+
+from lib.pagination import Keyset, CursorError
+from lib import queries
+from lib.search import query_terms, search_statement, fuzzy_statement, rank_fuzzy
+from routes.words import (WORD_SORT_EXPRESSIONS, COUNT_COLUMNS, MAX_SEARCH_RESULTS, MAX_SEARCH_LENGTH,
+                          reviewed_words_statement, unreviewed_words_statement, count_sorted_rows)
+from routes_async.common import int_arg, current_user_id
+
+# routes.words.count_sorted_page over an async connection
+async def count_sorted_page(connection, user_id, column, ascending, limit, after=None, group_id=None):
+  async with connection.execute(*reviewed_words_statement(user_id, column, ascending, limit, after, group_id)) as cursor:
+    reviewed = await cursor.fetchall()
+  unreviewed = []
+  statement = unreviewed_words_statement(user_id, column, ascending, limit, reviewed, after, group_id)
+  if statement:
+    async with connection.execute(*statement) as cursor:
+      unreviewed = await cursor.fetchall()
+  return count_sorted_rows(reviewed, unreviewed, column, ascending, limit)
+
+# Async versions of the endpoints in routes/words.py
+def load(app):
+  db = app.state.db
+
+  # Endpoint: GET /words with pagination (50 words per page)
+  async def get_words(request):
+    try:
+      page = max(1, int_arg(request, 'page', 1))
+      words_per_page = 50
+      offset = (page - 1) * words_per_page
+
+      sort_by = request.query_params.get('sort_by', 'kanji')
+      order = request.query_params.get('order', 'asc')
+      if sort_by not in WORD_SORT_EXPRESSIONS:
+        sort_by = 'kanji'
+      if order not in ['asc', 'desc']:
+        order = 'asc'
+
+      if 'cursor' in request.query_params:
+        keyset = Keyset(sort_by, WORD_SORT_EXPRESSIONS[sort_by], order, 'w.id',
+                        cursor=request.query_params.get('cursor'))
+        if sort_by in COUNT_COLUMNS:
+          async with db.read(current_user_id(request)) as connection:
+            rows = await count_sorted_page(connection, current_user_id(request), sort_by, keyset.ascending(),
+                                           words_per_page + 1, after=keyset.after())
+        else:
+          where, params = keyset.where()
+          rows = await db.fetchall(queries.WORDS_KEYSET.format(where=where, order_by=keyset.order_by()),
+                                   (current_user_id(request), *params, words_per_page + 1), user_id=current_user_id(request))
+        words, next_cursor, prev_cursor = keyset.page(rows, words_per_page)
+        return JSONResponse({
+          "words": [word_data(word) for word in words],
+          "next_cursor": next_cursor,
+          "prev_cursor": prev_cursor
+        })
+
+      async with db.read(current_user_id(request)) as connection:
+        if sort_by in COUNT_COLUMNS:
+          words = (await count_sorted_page(connection, current_user_id(request), sort_by, order == 'asc',
+                                           offset + words_per_page))[offset:]
+        else:
+          async with connection.execute(queries.WORDS_PAGE.format(sort_by=sort_by, order=order),
+                                        (current_user_id(request), words_per_page, offset)) as cursor:
+            words = await cursor.fetchall()
+        async with connection.execute(queries.WORDS_COUNT) as cursor:
+          total_words = (await cursor.fetchone())[0]
+      total_pages = (total_words + words_per_page - 1) // words_per_page
+
+      return JSONResponse({
+        "words": [word_data(word) for word in words],
+        "total_pages": total_pages,
+        "current_page": page,
+        "total_words": total_words
+      })
+    except CursorError as e:
+      return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  # Endpoint: GET /api/words/search?q=
+  async def search_words(request):
+    try:
+      q, romaji_terms = query_terms(request.query_params.get('q', ''))
+      if not q:
+        return JSONResponse({"error": "q is required"}, status_code=400)
+      if len(q) > MAX_SEARCH_LENGTH:
+        return JSONResponse({"error": f"q must be at most {MAX_SEARCH_LENGTH} characters"}, status_code=400)
+      limit = min(max(1, int_arg(request, 'limit', 20)), MAX_SEARCH_RESULTS)
+
+      words = await db.fetchall(*search_statement(current_user_id(request), q, romaji_terms, limit), user_id=current_user_id(request))
+      fuzzy = False
+      statement = fuzzy_statement(current_user_id(request), q, romaji_terms, limit) if not words else None
+      if statement:
+        words = rank_fuzzy(q, romaji_terms, await db.fetchall(*statement, user_id=current_user_id(request)), limit)
+        fuzzy = True
+
+      return JSONResponse({
+        "query": q,
+        "fuzzy": fuzzy,
+        "words": [word_data(word) for word in words]
+      })
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  # Endpoint: GET /words/:id to get a single word with its details
+  async def get_word(request):
+    try:
+      word = await db.fetchone(queries.WORD_DETAIL, (current_user_id(request), request.path_params['word_id']),
+                               user_id=current_user_id(request))
+      if not word:
+        return JSONResponse({"error": "Word not found"}, status_code=404)
+
+      groups = []
+      if word["groups"]:
+        for group_str in word["groups"].split(','):
+          group_id, group_name = group_str.split('::')
+          groups.append({
+            "id": int(group_id),
+            "name": group_name
+          })
+
+      return JSONResponse({"word": dict(word_data(word), groups=groups)})
+    except Exception as e:
+      return JSONResponse({"error": str(e)}, status_code=500)
+
+  app.add_route('/words', get_words, methods=['GET'])
+  app.add_route('/api/words/search', search_words, methods=['GET'])
+  app.add_route('/words/{word_id:int}', get_word, methods=['GET'])
+
+def word_data(word):
+  return {
+    "id": word["id"],
+    "kanji": word["kanji"],
+    "romaji": word["romaji"],
+    "english": word["english"],
+    "correct_count": word["correct_count"],
+    "wrong_count": word["wrong_count"]
+  }
@@ -0,0 +1,52 @@
+-- Recompute every dashboard rollup from the raw tables, for every user.
+-- Used by `invoke rebuild-dashboard-stats` to backfill or repair the rollups.
+-- Reviews are in word_review_items and, once archived by
+-- lib/maintenance.py, in word_review_archive.
+DELETE FROM word_review_stats;
+INSERT INTO word_review_stats (user_id, word_id, attempts, correct_count)
+  SELECT user_id, word_id, SUM(attempts), SUM(correct_count)
+  FROM (
+    SELECT ss.user_id, wri.word_id, COUNT(*) AS attempts, SUM(CASE WHEN wri.correct = 1 THEN 1 ELSE 0 END) AS correct_count
+    FROM word_review_items wri
+    JOIN study_sessions ss ON wri.study_session_id = ss.id
+    GROUP BY ss.user_id, wri.word_id
+    UNION ALL
+    SELECT ss.user_id, a.word_id, SUM(a.correct_count + a.wrong_count), SUM(a.correct_count)
+    FROM word_review_archive a
+    JOIN study_sessions ss ON a.study_session_id = ss.id
+    GROUP BY ss.user_id, a.word_id
+  )
+  GROUP BY user_id, word_id;
+
+UPDATE study_sessions
+SET correct_count = (SELECT COUNT(*) FROM word_review_items WHERE study_session_id = study_sessions.id AND correct = 1)
+      + (SELECT COALESCE(SUM(correct_count), 0) FROM word_review_archive WHERE study_session_id = study_sessions.id),
+    wrong_count = (SELECT COUNT(*) FROM word_review_items WHERE study_session_id = study_sessions.id AND correct = 0)
+      + (SELECT COALESCE(SUM(wrong_count), 0) FROM word_review_archive WHERE study_session_id = study_sessions.id),
+    last_activity_at = (
+      SELECT MAX(reviewed_at) FROM (
+        SELECT created_at AS reviewed_at FROM word_review_items WHERE study_session_id = study_sessions.id
+        UNION ALL
+        SELECT last_reviewed_at FROM word_review_archive WHERE study_session_id = study_sessions.id
+      )
+    );
+
+DELETE FROM study_days;
+INSERT INTO study_days (user_id, study_date, session_count)
+  SELECT user_id, date(created_at), COUNT(*) FROM study_sessions GROUP BY user_id, date(created_at);
+
+DELETE FROM group_activity;
+INSERT INTO group_activity (user_id, group_id, last_session_at)
+  SELECT user_id, group_id, MAX(created_at) FROM study_sessions GROUP BY user_id, group_id;
+
+DELETE FROM dashboard_stats;
+INSERT INTO dashboard_stats (user_id, total_sessions, total_reviews, total_correct, words_studied, mastered_words)
+  SELECT u.user_id,
+    (SELECT COUNT(*) FROM study_sessions WHERE user_id = u.user_id),
+    (SELECT COALESCE(SUM(attempts), 0) FROM word_review_stats WHERE user_id = u.user_id),
+    (SELECT COALESCE(SUM(correct_count), 0) FROM word_review_stats WHERE user_id = u.user_id),
+    (SELECT COUNT(*) FROM word_review_stats WHERE user_id = u.user_id),
+    (SELECT COUNT(*) FROM word_review_stats WHERE user_id = u.user_id AND attempts >= 5 AND correct_count * 1.0 / attempts >= 0.8)
+  FROM (SELECT DISTINCT user_id FROM study_sessions) u;
+
+UPDATE catalog_stats SET total_vocabulary = (SELECT COUNT(*) FROM words) WHERE id = 1;
@@ -0,0 +1,13 @@
+-- Composite indexes backing keyset (cursor) pagination. Each one covers a
+-- sortable column plus the id tie breaker so a page is a single range scan.
+CREATE INDEX IF NOT EXISTS idx_words_kanji_id ON words(kanji, id);
+CREATE INDEX IF NOT EXISTS idx_words_romaji_id ON words(romaji, id);
+CREATE INDEX IF NOT EXISTS idx_words_english_id ON words(english, id);
+
+-- correct_count/wrong_count live on word_reviews
+CREATE INDEX IF NOT EXISTS idx_word_reviews_correct_count_word_id ON word_reviews(correct_count, word_id);
+CREATE INDEX IF NOT EXISTS idx_word_reviews_wrong_count_word_id ON word_reviews(wrong_count, word_id);
+
+-- Session listings are ordered newest first, globally and per activity
+CREATE INDEX IF NOT EXISTS idx_study_sessions_created_at_id ON study_sessions(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_activity_created_at_id ON study_sessions(study_activity_id, created_at, id);
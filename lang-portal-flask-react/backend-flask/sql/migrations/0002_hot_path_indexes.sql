@@ -0,0 +1,40 @@
+-- Give word_groups a primary key. SQLite cannot add one to an existing
+-- table, so rebuild it (dropping any duplicate links on the way) keyed by
+-- (group_id, word_id) to serve the per-group word listings.
+CREATE TABLE word_groups_new (
+  word_id INTEGER NOT NULL,
+  group_id INTEGER NOT NULL,
+  PRIMARY KEY (group_id, word_id),
+  FOREIGN KEY (word_id) REFERENCES words(id),
+  FOREIGN KEY (group_id) REFERENCES groups(id)
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO word_groups_new (word_id, group_id)
+  SELECT word_id, group_id FROM word_groups;
+DROP TABLE word_groups;
+ALTER TABLE word_groups_new RENAME TO word_groups;
+
+-- Reverse lookup used by GET /words/:id
+CREATE INDEX IF NOT EXISTS idx_word_groups_word_id ON word_groups(word_id);
+
+-- Duplicate links may have inflated the counter cache
+UPDATE groups
+SET words_count = (SELECT COUNT(*) FROM word_groups WHERE group_id = groups.id);
+
+-- Review items are looked up by session (counts, last activity) and by word
+CREATE INDEX IF NOT EXISTS idx_word_review_items_study_session_id ON word_review_items(study_session_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_word_review_items_word_id ON word_review_items(word_id);
+
+-- word_reviews holds one aggregate row per word. Fold any duplicate rows
+-- into the oldest one before enforcing that with a UNIQUE index.
+UPDATE word_reviews
+SET correct_count = (SELECT SUM(correct_count) FROM word_reviews dup WHERE dup.word_id = word_reviews.word_id),
+    wrong_count = (SELECT SUM(wrong_count) FROM word_reviews dup WHERE dup.word_id = word_reviews.word_id),
+    last_reviewed = (SELECT MAX(last_reviewed) FROM word_reviews dup WHERE dup.word_id = word_reviews.word_id)
+WHERE id IN (SELECT MIN(id) FROM word_reviews GROUP BY word_id HAVING COUNT(*) > 1);
+DELETE FROM word_reviews
+WHERE id NOT IN (SELECT MIN(id) FROM word_reviews GROUP BY word_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_word_reviews_word_id ON word_reviews(word_id);
+
+-- Sessions are listed newest first (idx_study_sessions_created_at_id from
+-- 0001 covers created_at) and per group
+CREATE INDEX IF NOT EXISTS idx_study_sessions_group_id_created_at ON study_sessions(group_id, created_at);
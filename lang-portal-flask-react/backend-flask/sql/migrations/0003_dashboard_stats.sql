@@ -0,0 +1,127 @@
+-- Rollups behind /dashboard/stats and /dashboard/recent-session, kept
+-- current by the triggers below so the dashboard never aggregates over
+-- word_review_items. Rows removed from word_review_items (e.g. archiving)
+-- do not change the rollups, reset_study_sessions clears them explicitly.
+
+-- Single row of running totals
+CREATE TABLE IF NOT EXISTS dashboard_stats (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  total_vocabulary INTEGER NOT NULL DEFAULT 0,
+  total_sessions INTEGER NOT NULL DEFAULT 0,
+  total_reviews INTEGER NOT NULL DEFAULT 0,
+  total_correct INTEGER NOT NULL DEFAULT 0,
+  words_studied INTEGER NOT NULL DEFAULT 0,  -- Distinct words with at least one review
+  mastered_words INTEGER NOT NULL DEFAULT 0  -- Words with >= 5 attempts and >= 80% success rate
+);
+
+-- Per word review totals, used to track words_studied and mastered_words
+CREATE TABLE IF NOT EXISTS word_review_stats (
+  word_id INTEGER PRIMARY KEY,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  correct_count INTEGER NOT NULL DEFAULT 0,
+  FOREIGN KEY (word_id) REFERENCES words(id)
+);
+
+-- One row per day with at least one study session, for the streak
+CREATE TABLE IF NOT EXISTS study_days (
+  study_date DATE PRIMARY KEY,
+  session_count INTEGER NOT NULL DEFAULT 0
+);
+
+-- Most recent session per group, for active_groups
+CREATE TABLE IF NOT EXISTS group_activity (
+  group_id INTEGER PRIMARY KEY,
+  last_session_at DATETIME NOT NULL,
+  FOREIGN KEY (group_id) REFERENCES groups(id)
+);
+CREATE INDEX IF NOT EXISTS idx_group_activity_last_session_at ON group_activity(last_session_at);
+
+-- Per session results, so the recent session needs no join on review items
+ALTER TABLE study_sessions ADD COLUMN correct_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE study_sessions ADD COLUMN wrong_count INTEGER NOT NULL DEFAULT 0;
+
+CREATE TRIGGER IF NOT EXISTS trg_word_review_items_stats
+AFTER INSERT ON word_review_items
+BEGIN
+  UPDATE study_sessions
+  SET correct_count = correct_count + (NEW.correct = 1),
+      wrong_count = wrong_count + (NEW.correct = 0)
+  WHERE id = NEW.study_session_id;
+
+  -- Take the word out of the totals with its old numbers...
+  UPDATE dashboard_stats
+  SET words_studied = words_studied + NOT EXISTS (SELECT 1 FROM word_review_stats WHERE word_id = NEW.word_id),
+      mastered_words = mastered_words - COALESCE((
+        SELECT attempts >= 5 AND correct_count * 1.0 / attempts >= 0.8
+        FROM word_review_stats WHERE word_id = NEW.word_id
+      ), 0)
+  WHERE id = 1;
+
+  INSERT INTO word_review_stats (word_id, attempts, correct_count)
+  VALUES (NEW.word_id, 1, NEW.correct = 1)
+  ON CONFLICT (word_id) DO UPDATE SET
+    attempts = attempts + 1,
+    correct_count = correct_count + excluded.correct_count;
+
+  -- ...and put it back with the new ones
+  UPDATE dashboard_stats
+  SET total_reviews = total_reviews + 1,
+      total_correct = total_correct + (NEW.correct = 1),
+      mastered_words = mastered_words + (
+        SELECT attempts >= 5 AND correct_count * 1.0 / attempts >= 0.8
+        FROM word_review_stats WHERE word_id = NEW.word_id
+      )
+  WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_study_sessions_stats
+AFTER INSERT ON study_sessions
+BEGIN
+  UPDATE dashboard_stats SET total_sessions = total_sessions + 1 WHERE id = 1;
+
+  INSERT INTO study_days (study_date, session_count)
+  VALUES (date(NEW.created_at), 1)
+  ON CONFLICT (study_date) DO UPDATE SET session_count = session_count + 1;
+
+  INSERT INTO group_activity (group_id, last_session_at)
+  VALUES (NEW.group_id, NEW.created_at)
+  ON CONFLICT (group_id) DO UPDATE SET last_session_at = MAX(last_session_at, excluded.last_session_at);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_words_insert_stats
+AFTER INSERT ON words
+BEGIN
+  UPDATE dashboard_stats SET total_vocabulary = total_vocabulary + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_words_delete_stats
+AFTER DELETE ON words
+BEGIN
+  UPDATE dashboard_stats SET total_vocabulary = total_vocabulary - 1 WHERE id = 1;
+END;
+
+-- Backfill from existing history (same as sql/dashboard/rebuild_stats.sql)
+INSERT INTO word_review_stats (word_id, attempts, correct_count)
+  SELECT wri.word_id, COUNT(*), SUM(CASE WHEN wri.correct = 1 THEN 1 ELSE 0 END)
+  FROM word_review_items wri
+  JOIN study_sessions ss ON wri.study_session_id = ss.id
+  GROUP BY wri.word_id;
+
+UPDATE study_sessions
+SET correct_count = (SELECT COUNT(*) FROM word_review_items WHERE study_session_id = study_sessions.id AND correct = 1),
+    wrong_count = (SELECT COUNT(*) FROM word_review_items WHERE study_session_id = study_sessions.id AND correct = 0);
+
+INSERT INTO study_days (study_date, session_count)
+  SELECT date(created_at), COUNT(*) FROM study_sessions GROUP BY date(created_at);
+
+INSERT INTO group_activity (group_id, last_session_at)
+  SELECT group_id, MAX(created_at) FROM study_sessions GROUP BY group_id;
+
+INSERT INTO dashboard_stats (id, total_vocabulary, total_sessions, total_reviews, total_correct, words_studied, mastered_words)
+  SELECT 1,
+    (SELECT COUNT(*) FROM words),
+    (SELECT COUNT(*) FROM study_sessions),
+    (SELECT COALESCE(SUM(attempts), 0) FROM word_review_stats),
+    (SELECT COALESCE(SUM(correct_count), 0) FROM word_review_stats),
+    (SELECT COUNT(*) FROM word_review_stats),
+    (SELECT COUNT(*) FROM word_review_stats WHERE attempts >= 5 AND correct_count * 1.0 / attempts >= 0.8);
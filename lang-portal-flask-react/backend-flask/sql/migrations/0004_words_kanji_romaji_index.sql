@@ -0,0 +1,2 @@
+-- The bulk importer dedupes incoming words on (kanji, romaji)
+CREATE INDEX IF NOT EXISTS idx_words_kanji_romaji ON words(kanji, romaji);
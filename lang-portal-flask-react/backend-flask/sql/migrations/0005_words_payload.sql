@@ -0,0 +1,41 @@
+-- Pre-rendered JSON for each word as served by /api/groups/:id/words/raw,
+-- so the endpoint can concatenate rows instead of decoding and re-encoding
+-- parts for every word. Keys are in the same (sorted) order jsonify uses.
+ALTER TABLE words ADD COLUMN payload TEXT;
+
+CREATE TRIGGER IF NOT EXISTS trg_words_payload_insert
+AFTER INSERT ON words
+BEGIN
+  UPDATE words
+  SET payload = json_object(
+    'english', NEW.english,
+    'id', NEW.id,
+    'kanji', NEW.kanji,
+    'parts', json(NEW.parts),
+    'romaji', NEW.romaji
+  )
+  WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_words_payload_update
+AFTER UPDATE OF kanji, romaji, english, parts ON words
+BEGIN
+  UPDATE words
+  SET payload = json_object(
+    'english', NEW.english,
+    'id', NEW.id,
+    'kanji', NEW.kanji,
+    'parts', json(NEW.parts),
+    'romaji', NEW.romaji
+  )
+  WHERE id = NEW.id;
+END;
+
+UPDATE words
+SET payload = json_object(
+  'english', english,
+  'id', id,
+  'kanji', kanji,
+  'parts', json(parts),
+  'romaji', romaji
+);
@@ -0,0 +1,46 @@
+-- Session durations without per row subqueries: last_activity_at follows
+-- the newest review (maintained by the review trigger, rebuilt below) and
+-- ended_at is set when a client ends the session explicitly.
+-- A session's end time is COALESCE(ended_at, last_activity_at, created_at)
+-- and its review count is correct_count + wrong_count.
+ALTER TABLE study_sessions ADD COLUMN last_activity_at DATETIME;
+ALTER TABLE study_sessions ADD COLUMN ended_at DATETIME;
+
+DROP TRIGGER IF EXISTS trg_word_review_items_stats;
+CREATE TRIGGER trg_word_review_items_stats
+AFTER INSERT ON word_review_items
+BEGIN
+  UPDATE study_sessions
+  SET correct_count = correct_count + (NEW.correct = 1),
+      wrong_count = wrong_count + (NEW.correct = 0),
+      last_activity_at = MAX(COALESCE(last_activity_at, NEW.created_at), NEW.created_at)
+  WHERE id = NEW.study_session_id;
+
+  -- Take the word out of the totals with its old numbers...
+  UPDATE dashboard_stats
+  SET words_studied = words_studied + NOT EXISTS (SELECT 1 FROM word_review_stats WHERE word_id = NEW.word_id),
+      mastered_words = mastered_words - COALESCE((
+        SELECT attempts >= 5 AND correct_count * 1.0 / attempts >= 0.8
+        FROM word_review_stats WHERE word_id = NEW.word_id
+      ), 0)
+  WHERE id = 1;
+
+  INSERT INTO word_review_stats (word_id, attempts, correct_count)
+  VALUES (NEW.word_id, 1, NEW.correct = 1)
+  ON CONFLICT (word_id) DO UPDATE SET
+    attempts = attempts + 1,
+    correct_count = correct_count + excluded.correct_count;
+
+  -- ...and put it back with the new ones
+  UPDATE dashboard_stats
+  SET total_reviews = total_reviews + 1,
+      total_correct = total_correct + (NEW.correct = 1),
+      mastered_words = mastered_words + (
+        SELECT attempts >= 5 AND correct_count * 1.0 / attempts >= 0.8
+        FROM word_review_stats WHERE word_id = NEW.word_id
+      )
+  WHERE id = 1;
+END;
+
+UPDATE study_sessions
+SET last_activity_at = (SELECT MAX(created_at) FROM word_review_items WHERE study_session_id = study_sessions.id);
@@ -0,0 +1,12 @@
+-- SM-2 scheduling state per word, updated with every review (see
+-- lib/scheduler.py). due_at is when the word should be reviewed next, and
+-- the index turns "which words are due" into a range scan.
+ALTER TABLE word_reviews ADD COLUMN ease REAL NOT NULL DEFAULT 2.5;
+ALTER TABLE word_reviews ADD COLUMN interval_days REAL NOT NULL DEFAULT 0;
+ALTER TABLE word_reviews ADD COLUMN repetitions INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE word_reviews ADD COLUMN due_at DATETIME;
+
+-- Words reviewed before scheduling existed are due right away
+UPDATE word_reviews SET due_at = COALESCE(last_reviewed, CURRENT_TIMESTAMP);
+
+CREATE INDEX IF NOT EXISTS idx_word_reviews_due_at ON word_reviews(due_at, word_id);
@@ -0,0 +1,34 @@
+-- Full text index for GET /api/words/search. The trigram tokenizer indexes
+-- every 3 character sequence, so substrings match in kanji/kana, romaji and
+-- English alike (case insensitive). It is an external content table over
+-- words, kept in sync by the triggers below.
+CREATE VIRTUAL TABLE IF NOT EXISTS words_fts USING fts5(
+  kanji, romaji, english,
+  content='words', content_rowid='id',
+  tokenize='trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_words_fts_insert
+AFTER INSERT ON words
+BEGIN
+  INSERT INTO words_fts (rowid, kanji, romaji, english)
+  VALUES (NEW.id, NEW.kanji, NEW.romaji, NEW.english);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_words_fts_delete
+AFTER DELETE ON words
+BEGIN
+  INSERT INTO words_fts (words_fts, rowid, kanji, romaji, english)
+  VALUES ('delete', OLD.id, OLD.kanji, OLD.romaji, OLD.english);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_words_fts_update
+AFTER UPDATE OF kanji, romaji, english ON words
+BEGIN
+  INSERT INTO words_fts (words_fts, rowid, kanji, romaji, english)
+  VALUES ('delete', OLD.id, OLD.kanji, OLD.romaji, OLD.english);
+  INSERT INTO words_fts (rowid, kanji, romaji, english)
+  VALUES (NEW.id, NEW.kanji, NEW.romaji, NEW.english);
+END;
+
+INSERT INTO words_fts (words_fts) VALUES ('rebuild');
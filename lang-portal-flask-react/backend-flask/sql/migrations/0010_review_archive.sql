@@ -0,0 +1,23 @@
+-- Review items older than the retention period are folded into one row
+-- per session and word by `invoke archive-reviews` / `invoke maintenance`
+-- (lib/maintenance.py) and deleted from word_review_items. The session
+-- word listings and the dashboard rebuild read both tables.
+CREATE TABLE IF NOT EXISTS word_review_archive (
+  study_session_id INTEGER NOT NULL,
+  word_id INTEGER NOT NULL,
+  correct_count INTEGER NOT NULL DEFAULT 0,
+  wrong_count INTEGER NOT NULL DEFAULT 0,
+  last_reviewed_at DATETIME,
+  PRIMARY KEY (study_session_id, word_id),
+  FOREIGN KEY (word_id) REFERENCES words(id),
+  FOREIGN KEY (study_session_id) REFERENCES study_sessions(id)
+) WITHOUT ROWID;
+
+-- One row per maintenance run with its report (JSON), also used by the
+-- background scheduler to skip runs another worker process just did
+CREATE TABLE IF NOT EXISTS maintenance_runs (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  started_at DATETIME NOT NULL,
+  finished_at DATETIME,
+  report TEXT
+);
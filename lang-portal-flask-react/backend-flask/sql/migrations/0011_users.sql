@@ -0,0 +1,178 @@
+-- Per-user study history (see lib/users.py). Sessions, review items and the
+-- per word review state get a user_id, and every rollup behind the
+-- dashboard is kept per user. Everything recorded so far belongs to user 1.
+-- The same per-user tables make up a shard (sql/shard_migrations/).
+ALTER TABLE study_sessions ADD COLUMN user_id INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE word_review_items ADD COLUMN user_id INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE word_reviews ADD COLUMN user_id INTEGER NOT NULL DEFAULT 1;
+
+-- Session listings are per user, newest first, overall, per activity and
+-- per group
+DROP INDEX IF EXISTS idx_study_sessions_created_at_id;
+DROP INDEX IF EXISTS idx_study_sessions_activity_created_at_id;
+DROP INDEX IF EXISTS idx_study_sessions_group_id_created_at;
+CREATE INDEX idx_study_sessions_user_created_at_id ON study_sessions(user_id, created_at, id);
+CREATE INDEX idx_study_sessions_user_activity_created_at_id ON study_sessions(user_id, study_activity_id, created_at, id);
+CREATE INDEX idx_study_sessions_user_group_created_at ON study_sessions(user_id, group_id, created_at);
+
+-- Review exports are per user, by id or by time
+CREATE INDEX idx_word_review_items_user_id ON word_review_items(user_id);
+CREATE INDEX idx_word_review_items_user_created_at ON word_review_items(user_id, created_at);
+
+-- One review state row per user and word
+DROP INDEX IF EXISTS idx_word_reviews_word_id;
+DROP INDEX IF EXISTS idx_word_reviews_correct_count_word_id;
+DROP INDEX IF EXISTS idx_word_reviews_wrong_count_word_id;
+DROP INDEX IF EXISTS idx_word_reviews_due_at;
+CREATE UNIQUE INDEX idx_word_reviews_user_word ON word_reviews(user_id, word_id);
+CREATE INDEX idx_word_reviews_user_correct_count ON word_reviews(user_id, correct_count, word_id);
+CREATE INDEX idx_word_reviews_user_wrong_count ON word_reviews(user_id, wrong_count, word_id);
+CREATE INDEX idx_word_reviews_user_due_at ON word_reviews(user_id, due_at, word_id);
+
+-- The vocabulary size is the same for everyone, it moves out of
+-- dashboard_stats into a table of its own
+DROP TRIGGER IF EXISTS trg_words_insert_stats;
+DROP TRIGGER IF EXISTS trg_words_delete_stats;
+CREATE TABLE catalog_stats (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  total_vocabulary INTEGER NOT NULL DEFAULT 0
+);
+INSERT INTO catalog_stats (id, total_vocabulary) SELECT 1, COUNT(*) FROM words;
+
+CREATE TRIGGER trg_words_insert_stats
+AFTER INSERT ON words
+BEGIN
+  UPDATE catalog_stats SET total_vocabulary = total_vocabulary + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER trg_words_delete_stats
+AFTER DELETE ON words
+BEGIN
+  UPDATE catalog_stats SET total_vocabulary = total_vocabulary - 1 WHERE id = 1;
+END;
+
+-- The rollups are rebuilt keyed by user, and refilled below
+DROP TRIGGER IF EXISTS trg_word_review_items_stats;
+DROP TRIGGER IF EXISTS trg_study_sessions_stats;
+DROP TABLE dashboard_stats;
+DROP TABLE word_review_stats;
+DROP TABLE study_days;
+DROP TABLE group_activity;
+
+CREATE TABLE dashboard_stats (
+  user_id INTEGER PRIMARY KEY,
+  total_sessions INTEGER NOT NULL DEFAULT 0,
+  total_reviews INTEGER NOT NULL DEFAULT 0,
+  total_correct INTEGER NOT NULL DEFAULT 0,
+  words_studied INTEGER NOT NULL DEFAULT 0,  -- Distinct words with at least one review
+  mastered_words INTEGER NOT NULL DEFAULT 0  -- Words with >= 5 attempts and >= 80% success rate
+);
+
+CREATE TABLE word_review_stats (
+  user_id INTEGER NOT NULL,
+  word_id INTEGER NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  correct_count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (user_id, word_id)
+) WITHOUT ROWID;
+
+CREATE TABLE study_days (
+  user_id INTEGER NOT NULL,
+  study_date DATE NOT NULL,
+  session_count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (user_id, study_date)
+) WITHOUT ROWID;
+
+CREATE TABLE group_activity (
+  user_id INTEGER NOT NULL,
+  group_id INTEGER NOT NULL,
+  last_session_at DATETIME NOT NULL,
+  PRIMARY KEY (user_id, group_id)
+) WITHOUT ROWID;
+CREATE INDEX idx_group_activity_user_last_session_at ON group_activity(user_id, last_session_at);
+
+CREATE TRIGGER trg_word_review_items_stats
+AFTER INSERT ON word_review_items
+BEGIN
+  UPDATE study_sessions
+  SET correct_count = correct_count + (NEW.correct = 1),
+      wrong_count = wrong_count + (NEW.correct = 0),
+      last_activity_at = MAX(COALESCE(last_activity_at, NEW.created_at), NEW.created_at)
+  WHERE id = NEW.study_session_id;
+
+  INSERT INTO dashboard_stats (user_id) VALUES (NEW.user_id)
+  ON CONFLICT (user_id) DO NOTHING;
+
+  -- Take the word out of the totals with its old numbers...
+  UPDATE dashboard_stats
+  SET words_studied = words_studied + NOT EXISTS (
+        SELECT 1 FROM word_review_stats WHERE user_id = NEW.user_id AND word_id = NEW.word_id
+      ),
+      mastered_words = mastered_words - COALESCE((
+        SELECT attempts >= 5 AND correct_count * 1.0 / attempts >= 0.8
+        FROM word_review_stats WHERE user_id = NEW.user_id AND word_id = NEW.word_id
+      ), 0)
+  WHERE user_id = NEW.user_id;
+
+  INSERT INTO word_review_stats (user_id, word_id, attempts, correct_count)
+  VALUES (NEW.user_id, NEW.word_id, 1, NEW.correct = 1)
+  ON CONFLICT (user_id, word_id) DO UPDATE SET
+    attempts = attempts + 1,
+    correct_count = correct_count + excluded.correct_count;
+
+  -- ...and put it back with the new ones
+  UPDATE dashboard_stats
+  SET total_reviews = total_reviews + 1,
+      total_correct = total_correct + (NEW.correct = 1),
+      mastered_words = mastered_words + (
+        SELECT attempts >= 5 AND correct_count * 1.0 / attempts >= 0.8
+        FROM word_review_stats WHERE user_id = NEW.user_id AND word_id = NEW.word_id
+      )
+  WHERE user_id = NEW.user_id;
+END;
+
+CREATE TRIGGER trg_study_sessions_stats
+AFTER INSERT ON study_sessions
+BEGIN
+  INSERT INTO dashboard_stats (user_id, total_sessions) VALUES (NEW.user_id, 1)
+  ON CONFLICT (user_id) DO UPDATE SET total_sessions = total_sessions + 1;
+
+  INSERT INTO study_days (user_id, study_date, session_count)
+  VALUES (NEW.user_id, date(NEW.created_at), 1)
+  ON CONFLICT (user_id, study_date) DO UPDATE SET session_count = session_count + 1;
+
+  INSERT INTO group_activity (user_id, group_id, last_session_at)
+  VALUES (NEW.user_id, NEW.group_id, NEW.created_at)
+  ON CONFLICT (user_id, group_id) DO UPDATE SET last_session_at = MAX(last_session_at, excluded.last_session_at);
+END;
+
+-- Refill the rollups (same as sql/dashboard/rebuild_stats.sql)
+INSERT INTO word_review_stats (user_id, word_id, attempts, correct_count)
+  SELECT user_id, word_id, SUM(attempts), SUM(correct_count)
+  FROM (
+    SELECT ss.user_id, wri.word_id, COUNT(*) AS attempts, SUM(CASE WHEN wri.correct = 1 THEN 1 ELSE 0 END) AS correct_count
+    FROM word_review_items wri
+    JOIN study_sessions ss ON wri.study_session_id = ss.id
+    GROUP BY ss.user_id, wri.word_id
+    UNION ALL
+    SELECT ss.user_id, a.word_id, SUM(a.correct_count + a.wrong_count), SUM(a.correct_count)
+    FROM word_review_archive a
+    JOIN study_sessions ss ON a.study_session_id = ss.id
+    GROUP BY ss.user_id, a.word_id
+  )
+  GROUP BY user_id, word_id;
+
+INSERT INTO study_days (user_id, study_date, session_count)
+  SELECT user_id, date(created_at), COUNT(*) FROM study_sessions GROUP BY user_id, date(created_at);
+
+INSERT INTO group_activity (user_id, group_id, last_session_at)
+  SELECT user_id, group_id, MAX(created_at) FROM study_sessions GROUP BY user_id, group_id;
+
+INSERT INTO dashboard_stats (user_id, total_sessions, total_reviews, total_correct, words_studied, mastered_words)
+  SELECT u.user_id,
+    (SELECT COUNT(*) FROM study_sessions WHERE user_id = u.user_id),
+    (SELECT COALESCE(SUM(attempts), 0) FROM word_review_stats WHERE user_id = u.user_id),
+    (SELECT COALESCE(SUM(correct_count), 0) FROM word_review_stats WHERE user_id = u.user_id),
+    (SELECT COUNT(*) FROM word_review_stats WHERE user_id = u.user_id),
+    (SELECT COUNT(*) FROM word_review_stats WHERE user_id = u.user_id AND attempts >= 5 AND correct_count * 1.0 / attempts >= 0.8)
+  FROM (SELECT DISTINCT user_id FROM study_sessions) u;
@@ -0,0 +1,7 @@
+-- Client generated keys that make logging reviews safe to retry: a review
+-- carrying a key the user has already logged is skipped instead of being
+-- counted twice (see routes/study_sessions.py). The unique index is the
+-- backstop for two requests racing with the same key.
+ALTER TABLE word_review_items ADD COLUMN idempotency_key TEXT;
+CREATE UNIQUE INDEX idx_word_review_items_idempotency_key
+  ON word_review_items(user_id, idempotency_key) WHERE idempotency_key IS NOT NULL;
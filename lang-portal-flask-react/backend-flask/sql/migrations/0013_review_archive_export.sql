@@ -0,0 +1,12 @@
+-- Lets /api/export/reviews stream archived reviews along with the logged
+-- ones, with the same keysets. An archive row is exported with the id and
+-- time of the last review folded into it. Rows archived before this
+-- migration have no known review id and keep last_review_id 0, so only a
+-- full export (no since_id) includes them.
+ALTER TABLE word_review_archive ADD COLUMN user_id INTEGER;
+ALTER TABLE word_review_archive ADD COLUMN last_review_id INTEGER NOT NULL DEFAULT 0;
+UPDATE word_review_archive
+  SET user_id = (SELECT user_id FROM study_sessions WHERE id = word_review_archive.study_session_id);
+CREATE INDEX idx_word_review_archive_user_review_id ON word_review_archive(user_id, last_review_id);
+CREATE INDEX idx_word_review_archive_user_reviewed_at
+  ON word_review_archive(user_id, last_reviewed_at, last_review_id);
@@ -0,0 +1,154 @@
+-- Schema of a user shard (DATABASE_SHARDS in app.py, see lib/db.py): the
+-- per-user tables of words.db as of sql/migrations/0011_users.sql. Shards
+-- are opened with words.db attached as `catalog`, so words, groups and
+-- study activities resolve there. SQLite has no foreign keys across
+-- database files, the references to those are only checked by the routes.
+CREATE TABLE IF NOT EXISTS study_sessions (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL DEFAULT 1,
+  group_id INTEGER NOT NULL,
+  study_activity_id INTEGER NOT NULL,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  correct_count INTEGER NOT NULL DEFAULT 0,
+  wrong_count INTEGER NOT NULL DEFAULT 0,
+  last_activity_at DATETIME,
+  ended_at DATETIME
+);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_user_created_at_id ON study_sessions(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_user_activity_created_at_id ON study_sessions(user_id, study_activity_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_user_group_created_at ON study_sessions(user_id, group_id, created_at);
+
+CREATE TABLE IF NOT EXISTS word_review_items (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL DEFAULT 1,
+  word_id INTEGER NOT NULL,
+  study_session_id INTEGER NOT NULL,
+  correct BOOLEAN NOT NULL,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  FOREIGN KEY (study_session_id) REFERENCES study_sessions(id)
+);
+CREATE INDEX IF NOT EXISTS idx_word_review_items_study_session_id ON word_review_items(study_session_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_word_review_items_word_id ON word_review_items(word_id);
+CREATE INDEX IF NOT EXISTS idx_word_review_items_created_at ON word_review_items(created_at);
+CREATE INDEX IF NOT EXISTS idx_word_review_items_user_id ON word_review_items(user_id);
+CREATE INDEX IF NOT EXISTS idx_word_review_items_user_created_at ON word_review_items(user_id, created_at);
+
+CREATE TABLE IF NOT EXISTS word_reviews (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL DEFAULT 1,
+  word_id INTEGER NOT NULL,
+  correct_count INTEGER DEFAULT 0,
+  wrong_count INTEGER DEFAULT 0,
+  last_reviewed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  ease REAL NOT NULL DEFAULT 2.5,
+  interval_days REAL NOT NULL DEFAULT 0,
+  repetitions INTEGER NOT NULL DEFAULT 0,
+  due_at DATETIME
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_word_reviews_user_word ON word_reviews(user_id, word_id);
+CREATE INDEX IF NOT EXISTS idx_word_reviews_user_correct_count ON word_reviews(user_id, correct_count, word_id);
+CREATE INDEX IF NOT EXISTS idx_word_reviews_user_wrong_count ON word_reviews(user_id, wrong_count, word_id);
+CREATE INDEX IF NOT EXISTS idx_word_reviews_user_due_at ON word_reviews(user_id, due_at, word_id);
+
+CREATE TABLE IF NOT EXISTS word_review_archive (
+  study_session_id INTEGER NOT NULL,
+  word_id INTEGER NOT NULL,
+  correct_count INTEGER NOT NULL DEFAULT 0,
+  wrong_count INTEGER NOT NULL DEFAULT 0,
+  last_reviewed_at DATETIME,
+  PRIMARY KEY (study_session_id, word_id),
+  FOREIGN KEY (study_session_id) REFERENCES study_sessions(id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS maintenance_runs (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  started_at DATETIME NOT NULL,
+  finished_at DATETIME,
+  report TEXT
+);
+
+-- Dashboard rollups, see sql/migrations/0011_users.sql
+CREATE TABLE IF NOT EXISTS dashboard_stats (
+  user_id INTEGER PRIMARY KEY,
+  total_sessions INTEGER NOT NULL DEFAULT 0,
+  total_reviews INTEGER NOT NULL DEFAULT 0,
+  total_correct INTEGER NOT NULL DEFAULT 0,
+  words_studied INTEGER NOT NULL DEFAULT 0,
+  mastered_words INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS word_review_stats (
+  user_id INTEGER NOT NULL,
+  word_id INTEGER NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  correct_count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (user_id, word_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS study_days (
+  user_id INTEGER NOT NULL,
+  study_date DATE NOT NULL,
+  session_count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (user_id, study_date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS group_activity (
+  user_id INTEGER NOT NULL,
+  group_id INTEGER NOT NULL,
+  last_session_at DATETIME NOT NULL,
+  PRIMARY KEY (user_id, group_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_group_activity_user_last_session_at ON group_activity(user_id, last_session_at);
+
+CREATE TRIGGER IF NOT EXISTS trg_word_review_items_stats
+AFTER INSERT ON word_review_items
+BEGIN
+  UPDATE study_sessions
+  SET correct_count = correct_count + (NEW.correct = 1),
+      wrong_count = wrong_count + (NEW.correct = 0),
+      last_activity_at = MAX(COALESCE(last_activity_at, NEW.created_at), NEW.created_at)
+  WHERE id = NEW.study_session_id;
+
+  INSERT INTO dashboard_stats (user_id) VALUES (NEW.user_id)
+  ON CONFLICT (user_id) DO NOTHING;
+
+  UPDATE dashboard_stats
+  SET words_studied = words_studied + NOT EXISTS (
+        SELECT 1 FROM word_review_stats WHERE user_id = NEW.user_id AND word_id = NEW.word_id
+      ),
+      mastered_words = mastered_words - COALESCE((
+        SELECT attempts >= 5 AND correct_count * 1.0 / attempts >= 0.8
+        FROM word_review_stats WHERE user_id = NEW.user_id AND word_id = NEW.word_id
+      ), 0)
+  WHERE user_id = NEW.user_id;
+
+  INSERT INTO word_review_stats (user_id, word_id, attempts, correct_count)
+  VALUES (NEW.user_id, NEW.word_id, 1, NEW.correct = 1)
+  ON CONFLICT (user_id, word_id) DO UPDATE SET
+    attempts = attempts + 1,
+    correct_count = correct_count + excluded.correct_count;
+
+  UPDATE dashboard_stats
+  SET total_reviews = total_reviews + 1,
+      total_correct = total_correct + (NEW.correct = 1),
+      mastered_words = mastered_words + (
+        SELECT attempts >= 5 AND correct_count * 1.0 / attempts >= 0.8
+        FROM word_review_stats WHERE user_id = NEW.user_id AND word_id = NEW.word_id
+      )
+  WHERE user_id = NEW.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_study_sessions_stats
+AFTER INSERT ON study_sessions
+BEGIN
+  INSERT INTO dashboard_stats (user_id, total_sessions) VALUES (NEW.user_id, 1)
+  ON CONFLICT (user_id) DO UPDATE SET total_sessions = total_sessions + 1;
+
+  INSERT INTO study_days (user_id, study_date, session_count)
+  VALUES (NEW.user_id, date(NEW.created_at), 1)
+  ON CONFLICT (user_id, study_date) DO UPDATE SET session_count = session_count + 1;
+
+  INSERT INTO group_activity (user_id, group_id, last_session_at)
+  VALUES (NEW.user_id, NEW.group_id, NEW.created_at)
+  ON CONFLICT (user_id, group_id) DO UPDATE SET last_session_at = MAX(last_session_at, excluded.last_session_at);
+END;
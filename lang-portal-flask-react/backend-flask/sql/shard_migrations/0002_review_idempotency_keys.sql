@@ -0,0 +1,4 @@
+-- See sql/migrations/0012_review_idempotency_keys.sql
+ALTER TABLE word_review_items ADD COLUMN idempotency_key TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_word_review_items_idempotency_key
+  ON word_review_items(user_id, idempotency_key) WHERE idempotency_key IS NOT NULL;
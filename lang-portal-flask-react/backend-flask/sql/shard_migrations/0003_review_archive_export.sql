@@ -0,0 +1,8 @@
+-- See sql/migrations/0013_review_archive_export.sql
+ALTER TABLE word_review_archive ADD COLUMN user_id INTEGER;
+ALTER TABLE word_review_archive ADD COLUMN last_review_id INTEGER NOT NULL DEFAULT 0;
+UPDATE word_review_archive
+  SET user_id = (SELECT user_id FROM study_sessions WHERE id = word_review_archive.study_session_id);
+CREATE INDEX IF NOT EXISTS idx_word_review_archive_user_review_id ON word_review_archive(user_id, last_review_id);
+CREATE INDEX IF NOT EXISTS idx_word_review_archive_user_reviewed_at
+  ON word_review_archive(user_id, last_reviewed_at, last_review_id);
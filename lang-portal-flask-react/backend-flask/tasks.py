@@ -1,9 +1,133 @@
+import os
+
 from invoke import task
-from lib.db import db
+from lib.db import db, DEFAULT_SHARD_PATH, shard_paths
+from lib.cache import invalidate_shared
+
+# Path of the shared response cache (CACHE_BACKEND='sqlite' in app.py)
+CACHE_PATH = 'cache.db'
+
+# Tasks taking --shards work on the user shards too, pass DATABASE_SHARDS
+# (and --shard-path DATABASE_SHARD_PATH) from app.py
+def existing_shards(shards, shard_path):
+  return [path for path in shard_paths(shard_path, int(shards)) if os.path.exists(path)]
 
 @task
 def init_db(c):
   from flask import Flask
+  from migrate import run_migrations
   app = Flask(__name__)
   db.init(app)
-  print("Database initialized successfully.")
\ No newline at end of file
+  db.dispose()
+  run_migrations(db.database)
+  invalidate_shared(CACHE_PATH, 'words', 'groups', 'activities', 'reviews', 'sessions')
+  print("Database initialized successfully.")
+
+# Shards are migrated when the app first opens them, --shards migrates
+# the existing ones right away
+@task
+def migrate(c, shards=0, shard_path=DEFAULT_SHARD_PATH):
+  from migrate import run_migrations, SHARD_MIGRATIONS_DIR
+  if not run_migrations(db.database):
+    raise SystemExit(1)
+  for path in existing_shards(shards, shard_path):
+    if not run_migrations(path, SHARD_MIGRATIONS_DIR):
+      raise SystemExit(1)
+
+# Fails when a registered route query falls back to a full table scan
+@task
+def check_query_plans(c):
+  from lib.query_plans import check_query_plans
+  problems = check_query_plans(db.database)
+  for url, sql, detail in problems:
+    print(f"{url}: {detail}")
+    if sql:
+      print(f"  {sql}")
+  if problems:
+    raise SystemExit(1)
+  print("All route queries use indexes.")
+
+# Backfill or repair the materialized dashboard statistics
+@task
+def rebuild_dashboard_stats(c, shards=0, shard_path=DEFAULT_SHARD_PATH):
+  from flask import Flask
+  from lib.maintenance import connect
+  app = Flask(__name__)
+  with app.app_context():
+    cursor = db.cursor()
+    db.rebuild_dashboard_stats(cursor)
+    db.commit()
+    db.close()
+  for path in existing_shards(shards, shard_path):
+    connection = connect(path, catalog=db.database)
+    try:
+      db.rebuild_dashboard_stats(connection.cursor())
+      connection.commit()
+    finally:
+      connection.close()
+  print("Dashboard statistics rebuilt.")
+
+# Move the study history of every user from the database into their shard,
+# once after setting DATABASE_SHARDS in app.py (with the app stopped)
+@task
+def shard_users(c, shards, shard_path=DEFAULT_SHARD_PATH):
+  from lib.db import move_users_to_shards
+  moved = move_users_to_shards(db.database, shard_path, int(shards))
+  for path, sessions in moved.items():
+    print(f"{path}: {sessions} study sessions moved.")
+  invalidate_shared(CACHE_PATH, 'reviews', 'sessions')
+
+# Bulk import words from a JSON, JSON lines or CSV file, e.g.
+#   invoke import-words --path seed/data_verbs.json --group "Core Verbs" --group "N5"
+@task(iterable=['group'])
+def import_words(c, path, group=None, format=None, batch_size=5000):
+  from flask import Flask
+  from lib.importer import import_words as run_import
+  app = Flask(__name__)
+  with app.app_context():
+    stats = run_import(db.get(), path, group_names=group or [], format=format, batch_size=int(batch_size))
+    db.close()
+  invalidate_shared(CACHE_PATH, 'words', 'groups')
+  print(f"Read {stats['read']} words: {stats['inserted']} added, {stats['skipped']} already present.")
+  for name, group_id in stats['groups'].items():
+    print(f"Assigned to group '{name}' (id {group_id}).")
+
+# Fold reviews older than --days into word_review_archive, in batches
+@task
+def archive_reviews(c, days=365, batch_size=5000, shards=0, shard_path=DEFAULT_SHARD_PATH):
+  from datetime import datetime, timedelta
+  from lib.maintenance import connect, archive_reviews as run_archive
+  archived = 0
+  for path in [db.database, *existing_shards(shards, shard_path)]:
+    connection = connect(path)
+    try:
+      archived += run_archive(connection, datetime.now() - timedelta(days=int(days)), int(batch_size))
+    finally:
+      connection.close()
+  print(f"Archived {archived} review items older than {days} days.")
+
+# Archive old reviews, ANALYZE / PRAGMA optimize and vacuum freed pages.
+# --full-vacuum switches a database created without auto_vacuum over to
+# incremental vacuuming, once (it rewrites the whole file).
+@task
+def maintenance(c, archive_days=365, batch_size=5000, full_vacuum=False, shards=0, shard_path=DEFAULT_SHARD_PATH):
+  for path in existing_shards(shards, shard_path):
+    print(f"Shard {path}:")
+    print_maintenance_report(path, archive_days, batch_size, full_vacuum, catalog=db.database)
+  print_maintenance_report(db.database, archive_days, batch_size, full_vacuum)
+
+def print_maintenance_report(database, archive_days, batch_size, full_vacuum, catalog=None):
+  from lib.maintenance import run_maintenance
+  report = run_maintenance(database, int(archive_days), int(batch_size), full_vacuum=full_vacuum, catalog=catalog)
+  before, after = report['size_before'], report['size_after']
+  print(f"Archived {report['archived_reviews']} review items.")
+  print(f"Database {before['file_bytes']} -> {after['file_bytes']} bytes, "
+        f"WAL {before['wal_bytes']} -> {after['wal_bytes']} bytes, "
+        f"reclaimed {report['reclaimed_bytes']} bytes.")
+  if report['auto_vacuum'] != 'incremental':
+    print("auto_vacuum is off for this database, run with --full-vacuum once to enable incremental vacuuming.")
+  print("Query timings (ms, median):")
+  for name, before_ms in report['queries_before'].items():
+    print(f"  {name:24} {before_ms:8.3f} -> {report['queries_after'][name]:8.3f}")
+  for step, seconds in report['seconds'].items():
+    print(f"{step}: {seconds:.3f}s")
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Dict, List, Optional
+
+WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """Canonical form of a text, what gets embedded and cached"""
+    return WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+def text_hash(text: str) -> str:
+    """sha256 of an already normalized text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Embeddings on disk keyed by (model_id, sha256 of the normalized text)
+
+    Vectors are stored as float32 blobs in SQLite. Once there are more than
+    max_entries the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str = "backend/data/embedding_cache.db", max_entries: int = 100000):
+        """Open (or create) the cache database"""
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model_id TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model_id, text_hash)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+        """)
+
+    def get_many(self, model_id: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """Cached embeddings for the given text hashes, missing ones are left out"""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # Stay under SQLite's limit on bound parameters
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.connection.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model_id = ? AND text_hash IN ({placeholders})",
+                    [model_id, *chunk]
+                )
+                for key, vector in rows:
+                    found[key] = array("f", vector).tolist()
+            if found:
+                now = time.time()
+                self.connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model_id = ? AND text_hash = ?",
+                    [(now, model_id, key) for key in found]
+                )
+                self.connection.commit()
+            self.hits += sum(1 for key in hashes if key in found)
+            self.misses += sum(1 for key in hashes if key not in found)
+        return found
+
+    def put_many(self, model_id: str, embeddings: Dict[str, List[float]]):
+        """Store embeddings by text hash, evicting the least recently used past max_entries"""
+        if not embeddings:
+            return
+        now = time.time()
+        rows = [
+            (model_id, key, len(vector), array("f", vector).tobytes(), now)
+            for key, vector in embeddings.items()
+        ]
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model_id, text_hash, dimensions, vector, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            excess = self._count() - self.max_entries
+            if excess > 0:
+                self.connection.execute(
+                    "DELETE FROM embeddings WHERE (model_id, text_hash) IN "
+                    "(SELECT model_id, text_hash FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self.evictions += excess
+            self.connection.commit()
+
+    def _count(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> Dict:
+        """Hit/miss counters since the cache was opened, and its current size"""
+        with self._lock:
+            entries = self._count()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def clear(self, model_id: Optional[str] = None):
+        """Drop every cached embedding, or only a model's"""
+        with self._lock:
+            if model_id is None:
+                self.connection.execute("DELETE FROM embeddings")
+            else:
+                self.connection.execute("DELETE FROM embeddings WHERE model_id = ?", (model_id,))
+            self.connection.commit()
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
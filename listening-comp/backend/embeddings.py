@@ -0,0 +1,249 @@
+import json
+import os
+import random
+import threading
+import time
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from chromadb.utils import embedding_functions
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from typing import Dict, List, Optional
+from backend.embedding_cache import EmbeddingCache, normalize_text, text_hash
+
+# Embedding backends for the question vector store, picked with
+# EMBEDDING_BACKEND: "bedrock" (Titan through Bedrock, the default) or
+# "local" (a sentence-transformers model on the CPU, no network needed once
+# the model is downloaded). EMBEDDING_MODEL overrides the backend's model.
+
+# Bedrock error codes worth another try, anything else fails the text right away
+RETRYABLE_ERRORS = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+    "InternalServerException"
+}
+
+class EmbeddingError(Exception):
+    """Raised when some texts could not be embedded"""
+
+    def __init__(self, failures: Dict[int, str], total: int, embeddings: Optional[List] = None):
+        self.failures = failures
+        self.total = total
+        # What did get embedded, None for the other texts
+        self.embeddings = embeddings
+        details = "; ".join(f"text {idx}: {error}" for idx, error in sorted(failures.items()))
+        super().__init__(f"Embedding failed for {len(failures)} of {total} texts ({details})")
+
+class CachedEmbeddingFunction(embedding_functions.EmbeddingFunction):
+    """Base for the embedding backends
+
+    Subclasses implement _embed_all for a list of normalized texts, this
+    class puts the EmbeddingCache in front of it.
+    """
+
+    def __init__(self, model_id: str, cache: Optional[EmbeddingCache] = None):
+        self.model_id = model_id
+        self.cache = cache
+
+    def _embed_all(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in order, raise EmbeddingError for the ones that failed"""
+        raise NotImplementedError
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for a list of texts, cached ones first"""
+        if not texts:
+            return []
+        texts = [normalize_text(text) for text in texts]
+        if self.cache is None:
+            return self._embed_all(texts)
+
+        hashes = [text_hash(text) for text in texts]
+        embeddings = self.cache.get_many(self.model_id, hashes)
+        # Each text that isn't cached is embedded once, however often it repeats
+        missing = {}
+        for idx, key in enumerate(hashes):
+            if key not in embeddings and key not in missing:
+                missing[key] = idx
+        if missing:
+            try:
+                embedded = self._embed_all([texts[idx] for idx in missing.values()])
+            except EmbeddingError as e:
+                # Keep what did get embedded, report the failures by the caller's index
+                self.cache.put_many(self.model_id, {
+                    key: vector for key, vector in zip(missing, e.embeddings or []) if vector is not None
+                })
+                positions = list(missing.values())
+                raise EmbeddingError(
+                    {positions[idx]: error for idx, error in e.failures.items()}, len(texts)
+                ) from e
+            new = dict(zip(missing, embedded))
+            self.cache.put_many(self.model_id, new)
+            embeddings.update(new)
+        return [embeddings[key] for key in hashes]
+
+class BedrockEmbeddingFunction(CachedEmbeddingFunction):
+    def __init__(
+        self,
+        model_id: str = "amazon.titan-embed-text-v1",
+        max_workers: int = 8,
+        max_retries: int = 6,
+        backoff: float = 0.5,
+        max_backoff: float = 20.0,
+        region_name: str = "us-east-1",
+        endpoint_url: Optional[str] = None,
+        cache: Optional[EmbeddingCache] = None
+    ):
+        """Initialize Bedrock embedding function
+
+        Titan takes one text per request, so a batch is spread over up to
+        max_workers concurrent requests. Throttled and other transient
+        errors are retried with exponential backoff and jitter. Set
+        endpoint_url (or BEDROCK_ENDPOINT_URL) to use a local stand-in for
+        Bedrock. Texts found in the cache are not sent at all.
+        """
+        super().__init__(model_id, cache)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bedrock_client = boto3.client(
+            'bedrock-runtime',
+            region_name=region_name,
+            endpoint_url=endpoint_url or os.environ.get("BEDROCK_ENDPOINT_URL"),
+            config=Config(
+                # Retries are ours, with a pool connection per worker
+                retries={"total_max_attempts": 1, "mode": "standard"},
+                max_pool_connections=max_workers
+            )
+        )
+
+    def _embed(self, text: str) -> List[float]:
+        """Embed one text, retrying transient errors"""
+        for attempt in range(self.max_retries):
+            try:
+                response = self.bedrock_client.invoke_model(
+                    modelId=self.model_id,
+                    body=json.dumps({
+                        "inputText": text
+                    })
+                )
+                response_body = json.loads(response['body'].read())
+                return response_body['embedding']
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+                if code not in RETRYABLE_ERRORS and status != 429 and status < 500:
+                    raise
+                error = e
+            except BotoCoreError as e:
+                # Connection errors and timeouts
+                error = e
+            if attempt + 1 < self.max_retries:
+                # Full jitter keeps the workers from retrying in lockstep
+                time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+        raise error
+
+    def _embed_all(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts over the worker pool, in order"""
+        if len(texts) == 1:
+            try:
+                return [self._embed(texts[0])]
+            except Exception as e:
+                raise EmbeddingError({0: str(e)}, 1) from e
+
+        embeddings = [None] * len(texts)
+        failures = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(texts))) as executor:
+            futures = {executor.submit(self._embed, text): idx for idx, text in enumerate(texts)}
+            done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            if pending:
+                # Something failed for good, the rest would be wasted calls
+                for future in pending:
+                    future.cancel()
+                done, _ = wait(futures)
+            for future in done:
+                idx = futures[future]
+                if future.cancelled():
+                    continue
+                if future.exception():
+                    failures[idx] = str(future.exception())
+                else:
+                    embeddings[idx] = future.result()
+
+        if failures:
+            raise EmbeddingError(failures, len(texts), embeddings)
+        return embeddings
+
+class LocalEmbeddingFunction(CachedEmbeddingFunction):
+    # Loaded models by name, shared by every instance
+    _models = {}
+    _models_lock = threading.Lock()
+
+    def __init__(
+        self,
+        model_id: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+        batch_size: int = 32,
+        num_threads: Optional[int] = None,
+        cache: Optional[EmbeddingCache] = None
+    ):
+        """Initialize a sentence-transformers model running on the CPU
+
+        The model is loaded on first use, once per process. num_threads (or
+        EMBEDDING_THREADS) caps the threads torch uses.
+        """
+        super().__init__(model_id, cache)
+        self.batch_size = batch_size
+        self.num_threads = num_threads or int(os.environ.get("EMBEDDING_THREADS", 0)) or None
+
+    def _model(self):
+        with self._models_lock:
+            model = self._models.get(self.model_id)
+            if model is None:
+                try:
+                    import torch
+                    from sentence_transformers import SentenceTransformer
+                except ImportError as e:
+                    raise ImportError(
+                        "The local embedding backend needs sentence-transformers: pip install sentence-transformers"
+                    ) from e
+                if self.num_threads:
+                    torch.set_num_threads(self.num_threads)
+                model = self._models[self.model_id] = SentenceTransformer(self.model_id, device="cpu")
+            return model
+
+    def _embed_all(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in batches of batch_size"""
+        model = self._model()
+        try:
+            vectors = model.encode(
+                texts,
+                batch_size=self.batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+        except Exception as e:
+            raise EmbeddingError({idx: str(e) for idx in range(len(texts))}, len(texts)) from e
+        return vectors.tolist()
+
+BACKENDS = {
+    "bedrock": BedrockEmbeddingFunction,
+    "local": LocalEmbeddingFunction
+}
+
+def create_embedding_function(
+    backend: Optional[str] = None,
+    model_id: Optional[str] = None,
+    cache: Optional[EmbeddingCache] = None
+) -> CachedEmbeddingFunction:
+    """Embedding function for a backend name, EMBEDDING_BACKEND by default"""
+    backend = backend or os.environ.get("EMBEDDING_BACKEND", "bedrock")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    model_id = model_id or os.environ.get("EMBEDDING_MODEL")
+    if model_id:
+        return BACKENDS[backend](model_id=model_id, cache=cache)
+    return BACKENDS[backend](cache=cache)
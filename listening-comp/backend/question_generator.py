@@ -1,7 +1,8 @@
 import boto3
 import json
 from typing import Dict, List, Optional
-from backend.vector_store import QuestionVectorStore
+from backend.question_parser import ParseError, parse_question
+from backend.vector_store import EmbeddingError, QuestionVectorStore
 
 class QuestionGenerator:
     def __init__(self):
@@ -34,7 +35,11 @@ class QuestionGenerator:
     def generate_similar_question(self, section_num: int, topic: str) -> Dict:
         """Generate a new question similar to existing ones on a given topic"""
         # Get similar questions for context
-        similar_questions = self.vector_store.search_similar_questions(section_num, topic, n_results=3)
+        try:
+            similar_questions = self.vector_store.search_similar_questions(section_num, topic, n_results=3)
+        except EmbeddingError as e:
+            print(f"Error searching similar questions: {str(e)}")
+            return None
         
         if not similar_questions:
             return None
@@ -82,67 +87,23 @@ class QuestionGenerator:
 
         # Parse the generated question
         try:
-            lines = response.strip().split('\n')
-            question = {}
-            current_key = None
-            current_value = []
-            
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                    
-                if line.startswith("Introduction:"):
-                    if current_key:
-                        question[current_key] = ' '.join(current_value)
-                    current_key = 'Introduction'
-                    current_value = [line.replace("Introduction:", "").strip()]
-                elif line.startswith("Conversation:"):
-                    if current_key:
-                        question[current_key] = ' '.join(current_value)
-                    current_key = 'Conversation'
-                    current_value = [line.replace("Conversation:", "").strip()]
-                elif line.startswith("Situation:"):
-                    if current_key:
-                        question[current_key] = ' '.join(current_value)
-                    current_key = 'Situation'
-                    current_value = [line.replace("Situation:", "").strip()]
-                elif line.startswith("Question:"):
-                    if current_key:
-                        question[current_key] = ' '.join(current_value)
-                    current_key = 'Question'
-                    current_value = [line.replace("Question:", "").strip()]
-                elif line.startswith("Options:"):
-                    if current_key:
-                        question[current_key] = ' '.join(current_value)
-                    current_key = 'Options'
-                    current_value = []
-                elif line[0].isdigit() and line[1] == "." and current_key == 'Options':
-                    current_value.append(line[2:].strip())
-                elif current_key:
-                    current_value.append(line)
-            
-            if current_key:
-                if current_key == 'Options':
-                    question[current_key] = current_value
-                else:
-                    question[current_key] = ' '.join(current_value)
-            
-            # Ensure we have exactly 4 options
-            if 'Options' not in question or len(question.get('Options', [])) != 4:
-                # Use default options if we don't have exactly 4
-                question['Options'] = [
-                    "ピザを食べる",
-                    "ハンバーガーを食べる",
-                    "サラダを食べる",
-                    "パスタを食べる"
-                ]
-            
-            return question
-        except Exception as e:
+            question = parse_question(response.strip().splitlines(), source="generated question").to_dict()
+        except ParseError as e:
             print(f"Error parsing generated question: {str(e)}")
             return None
 
+        # Ensure we have exactly 4 options
+        if len(question.get('Options', [])) != 4:
+            # Use default options if we don't have exactly 4
+            question['Options'] = [
+                "ピザを食べる",
+                "ハンバーガーを食べる",
+                "サラダを食べる",
+                "パスタを食べる"
+            ]
+
+        return question
+
     def get_feedback(self, question: Dict, selected_answer: int) -> Dict:
         """Generate feedback for the selected answer"""
         if not question or 'Options' not in question:
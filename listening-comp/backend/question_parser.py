@@ -0,0 +1,189 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Parser for the question format TranscriptStructurer asks Bedrock for:
+#
+#   <question>
+#   Introduction:            (section 2, with Conversation)
+#   ...
+#   Situation:               (section 3)
+#   ...
+#   Question:
+#   ...
+#   Options:                 (optional, numbered)
+#   1. ...
+#   </question>
+#
+# A value can start on the header line and go on over several lines, the
+# transcripts wrap Japanese text mid-word so its lines are joined as they are.
+
+HEADER = re.compile(r"^(Introduction|Conversation|Situation|Question|Options)\s*[:：]\s*(.*)$")
+OPTION = re.compile(r"^\d+\s*[.)．]\s*(.*)$")
+
+class ParseError(ValueError):
+    """A malformed question, with the line it was found on"""
+
+    def __init__(self, message: str, line: int, source: str = "<string>"):
+        self.message = message
+        self.line = line
+        self.source = source
+        super().__init__(f"{source}:{line}: {message}")
+
+@dataclass
+class Question:
+    question: str
+    line: int
+    introduction: Optional[str] = None
+    conversation: Optional[str] = None
+    situation: Optional[str] = None
+    options: List[str] = field(default_factory=list)
+
+    @property
+    def section(self) -> int:
+        return 3 if self.situation is not None else 2
+
+    def to_dict(self) -> Dict:
+        """The dict form stored in the vector store and used by the frontend"""
+        data = {}
+        if self.situation is not None:
+            data['Situation'] = self.situation
+        else:
+            data['Introduction'] = self.introduction
+            data['Conversation'] = self.conversation
+        data['Question'] = self.question
+        if self.options:
+            data['Options'] = self.options
+        return data
+
+class _Draft:
+    """A question being read, one line at a time"""
+
+    def __init__(self, line: int, source: str, separator: str):
+        self.line = line
+        self.source = source
+        self.separator = separator
+        self.fields = {}
+        self.options = None
+        self.current = None
+        self.broken = False
+
+    def error(self, message: str, line: int) -> ParseError:
+        self.broken = True
+        return ParseError(message, line, self.source)
+
+    def add(self, line: str, number: int):
+        if not line:
+            return
+        header = HEADER.match(line)
+        if header:
+            name, rest = header.groups()
+            if name in self.fields or (name == 'Options' and self.options is not None):
+                raise self.error(f"{name}: appears twice", number)
+            self.current = name
+            if name == 'Options':
+                self.options = []
+                if rest:
+                    self.add(rest, number)
+            else:
+                self.fields[name] = [rest] if rest else []
+        elif self.current is None:
+            raise self.error(f"text before the first field: {line[:40]}", number)
+        elif self.current == 'Options':
+            option = OPTION.match(line)
+            if option:
+                self.options.append(option.group(1))
+            elif self.options:
+                # An option wrapped over several lines
+                self.options[-1] += self.separator + line
+            else:
+                raise self.error(f"expected a numbered option: {line[:40]}", number)
+        else:
+            self.fields[self.current].append(line)
+
+    def finish(self, number: int) -> Question:
+        values = {name: self.separator.join(lines) for name, lines in self.fields.items()}
+        if 'Situation' in values and ('Introduction' in values or 'Conversation' in values):
+            raise self.error("Situation: can't be used with Introduction: or Conversation:", self.line)
+        required = ['Situation'] if 'Situation' in values else ['Introduction', 'Conversation']
+        for name in required + ['Question']:
+            if not values.get(name):
+                raise self.error(f"{name}: is missing or empty", number)
+        return Question(
+            question=values['Question'],
+            line=self.line,
+            introduction=values.get('Introduction'),
+            conversation=values.get('Conversation'),
+            situation=values.get('Situation'),
+            options=self.options or []
+        )
+
+def parse_questions(
+    lines: Iterable[str],
+    source: str = "<string>",
+    errors: Optional[List[ParseError]] = None,
+    separator: str = ""
+) -> Iterator[Question]:
+    """Yield the <question> blocks of lines as they are read
+
+    Without an errors list the first malformed question raises ParseError.
+    With one, errors are appended to it and the question is skipped.
+    separator joins the lines of a multi-line value.
+    """
+    def fail(error: ParseError):
+        if errors is None:
+            raise error
+        errors.append(error)
+
+    draft = None
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line.startswith('<question>'):
+            if draft is not None and not draft.broken:
+                fail(ParseError("question is not closed before the next <question>", draft.line, source))
+            draft = _Draft(number, source, separator)
+        elif line.startswith('</question>'):
+            if draft is None:
+                fail(ParseError("</question> without <question>", number, source))
+                continue
+            question = None
+            if not draft.broken:
+                try:
+                    question = draft.finish(number)
+                except ParseError as e:
+                    fail(e)
+            draft = None
+            if question:
+                yield question
+        elif draft is not None and not draft.broken:
+            try:
+                draft.add(line, number)
+            except ParseError as e:
+                fail(e)
+        # Anything between questions is ignored
+
+    if draft is not None and not draft.broken:
+        fail(ParseError("question is not closed at the end of the input", draft.line, source))
+
+def parse_questions_file(filename: str, errors: Optional[List[ParseError]] = None) -> Iterator[Question]:
+    """parse_questions over a file, read line by line"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        yield from parse_questions(f, filename, errors)
+
+def parse_question(lines: Iterable[str], source: str = "<string>", separator: str = " ") -> Question:
+    """Parse a single question without the <question> tags, like a model's reply
+
+    Lines before the first field are skipped. Raises ParseError.
+    """
+    draft = None
+    number = 0
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if draft is None:
+            if not HEADER.match(line):
+                continue
+            draft = _Draft(number, source, separator)
+        draft.add(line, number)
+    if draft is None:
+        raise ParseError("no question found", number, source)
+    return draft.finish(number)
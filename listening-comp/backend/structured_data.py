@@ -1,6 +1,7 @@
 from typing import Optional, Dict, List
 import boto3
 import os
+from backend.question_parser import parse_questions
 
 # Model ID
 #MODEL_ID = "amazon.nova-micro-v1:0"
@@ -161,6 +162,13 @@ class TranscriptStructurer:
                 filename = f"{os.path.splitext(base_filename)[0]}_section{section_num}.txt"
                 with open(filename, 'w', encoding='utf-8') as f:
                     f.write(content)
+
+                # Check the model's output, the vector store skips malformed questions
+                errors = []
+                count = sum(1 for _ in parse_questions(content.splitlines(), filename, errors))
+                print(f"Saved {count} questions to {filename}")
+                for error in errors:
+                    print(f"Malformed question: {str(error)}")
             return True
         except Exception as e:
             print(f"Error saving questions: {str(e)}")
@@ -1,73 +1,75 @@
 import chromadb
-from chromadb.utils import embedding_functions
+import hashlib
 import json
 import os
-import boto3
-from typing import Dict, List, Optional
-
-class BedrockEmbeddingFunction(embedding_functions.EmbeddingFunction):
-    def __init__(self, model_id="amazon.titan-embed-text-v1"):
-        """Initialize Bedrock embedding function"""
-        self.bedrock_client = boto3.client('bedrock-runtime', region_name="us-east-1")
-        self.model_id = model_id
-
-    def __call__(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for a list of texts using Bedrock"""
-        embeddings = []
-        for text in texts:
-            try:
-                response = self.bedrock_client.invoke_model(
-                    modelId=self.model_id,
-                    body=json.dumps({
-                        "inputText": text
-                    })
-                )
-                response_body = json.loads(response['body'].read())
-                embedding = response_body['embedding']
-                embeddings.append(embedding)
-            except Exception as e:
-                print(f"Error generating embedding: {str(e)}")
-                # Return a zero vector as fallback
-                embeddings.append([0.0] * 1536)  # Titan model uses 1536 dimensions
-        return embeddings
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
+from backend.embedding_cache import EmbeddingCache
+from backend.embeddings import BedrockEmbeddingFunction, EmbeddingError, create_embedding_function
+from backend.question_parser import ParseError, parse_questions_file
+
+# Question files are named <video id>_section<n>.txt
+QUESTION_FILE = re.compile(r"^(?P<video_id>.+)_section(?P<section>\d+)\.txt$")
+MANIFEST_VERSION = 1
+
+def question_hash(question: Dict) -> str:
+    """sha256 of a parsed question, to tell which ones changed"""
+    return hashlib.sha256(json.dumps(question, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
 
 class QuestionVectorStore:
-    def __init__(self, persist_directory: str = "backend/data/vectorstore"):
-        """Initialize the vector store for JLPT listening questions"""
+    def __init__(
+        self,
+        persist_directory: str = "backend/data/vectorstore",
+        embedding_cache_path: Optional[str] = "backend/data/embedding_cache.db",
+        embedding_cache_size: int = 100000,
+        embedding_backend: Optional[str] = None
+    ):
+        """Initialize the vector store for JLPT listening questions
+
+        embedding_backend is "bedrock" or "local" (see backend/embeddings.py),
+        EMBEDDING_BACKEND by default. Embeddings are cached in
+        embedding_cache_path across runs, pass None to always compute them.
+        """
         self.persist_directory = persist_directory
         
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(path=persist_directory)
         
-        # Use Bedrock's Titan embedding model
-        self.embedding_fn = BedrockEmbeddingFunction()
+        self.embedding_cache = None
+        if embedding_cache_path:
+            self.embedding_cache = EmbeddingCache(embedding_cache_path, max_entries=embedding_cache_size)
+        self.embedding_backend = embedding_backend or os.environ.get("EMBEDDING_BACKEND", "bedrock")
+        self.embedding_fn = create_embedding_function(self.embedding_backend, cache=self.embedding_cache)
+
+        # Vectors of different models can't be compared, every backend but
+        # Bedrock gets collections of its own
+        suffix = "" if self.embedding_backend == "bedrock" else f"_{self.embedding_backend}"
+        # What index_directory has indexed so far
+        self.manifest_path = os.path.join(persist_directory, f"index_manifest{suffix}.json")
         
         # Create or get collections for each section type
         self.collections = {
             "section2": self.client.get_or_create_collection(
-                name="section2_questions",
+                name=f"section2_questions{suffix}",
                 embedding_function=self.embedding_fn,
                 metadata={"description": "JLPT listening comprehension questions - Section 2"}
             ),
             "section3": self.client.get_or_create_collection(
-                name="section3_questions",
+                name=f"section3_questions{suffix}",
                 embedding_function=self.embedding_fn,
                 metadata={"description": "JLPT phrase matching questions - Section 3"}
             )
         }
 
-    def add_questions(self, section_num: int, questions: List[Dict], video_id: str):
-        """Add questions to the vector store"""
-        if section_num not in [2, 3]:
-            raise ValueError("Only sections 2 and 3 are currently supported")
-            
-        collection = self.collections[f"section{section_num}"]
-        
+    def _question_records(self, section_num: int, questions: List[Dict], video_id: str, indexes: List[int]):
+        """Ids, documents and metadatas for questions at the given positions of their file"""
         ids = []
         documents = []
         metadatas = []
         
-        for idx, question in enumerate(questions):
+        for idx, question in zip(indexes, questions):
             # Create a unique ID for each question
             question_id = f"{video_id}_{section_num}_{idx}"
             ids.append(question_id)
@@ -93,9 +95,24 @@ class QuestionVectorStore:
                 Question: {question['Question']}
                 """
             documents.append(document)
+        return ids, documents, metadatas
+
+    def add_questions(self, section_num: int, questions: List[Dict], video_id: str, start: int = 0):
+        """Add questions to the vector store, replacing any with the same ids
+
+        start is the file position of the first question, for files added
+        in batches.
+        """
+        if section_num not in [2, 3]:
+            raise ValueError("Only sections 2 and 3 are currently supported")
+            
+        collection = self.collections[f"section{section_num}"]
+        ids, documents, metadatas = self._question_records(
+            section_num, questions, video_id, list(range(start, start + len(questions)))
+        )
         
-        # Add to collection
-        collection.add(
+        # Upsert so that indexing a file again doesn't fail on existing ids
+        collection.upsert(
             ids=ids,
             documents=documents,
             metadatas=metadatas
@@ -143,82 +160,187 @@ class QuestionVectorStore:
             return json.loads(result['metadatas'][0]['full_structure'])
         return None
 
+    def _read_questions(self, filename: str, section_num: int, errors: List[ParseError]) -> Iterator[Dict]:
+        """Stream the questions of a file, malformed ones are added to errors"""
+        for question in parse_questions_file(filename, errors):
+            if question.section != section_num:
+                errors.append(ParseError(
+                    f"section {question.section} question in a section {section_num} file", question.line, filename
+                ))
+                continue
+            yield question.to_dict()
+
     def parse_questions_from_file(self, filename: str) -> List[Dict]:
         """Parse questions from a structured text file"""
-        questions = []
-        current_question = {}
-        
+        errors = []
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                
-            i = 0
-            while i < len(lines):
-                line = lines[i].strip()
-                
-                if line.startswith('<question>'):
-                    current_question = {}
-                elif line.startswith('Introduction:'):
-                    i += 1
-                    if i < len(lines):
-                        current_question['Introduction'] = lines[i].strip()
-                elif line.startswith('Conversation:'):
-                    i += 1
-                    if i < len(lines):
-                        current_question['Conversation'] = lines[i].strip()
-                elif line.startswith('Situation:'):
-                    i += 1
-                    if i < len(lines):
-                        current_question['Situation'] = lines[i].strip()
-                elif line.startswith('Question:'):
-                    i += 1
-                    if i < len(lines):
-                        current_question['Question'] = lines[i].strip()
-                elif line.startswith('Options:'):
-                    options = []
-                    for _ in range(4):
-                        i += 1
-                        if i < len(lines):
-                            option = lines[i].strip()
-                            if option.startswith('1.') or option.startswith('2.') or option.startswith('3.') or option.startswith('4.'):
-                                options.append(option[2:].strip())
-                    current_question['Options'] = options
-                elif line.startswith('</question>'):
-                    if current_question:
-                        questions.append(current_question)
-                        current_question = {}
-                i += 1
-            return questions
-        except Exception as e:
+            questions = [question.to_dict() for question in parse_questions_file(filename, errors)]
+        except OSError as e:
             print(f"Error parsing questions from {filename}: {str(e)}")
             return []
+        for error in errors:
+            print(f"Skipped question: {str(error)}")
+        return questions
 
-    def index_questions_file(self, filename: str, section_num: int):
-        """Index all questions from a file into the vector store"""
+    def index_questions_file(self, filename: str, section_num: int, batch_size: int = 64):
+        """Index all questions from a file into the vector store, batch_size at a time"""
         # Extract video ID from filename
         video_id = os.path.basename(filename).split('_section')[0]
         
-        # Parse questions from file
-        questions = self.parse_questions_from_file(filename)
-        
-        # Add to vector store
-        if questions:
-            self.add_questions(section_num, questions, video_id)
-            print(f"Indexed {len(questions)} questions from {filename}")
+        # Parse questions from file as they are upserted
+        errors = []
+        questions = self._read_questions(filename, section_num, errors)
+        count = 0
+        while True:
+            batch = list(islice(questions, batch_size))
+            if not batch:
+                break
+            self.add_questions(section_num, batch, video_id, start=count)
+            count += len(batch)
+
+        for error in errors:
+            print(f"Skipped question: {str(error)}")
+        if count:
+            print(f"Indexed {count} questions from {filename}")
+
+    def _load_manifest(self) -> Dict:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {}
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return manifest["files"]
+
+    def _save_manifest(self, files: Dict):
+        # Written aside and renamed, an interrupted run leaves the old manifest
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": MANIFEST_VERSION, "files": files}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _prepare_file(self, filename: str, section_num: int, video_id: str, old_hashes: List[str]) -> Dict:
+        """Parse a changed file and embed the questions that differ from old_hashes"""
+        errors = []
+        questions = list(self._read_questions(filename, section_num, errors))
+        for error in errors:
+            print(f"Skipped question: {str(error)}")
+        if errors and not questions:
+            # Keep what is indexed rather than wipe it over parse errors
+            raise ValueError(f"no questions could be parsed, {len(errors)} errors")
+
+        hashes = [question_hash(question) for question in questions]
+        changed = [idx for idx, digest in enumerate(hashes) if idx >= len(old_hashes) or old_hashes[idx] != digest]
+        ids, documents, metadatas = self._question_records(
+            section_num, [questions[idx] for idx in changed], video_id, changed
+        )
+        return {
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas,
+            # Embedded here, in the worker, so that only the writes are serial
+            "embeddings": self.embedding_fn(documents) if documents else [],
+            "stale_ids": [f"{video_id}_{section_num}_{idx}" for idx in range(len(hashes), len(old_hashes))],
+            "hashes": hashes
+        }
+
+    def index_directory(self, directory: str = "backend/data/questions", max_workers: int = 4, force: bool = False) -> Dict[str, int]:
+        """Bring the index in line with the question files in a directory
+
+        Files are compared by sha256 with the manifest of the last run, only
+        questions of changed files whose content changed are embedded and
+        upserted, and questions of removed files are deleted. Changed files
+        are parsed and embedded in parallel, up to max_workers at a time,
+        or one at a time when the embedding function already makes that
+        many concurrent calls (Bedrock's max_workers), which keeps the calls
+        within its client's connection pool. force re-embeds everything.
+        """
+        manifest = self._load_manifest()
+        summary = {"files": 0, "unchanged": 0, "indexed": 0, "removed": 0, "failed": 0, "upserted": 0, "deleted": 0}
+
+        found = {}
+        for name in sorted(os.listdir(directory)):
+            match = QUESTION_FILE.match(name)
+            if not match or int(match['section']) not in [2, 3]:
+                continue
+            filename = os.path.join(directory, name)
+            with open(filename, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            found[name] = (filename, int(match['section']), match['video_id'], digest)
+        summary["files"] = len(found)
+
+        # Files gone since the last run
+        for name in [name for name in manifest if name not in found]:
+            entry = manifest[name]
+            ids = [f"{entry['video_id']}_{entry['section']}_{idx}" for idx in range(len(entry['questions']))]
+            if ids:
+                self.collections[f"section{entry['section']}"].delete(ids=ids)
+            del manifest[name]
+            self._save_manifest(manifest)
+            summary["removed"] += 1
+            summary["deleted"] += len(ids)
+            print(f"Removed {len(ids)} questions of {name}")
+
+        changed = {
+            name: info for name, info in found.items()
+            if force or manifest.get(name, {}).get("sha256") != info[3]
+        }
+        summary["unchanged"] = len(found) - len(changed)
+
+        # Every file already fans out over the embedding function's workers,
+        # which share a client pool of that size
+        file_workers = max(1, max_workers // getattr(self.embedding_fn, "max_workers", 1))
+        with ThreadPoolExecutor(max_workers=file_workers) as executor:
+            futures = {}
+            for name, (filename, section_num, video_id, _) in changed.items():
+                old_hashes = manifest.get(name, {}).get("questions", [])
+                if force:
+                    # Every question counts as changed, the old count still tells what is stale
+                    old_hashes = [None] * len(old_hashes)
+                futures[executor.submit(self._prepare_file, filename, section_num, video_id, old_hashes)] = name
+
+            for future in as_completed(futures):
+                name = futures[future]
+                filename, section_num, video_id, digest = changed[name]
+                try:
+                    prepared = future.result()
+                    collection = self.collections[f"section{section_num}"]
+                    if prepared["ids"]:
+                        collection.upsert(
+                            ids=prepared["ids"],
+                            documents=prepared["documents"],
+                            metadatas=prepared["metadatas"],
+                            embeddings=prepared["embeddings"]
+                        )
+                    if prepared["stale_ids"]:
+                        collection.delete(ids=prepared["stale_ids"])
+                except Exception as e:
+                    print(f"Error indexing {filename}: {str(e)}")
+                    summary["failed"] += 1
+                    continue
+
+                manifest[name] = {
+                    "sha256": digest,
+                    "video_id": video_id,
+                    "section": section_num,
+                    "questions": prepared["hashes"]
+                }
+                self._save_manifest(manifest)
+                summary["indexed"] += 1
+                summary["upserted"] += len(prepared["ids"])
+                summary["deleted"] += len(prepared["stale_ids"])
+                print(f"Indexed {filename}: {len(prepared['ids'])} questions upserted, {len(prepared['stale_ids'])} removed")
+
+        return summary
 
 if __name__ == "__main__":
     # Example usage
     store = QuestionVectorStore()
     
-    # Index questions from files
-    question_files = [
-        ("backend/data/questions/sY7L5cfCWno_section2.txt", 2),
-        ("backend/data/questions/sY7L5cfCWno_section3.txt", 3)
-    ]
-    
-    for filename, section_num in question_files:
-        if os.path.exists(filename):
-            store.index_questions_file(filename, section_num)
+    # Index new and changed question files
+    print(store.index_directory("backend/data/questions"))
     
     # Search for similar questions
     similar = store.search_similar_questions(2, "誕生日について質問", n_results=1)
+    print(f"Embedding cache: {store.embedding_cache.stats()}")
@@ -8,6 +8,8 @@ import os
 import dotenv
 import yaml
 
+from review_submitter import ReviewSubmitter
+
 dotenv.load_dotenv()
 
 def load_prompts():
@@ -34,34 +36,19 @@ class JapaneseWritingApp:
         # Get session_id from URL like we get group_id
         self.study_session_id = os.getenv('SESSION_ID', '1')
         logger.debug(f"Using session_id: {self.study_session_id}")
+        # Results are sent in the background so grading doesn't wait on the backend
+        self.submitter = ReviewSubmitter(user_id=os.getenv('USER_ID'))
         self.load_vocabulary()
 
     def submit_result(self, is_correct):
-        """Submit the grading result to the backend"""
-        try:
-            logger.debug(f"Attempting to submit result. Session ID: {self.study_session_id}, Word: {self.current_word}")
-            
-            if not self.study_session_id or not self.current_word:
-                logger.error("Missing study session ID or current word")
-                return
-
-            url = f"http://localhost:5000/study_sessions/{self.study_session_id}/review"
-            data = {
-                'word_id': self.current_word.get('id'),
-                'correct': is_correct
-            }
-            
-            logger.debug(f"Submitting to URL: {url} with data: {data}")
-            
-            response = requests.post(url, json=data)
-            logger.debug(f"Response status: {response.status_code}, content: {response.text}")
-            
-            if response.status_code == 200:
-                logger.info(f"Successfully submitted result for word {self.current_word.get('id')}")
-            else:
-                logger.error(f"Failed to submit result. Status code: {response.status_code}")
-        except Exception as e:
-            logger.error(f"Error submitting result: {str(e)}")
+        """Queue the grading result for the backend"""
+        logger.debug(f"Queueing result. Session ID: {self.study_session_id}, Word: {self.current_word}")
+
+        if not self.study_session_id or not self.current_word:
+            logger.error("Missing study session ID or current word")
+            return
+
+        self.submitter.submit(self.study_session_id, self.current_word.get('id'), is_correct)
 
     def load_vocabulary(self):
         """Fetch vocabulary from API using group_id"""
@@ -0,0 +1,136 @@
+import atexit
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+
+import requests
+
+logger = logging.getLogger('japanese_app')
+
+class ReviewSubmitter:
+    """Queues grading results and posts them to the backend in batches
+
+    submit() only appends to an in-memory queue, a background thread sends
+    the queue to POST /study_sessions/<id>/reviews every flush_interval
+    seconds (sooner once batch_size results are waiting). Every result gets
+    an idempotency key when it is queued, so a batch that timed out can be
+    sent again without the backend counting it twice.
+    """
+
+    def __init__(self, base_url='http://localhost:5000', user_id=None, batch_size=20,
+                 flush_interval=2.0, max_retries=5, backoff=0.5, max_backoff=30.0,
+                 timeout=5.0, max_queued=10000):
+        self.base_url = base_url.rstrip('/')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.max_queued = max_queued
+        self.http = requests.Session()
+        if user_id:
+            self.http.headers['X-User-Id'] = str(user_id)
+
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='review-submitter', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, session_id, word_id, correct):
+        """Queue one result, returns right away"""
+        review = {
+            'word_id': word_id,
+            'correct': bool(correct),
+            # When it was graded, not when it reaches the backend
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'idempotency_key': str(uuid.uuid4())
+        }
+        with self._lock:
+            if len(self._queue) >= self.max_queued:
+                dropped_session, dropped = self._queue.popleft()
+                logger.error(f"Review queue full, dropping result for word {dropped['word_id']} in session {dropped_session}")
+            self._queue.append((str(session_id), review))
+            if len(self._queue) >= self.batch_size:
+                self._wakeup.set()
+
+    def pending(self):
+        """Number of results not sent yet"""
+        with self._lock:
+            return len(self._queue)
+
+    def close(self, timeout=10.0):
+        """Send what is left (waiting up to timeout seconds) and stop"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+        if self.pending():
+            logger.error(f"{self.pending()} review results could not be submitted")
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._send_pending()
+            # One last round after close(), whatever its outcome
+            if self._closed:
+                return
+
+    def _send_pending(self):
+        """Send the queue batch by batch, False when the backend could not be reached"""
+        while True:
+            with self._lock:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            if not batch:
+                return True
+
+            # One request per session, results keep their order
+            sessions = {}
+            for session_id, review in batch:
+                sessions.setdefault(session_id, []).append(review)
+            failed = []
+            for session_id, reviews in sessions.items():
+                if not self._post(session_id, reviews):
+                    failed.extend((session_id, review) for review in reviews)
+
+            if failed:
+                # Back to the front of the queue, for the next round
+                with self._lock:
+                    self._queue.extendleft(reversed(failed))
+                return False
+
+    def _post(self, session_id, reviews):
+        """True once the backend has the reviews (or rejected them for good)"""
+        url = f"{self.base_url}/study_sessions/{session_id}/reviews"
+        for attempt in range(self.max_retries):
+            try:
+                response = self.http.post(url, json=reviews, timeout=self.timeout)
+            except requests.RequestException as e:
+                logger.warning(f"Error submitting {len(reviews)} reviews (attempt {attempt + 1}): {str(e)}")
+            else:
+                if response.status_code == 200:
+                    body = response.json()
+                    for result in body.get('results', []):
+                        if result.get('status') == 'error':
+                            logger.error(f"Review of word {result.get('word_id')} rejected: {result.get('error')}")
+                    logger.info(f"Submitted {body.get('logged')} reviews to session {session_id}, "
+                                f"{body.get('duplicates', 0)} already logged")
+                    return True
+                # Client errors other than these won't go away by retrying
+                if response.status_code < 500 and response.status_code not in (408, 409, 429):
+                    logger.error(f"Dropping {len(reviews)} reviews for session {session_id}. "
+                                 f"Status code: {response.status_code}, content: {response.text}")
+                    return True
+                logger.warning(f"Failed to submit {len(reviews)} reviews (attempt {attempt + 1}). "
+                               f"Status code: {response.status_code}")
+            if attempt + 1 < self.max_retries:
+                time.sleep(min(self.max_backoff, self.backoff * 2 ** attempt))
+        return False